@@ -9,15 +9,14 @@ import sys
 import torch
 import json
 import math
-import csv
 from copy import deepcopy
 from time import time, sleep
 from args import get_argparser, parse_args, get_aligner, get_bbox, get_provenance
 from os.path import join
 from cloudmanager import CloudManager
 from itertools import compress
-from tasks import run
-from boundingbox import BoundingBox
+from tasks import run, batch_tasks
+from block_plan import BlockPlan, IncrementalPlan
 
 def print_run(diff, n_tasks):
   if n_tasks > 0:
@@ -68,6 +67,18 @@ if __name__ == '__main__':
     type=int, default=2048)
   parser.add_argument('--block_size', type=int, default=10)
   parser.add_argument('--restart', type=int, default=0)
+  parser.add_argument('--prev_param_lookup', type=str, default='',
+    help='param lookup CSV of a previous run; only realign & restitch the '
+         'sections affected by the differences to --param_lookup')
+  parser.add_argument('--field_encoding', type=str, default='int16',
+    choices=['int16', 'fpzip', 'kempressed'],
+    help='storage of vector fields: int16 quarter pixels, or float32 chunks '
+         'compressed with fpzip or kempressed')
+  parser.add_argument('--field_max_error', type=float, default=0.125,
+    help='max MIP0 pixel error when quantizing fpzip or kempressed fields')
+  parser.add_argument('--field_pyramid_mip', type=int, default=None,
+    help='also write the vector voted & broadcasting fields at every MIP up to '
+         'this one, for low resolution consumers')
   args = parse_args(parser)
   # Only compute matches to previous sections
   args.serial_operation = True
@@ -113,134 +124,54 @@ if __name__ == '__main__':
     block_dsts[i] = block_dst.path 
   
   # Compile bbox, model, vvote_offsets for each z index, along with indices to skip
-  bbox_lookup = {}
-  model_lookup = {}
-  tgt_radius_lookup = {}
-  vvote_lookup = {}
-  skip_list = [] 
-  with open(args.param_lookup) as f:
-    reader = csv.reader(f, delimiter=',')
-    for k, r in enumerate(reader):
-       if k != 0:
-         x_start = int(r[0])
-         y_start = int(r[1])
-         z_start = int(r[2])
-         x_stop  = int(r[3])
-         y_stop  = int(r[4])
-         z_stop  = int(r[5])
-         bbox_mip = int(r[6])
-         model_path = join('..', 'models', r[7])
-         tgt_radius = int(r[8])
-         skip = bool(int(r[9]))
-         bbox = BoundingBox(x_start, x_stop, y_start, y_stop, bbox_mip, max_mip)
-         # print('{},{}'.format(z_start, z_stop))
-         for z in range(z_start, z_stop):
-           if skip:
-             skip_list.append(z)
-           bbox_lookup[z] = bbox 
-           model_lookup[z] = model_path
-           tgt_radius_lookup[z] = tgt_radius
-           vvote_lookup[z] = [-i for i in range(1, tgt_radius+1)]
-
-  # Filter out skipped sections from vvote_offsets
-  min_offset = 0
-  for z, tgt_radius in vvote_lookup.items():
-    offset = 0
-    for i, r in enumerate(tgt_radius):
-      while r + offset + z in skip_list:
-        offset -= 1
-      tgt_radius[i] = r + offset
-    min_offset = min(min_offset, r + offset)
-    offset = 0 
-    vvote_lookup[z] = tgt_radius
-
-  # Adjust block starts so they don't start on a skipped section
-  initial_block_starts = list(range(args.z_start, args.z_stop, block_size))
-  if initial_block_starts[-1] != args.z_stop:
-    initial_block_starts.append(args.z_stop)
-  block_starts = []
-  for bs, be in zip(initial_block_starts[:-1], initial_block_starts[1:]):
-    while bs in skip_list:
-      bs += 1
-      assert(bs < be)
-    block_starts.append(bs)
-  block_stops = block_starts[1:]
-  if block_starts[-1] != args.z_stop:
-    block_stops.append(args.z_stop)
-  # print('initial_block_starts {}'.format(list(initial_block_starts)))
-  # print('block_starts {}'.format(block_starts))
-  # print('block_stops {}'.format(block_stops))
-  # Assign even/odd to each block start so results are stored in appropriate CloudVolume
-  # Create lookup dicts based on offset in the canonical block
-  # BLOCK ALIGNMENT
-  # Copy sections with block offsets of 0 
-  # Align without vector voting sections with block offsets < 0 (starter sections)
-  # Align with vector voting sections with block offsets > 0 (block sections)
-  # This lookup makes it easy for restarting based on block offset, though isn't 
-  #  strictly necessary for the copy & starter sections
-  # BLOCK STITCHING
-  # Stitch blocks using the aligned block sections that have tgt_z in the starter sections
-  block_dst_lookup = {}
-  block_start_lookup = {}
-  starter_dst_lookup = {}
-  copy_offset_to_z_range = {0: deepcopy(block_starts)}
-  overlap_copy_range = set()
-  starter_offset_to_z_range = {i: set() for i in range(min_offset, 0)}
-  block_offset_to_z_range = {i: set() for i in range(1, block_size+10)} #TODO: Set the padding based on max(be-bs)
-  # Reverse lookup to easily identify tgt_z for each starter z
-  starter_z_to_offset = {} 
-  for k, (bs, be) in enumerate(zip(block_starts, block_stops)):
-    even_odd = k % 2
-    for i, z in enumerate(range(bs, be+1)):
-      if i > 0:
-        block_start_lookup[z] = bs
-        block_dst_lookup[z] = block_dsts[even_odd]
-        if z not in skip_list:
-          block_offset_to_z_range[i].add(z)
-          for tgt_offset in vvote_lookup[z]:
-            tgt_z = z + tgt_offset
-            if tgt_z <= bs:
-              starter_dst_lookup[tgt_z] = block_dsts[even_odd]
-              # ignore first block for stitching operations
-              if k > 0:
-                overlap_copy_range.add(tgt_z)
-            if tgt_z < bs:
-              starter_z_to_offset[tgt_z] = bs - tgt_z
-              starter_offset_to_z_range[tgt_z - bs].add(tgt_z)
-  offset_range = [i for i in range(min_offset, abs(min_offset)+1)]
+  plan = BlockPlan(args.param_lookup, args.z_start, args.z_stop, block_size, max_mip)
+  bbox_lookup = plan.bbox_lookup
+  model_lookup = plan.model_lookup
+  tgt_radius_lookup = plan.tgt_radius_lookup
+  vvote_lookup = plan.vvote_lookup
+  skip_list = plan.skip_list
+  block_starts = plan.block_starts
+  block_stops = plan.block_stops
+  block_start_lookup = plan.block_start_lookup
+  block_dst_lookup = {z: block_dsts[p] for z, p in plan.block_parity_lookup.items()}
+  starter_dst_lookup = {z: block_dsts[p] for z, p in plan.starter_parity_lookup.items()}
+  starter_z_to_offset = plan.starter_z_to_offset
+  offset_range = plan.offset_range
+  block_start_to_stitch_offsets = plan.block_start_to_stitch_offsets
   # check for restart
   print('Align starting from OFFSET {}'.format(args.restart))
   starter_restart = -100 
   if args.restart <= 0:
     starter_restart = args.restart 
-  copy_offset_to_z_range = {k:v for k,v in copy_offset_to_z_range.items() 
+  copy_offset_to_z_range = {k:v for k,v in plan.copy_offset_to_z_range.items() 
                                               if k == args.restart}
-  starter_offset_to_z_range = {k:v for k,v in starter_offset_to_z_range.items() 
+  starter_offset_to_z_range = {k:v for k,v in plan.starter_offset_to_z_range.items() 
                                               if k <= starter_restart}
-  block_offset_to_z_range = {k:v for k,v in block_offset_to_z_range.items() 
+  block_offset_to_z_range = {k:v for k,v in plan.block_offset_to_z_range.items() 
                                               if k >= args.restart}
-  # print('copy_offset_to_z_range {}'.format(copy_offset_to_z_range))
-  # print('starter_offset_to_z_range {}'.format(starter_offset_to_z_range))
-  # print('block_offset_to_z_range {}'.format(block_offset_to_z_range))
-  # print('offset_range {}'.format(offset_range))
+  stitch_offset_to_z_range = deepcopy(plan.stitch_offset_to_z_range)
   copy_range = [z for z_range in copy_offset_to_z_range.values() for z in z_range]
   starter_range = [z for z_range in starter_offset_to_z_range.values() for z in z_range]
-  overlap_copy_range = list(overlap_copy_range)
-  # print('overlap_copy_range {}'.format(overlap_copy_range))
-
-  # Determine the number of sections needed to stitch (no stitching for block 0)
-  stitch_offset_to_z_range = {i: [] for i in range(1, block_size+1)}
-  block_start_to_stitch_offsets = {i: [] for i in block_starts[1:]}
-  for bs, be in zip(block_starts[1:], block_stops[1:]):
-    max_offset = 0
-    for i, z in enumerate(range(bs, be+1)):
-      if i > 0 and z not in skip_list:
-        max_offset = max(max_offset, tgt_radius_lookup[z])
-        if len(block_start_to_stitch_offsets[bs]) < max_offset:
-          stitch_offset_to_z_range[i].append(z)
-          block_start_to_stitch_offsets[bs].append(bs - z)
-        else:
-          break 
+  overlap_copy_range = list(plan.overlap_copy_range)
+  broadcast_range = block_starts[1:]
+
+  # Only schedule the tasks affected by changes since the previous param lookup
+  if args.prev_param_lookup:
+    prev_plan = BlockPlan(args.prev_param_lookup, args.z_start, args.z_stop, 
+                          block_size, max_mip)
+    inc = IncrementalPlan(prev_plan, plan)
+    print('Changed sections {}'.format(sorted(inc.changed)))
+    print('Realigning blocks {}, restitching blocks {}'.format(
+                 sorted(inc.full_blocks), sorted(inc.stitch_blocks)))
+    copy_range = inc.copy_range(copy_range)
+    starter_range = inc.starter_range(starter_range)
+    block_offset_to_z_range = {k: inc.block_range(v) 
+                                  for k,v in block_offset_to_z_range.items()}
+    overlap_copy_range = inc.overlap_copy_range(overlap_copy_range)
+    stitch_offset_to_z_range = {k: inc.stitch_range(v) 
+                                  for k,v in stitch_offset_to_z_range.items()}
+    broadcast_range = inc.broadcast_range(broadcast_range)
+
   stitch_range = [z for z_range in stitch_offset_to_z_range.values() for z in z_range]
   for b,v in block_start_to_stitch_offsets.items():
     print(b)
@@ -248,24 +179,32 @@ if __name__ == '__main__':
 
   # Create field CloudVolumes
   print('Creating field & overlap CloudVolumes')
+  field_kwargs = {'data_type': 'int16'}
+  if args.field_encoding != 'int16':
+    field_kwargs = {'data_type': 'float32', 'encoding': args.field_encoding,
+                    'max_error': args.field_max_error}
+  # coarser levels for the fields that are read outside of this pipeline
+  output_field_kwargs = deepcopy(field_kwargs)
+  if args.field_pyramid_mip:
+    output_field_kwargs['field_pyramid'] = (mip, args.field_pyramid_mip)
   block_pair_fields = {}
   for z_offset in offset_range:
     block_pair_fields[z_offset] = cm.create(join(args.dst_path, 'field', 'block', 
                                                  str(z_offset)), 
-                                      data_type='int16', num_channels=2,
+                                      num_channels=2, **field_kwargs,
                                       fill_missing=True, overwrite=True).path
   block_vvote_field = cm.create(join(args.dst_path, 'field', 'vvote'),
-                          data_type='int16', num_channels=2,
+                          num_channels=2, **output_field_kwargs,
                           fill_missing=True, overwrite=True).path
   stitch_pair_fields = {}
   for z_offset in offset_range:
     stitch_pair_fields[z_offset] = cm.create(join(args.dst_path, 'field', 
                                                   'stitch', str(z_offset)), 
-                                      data_type='int16', num_channels=2,
+                                      num_channels=2, **field_kwargs,
                                       fill_missing=True, overwrite=True).path
   overlap_vvote_field = cm.create(join(args.dst_path, 'field', 'stitch',
                                     'vvote', 'field'), 
-                                 data_type='int16', num_channels=2,
+                                 num_channels=2, **field_kwargs,
                                  fill_missing=True, overwrite=True).path
   overlap_image = cm.create(join(args.dst_path, 'field', 'stitch',
                                     'vvote', 'image'), 
@@ -275,17 +214,17 @@ if __name__ == '__main__':
   for z_offset in offset_range:
     stitch_fields[z_offset] = cm.create(join(args.dst_path, 'field', 
                                              'stitch', 'vvote', str(z_offset)), 
-                                      data_type='int16', num_channels=2,
+                                      num_channels=2, **field_kwargs,
                                       fill_missing=True, overwrite=True).path
   broadcasting_field = cm.create(join(args.dst_path, 'field', 
                                       'stitch', 'broadcasting'),
-                                 data_type='int16', num_channels=2,
+                                 num_channels=2, **output_field_kwargs,
                                  fill_missing=True, overwrite=True).path
 
   # Task scheduling functions
   def remote_upload(tasks):
       with GreenTaskQueue(queue_name=args.queue_name) as tq:
-          tq.insert_all(tasks)  
+          tq.insert_all(batch_tasks(tasks, a.chunks_per_task))
 
   def execute(task_iterator, z_range):
     if len(z_range) > 0:
@@ -538,5 +477,5 @@ if __name__ == '__main__':
   print('COPY OVERLAP ALIGNED FIELDS FOR VECTOR VOTING')
   execute(StitchBroadcastCopy, stitch_range)
   print('VECTOR VOTE STITCHING FIELDS')
-  execute(StitchBroadcastVectorVote, block_starts[1:])
+  execute(StitchBroadcastVectorVote, broadcast_range)
 
@@ -5,45 +5,40 @@ import json
 import math
 import os
 from os.path import join
+import threading
 from time import time, sleep
 
-from pathos.multiprocessing import ProcessPool, ThreadPool
-from threading import Lock
-
 from cloudvolume import Storage
 from cloudvolume.lib import Vec
 import numpy as np
-import scipy
-import scipy.ndimage
-from skimage import img_as_ubyte
-from skimage.filters import gabor
-from skimage.morphology import rectangle, dilation, closing, opening
 from taskqueue import TaskQueue, LocalTaskQueue
 import torch
-from torch.nn.functional import interpolate, max_pool2d, conv2d
+from torch.nn.functional import interpolate, max_pool2d, avg_pool2d, conv2d
 import torch.nn as nn
 
-from normalizer import Normalizer
-from scipy.special import binom
-from temporal_regularization import create_field_bump
-from training.loss import lap
 from utilities.helpers import save_chunk, crop, upsample, grid_sample, \
                               np_downsample, invert, compose_fields, upsample_field, \
                               is_identity, cpc, vector_vote, get_affine_field, is_blank, \
                               identity_grid
 from boundingbox import BoundingBox, deserialize_bbox
+from mask_cache import MaskCache
+from progress import unfinished_chunks, chunk_key
+from mipless_cloudvolume import VOLUME_OPTIONS
+from chunk_cache import SharedChunkCache
+from quantize import quantize_field
+from cache import LRUCache
+from block_plan import lookup_models
+from tiling import tiled_field
 
-from pathos.multiprocessing import ProcessPool, ThreadPool
-from threading import Lock
 from pathlib import Path
 from utilities.archive import ModelArchive
 
-import torch.nn as nn
 #from taskqueue import TaskQueue
 import tasks
 import tenacity
-import boto3
-from fcorr import get_fft_power2, get_hp_fcorr
+
+# scipy, boto3 & the modules of rarely run methods are imported where they're
+# used, to keep the startup of workers that never run them fast
 
 retry = tenacity.retry(
   reraise=True, 
@@ -51,6 +46,16 @@ retry = tenacity.retry(
   wait=tenacity.wait_full_jitter(0.5, 60.0),
 )
 
+def model_bytes(archive):
+  """Bytes of the parameters & buffers of a model & its preprocessor
+  """
+  total = 0
+  for module in [archive.model, archive.preprocessor]:
+    if isinstance(module, nn.Module):
+      for t in list(module.parameters()) + list(module.buffers()):
+        total += t.numel() * t.element_size()
+  return total
+
 class Aligner:
   def __init__(self, threads=1, queue_name=None, task_batch_size=1, 
                device='cuda', dry_run=False, **kwargs):
@@ -65,19 +70,121 @@ class Aligner:
       self.task_queue = TaskQueue(queue_name=queue_name, n_threads=0)
     
     # self.chunk_size = (1024, 1024)
-    self.chunk_size = (4096, 4096)
+    max_chunk_size = kwargs.get('max_chunk_size', 4096)
+    self.chunk_size = (max_chunk_size, max_chunk_size)
     self.device = torch.device(device)
 
-    self.model_archives = {}
+    # loaded models, bounded by their parameter memory
+    model_cache_mb = kwargs.get('model_cache_mb', 0)
+    self.model_lock = threading.Lock()
+    self.model_archives = LRUCache(model_cache_mb * 2**20 if model_cache_mb 
+                                   else float('inf'), sizeof=model_bytes)
     
     # self.pool = None #ThreadPool(threads)
     self.threads = threads
     self.task_batch_size = task_batch_size
     self.dry_run = dry_run
+    # only schedule chunks without a progress marker
+    self.resume = kwargs.get('resume', False)
+    # chunks sent per queue message as a ChunkBatchTask
+    self.chunks_per_task = kwargs.get('chunks_per_task', 1)
+    # write progress markers for finished chunks
+    self.record_progress = kwargs.get('record_progress', False) or self.resume
+    # MIP0 px error allowed when serving a field from a coarser pyramid level
+    self.field_tolerance = kwargs.get('field_tolerance', 0)
+    # serve raw file:// volumes from memory-mapped chunk files
+    if kwargs.get('local_mmap', False):
+      VOLUME_OPTIONS['local_mmap'] = True
+    # encoded chunks shared by the worker processes of this node
+    shm_cache_mb = kwargs.get('shm_cache_mb', 0)
+    if shm_cache_mb:
+      VOLUME_OPTIONS['chunk_cache'] = SharedChunkCache(
+                  kwargs.get('shm_cache_path', '/dev/shm/seamless_chunks'),
+                  shm_cache_mb * 2**20)
     self.eps = 1e-6
 
     self.gpu_lock = kwargs.get('gpu_lock', None)  # multiprocessing.Semaphore
 
+    # coarse mask tiles, reused across chunks & src/tgt roles within a worker
+    mask_cache_mb = kwargs.get('mask_cache_mb', 0)
+    self.mask_cache = None
+    if mask_cache_mb:
+      self.mask_cache = MaskCache(mask_cache_mb * 2**20)
+
+    # CPU inference: intra-op threads per process & channels_last layouts
+    self.channels_last = kwargs.get('channels_last', False)
+    intra_op_threads = kwargs.get('intra_op_threads', 0)
+    if not intra_op_threads and self.device.type == 'cpu':
+      processes = kwargs.get('processes', 1) or 1
+      intra_op_threads = max(1, (os.cpu_count() or 1) // processes)
+    if intra_op_threads:
+      torch.set_num_threads(intra_op_threads)
+
+    # reduced precision inference, validated per model against float32
+    from precision import PrecisionGuard, load_samples
+    self.precision_guard = PrecisionGuard(kwargs.get('precision', 'float32'),
+                                          self.device,
+                                          kwargs.get('precision_max_error', 0.5),
+                                          load_samples(
+                                            kwargs.get('precision_samples', None)))
+
+    # pinned host buffers that get_data reuses to upload data to the GPU
+    self.stager = None
+    if self.device.type == 'cuda':
+      from staging import PinnedStager
+      self.stager = PinnedStager(self.device)
+
+    # threads for fetch_many & get_composite_image
+    self.fetch_threads = kwargs.get('fetch_threads', 8)
+    self.fetch_pool = None
+    self.fetch_lock = Lock()
+
+    # run the model on overlapping tiles of patches larger than inference_tile
+    self.inference_tile = kwargs.get('inference_tile', 0)
+    self.inference_overlap = kwargs.get('inference_overlap', 256)
+    if self.inference_tile and self.inference_overlap >= self.inference_tile:
+      raise ValueError('inference_overlap must be less than inference_tile')
+
+    # per-chunk padding from the displacement of the previous field
+    self.adaptive_pad = kwargs.get('adaptive_pad', False)
+    self.receptive_field = kwargs.get('receptive_field', 256)
+    self.min_pad = kwargs.get('min_pad', 256)
+    self.pad_multiple = kwargs.get('pad_multiple', 128)
+
+    # single compute thread for the model calls of concurrent tasks
+    self.compute = None
+    if kwargs.get('pipeline_threads', 0):
+      from pipeline import ComputeThread
+      self.compute = ComputeThread(kwargs.get('pipeline_depth', 2))
+
+    # per-chunk sums of append_image, kept across tasks & written once per chunk
+    write_buffer_mb = kwargs.get('write_buffer_mb', 0)
+    self.write_buffer = None
+    if write_buffer_mb:
+      from write_buffer import WriteBuffer
+      self.write_buffer = WriteBuffer(write_buffer_mb * 2**20, mode='sum')
+
+    # fingerprints of finished tasks, to skip them across reruns
+    result_cache_path = kwargs.get('result_cache_path', None)
+    self.result_cache = None
+    if result_cache_path:
+      from result_cache import ResultCache
+      self.result_cache = ResultCache(result_cache_path)
+
+    # int16 buffers that save_field quantizes into, per field shape & thread
+    self.field_buffers = threading.local()
+
+    # load & warm up the models of a param lookup before tasks arrive
+    preload_models = []
+    if kwargs.get('preload_param_lookup', None):
+      preload_models = lookup_models(kwargs['preload_param_lookup'])
+    for model_path in kwargs.get('pin_models', None) or []:
+      self.model_archives.pin(model_path)
+      if model_path not in preload_models:
+        preload_models.append(model_path)
+    for model_path in preload_models:
+      self.warm_up_model(model_path, kwargs.get('warmup_size', 512))
+
   ##########################
   # Chunking & BoundingBox #
   ##########################
@@ -135,7 +242,8 @@ class Aligner:
   def get_model_archive(self, model_path):
     """Load a model stored in the repo with its relative path
 
-    TODO: evict old models from self.models
+    Models are kept in an LRU cache bounded by --model_cache_mb of parameters,
+    except for those pinned with --pin_models.
 
     Args:
        model_path: str for relative path to model directory
@@ -143,16 +251,53 @@ class Aligner:
     Returns:
        the ModelArchive at that model_path
     """
-    if model_path in self.model_archives:
-      print('Loading model {0} from cache'.format(model_path), flush=True)
-      return self.model_archives[model_path]
-    else:
-      print('Adding model {0} to the cache'.format(model_path), flush=True)
-      path = Path(model_path)
-      model_name = path.stem
-      archive = ModelArchive(model_name)
-      self.model_archives[model_path] = archive
-      return archive
+    # tasks of a pipelined worker may load the same model at once
+    with self.model_lock:
+      archive = self.model_archives.get(model_path)
+      if archive is not None:
+        print('Loading model {0} from cache'.format(model_path), flush=True)
+        return archive
+      else:
+        print('Adding model {0} to the cache'.format(model_path), flush=True)
+        from export_model import load_exported
+        from shared_models import shared_archive
+        archive = shared_archive(model_path, self.device)
+        if archive is not None:
+          print('Using model {0} shared by the parent process'.format(model_path),
+                flush=True)
+        if archive is None:
+          archive = load_exported(model_path, self.device)
+          if archive is not None:
+            print('Using TorchScript export of {0}'.format(model_path), flush=True)
+        if archive is None:
+          path = Path(model_path)
+          model_name = path.stem
+          archive = ModelArchive(model_name, device=self.device,
+                                 channels_last=self.channels_last)
+        evictions = self.model_archives.evictions
+        self.model_archives.put(model_path, archive)
+        if self.model_archives.evictions > evictions:
+          print('Evicted {} models from the cache'.format(
+                self.model_archives.evictions - evictions), flush=True)
+          if self.device.type == 'cuda':
+            torch.cuda.empty_cache()
+        return archive
+
+  def warm_up_model(self, model_path, size=512):
+    """Load a model & run it once, so that its first task skips the setup
+    """
+    start = time()
+    archive = self.get_model_archive(model_path)
+    image = torch.zeros((1, 1, size, size), device=self.device)
+    try:
+      with torch.no_grad():
+        if archive.preprocessor is not None:
+          image = archive.preprocessor(image).reshape(image.shape)
+        archive.model(image, image)
+    except Exception as e:
+      print('Could not warm up {}: {}'.format(model_path, e), flush=True)
+    print('warm_up_model {}: {:.3f} s'.format(model_path, time() - start), 
+          flush=True)
 
   #######################
   # Image IO + handlers #
@@ -160,8 +305,10 @@ class Aligner:
 
   def get_mask(self, cv, z, bbox, src_mip, dst_mip, valid_val, to_tensor=True):
     start = time()
+    cache = self.mask_cache if src_mip > dst_mip else None
     data = self.get_data(cv, z, bbox, src_mip=src_mip, dst_mip=dst_mip, 
-                             to_float=False, to_tensor=to_tensor, normalizer=None)
+                             to_float=False, to_tensor=to_tensor, normalizer=None,
+                             cache=cache)
     mask = data == valid_val
     end = time()
     diff = end - start
@@ -202,6 +349,30 @@ class Aligner:
     print('get_masked_image: {:.3f}'.format(diff), flush=True) 
     return image
 
+  def get_fetch_pool(self):
+    with self.fetch_lock:
+      if self.fetch_pool is None:
+        self.fetch_pool = concurrent.futures.ThreadPoolExecutor(
+                                  max_workers=self.fetch_threads)
+    return self.fetch_pool
+
+  def fetch_many(self, fn, requests, **kwargs):
+    """Call fn for each request concurrently, e.g. get_field or get_data
+
+    Args:
+       fn: callable that loads a volume region
+       requests: list of argument tuples for fn, e.g. (cv, z, bbox, mip)
+       kwargs: keyword arguments shared by every call
+
+    Returns:
+       list of the results of fn, in the order of requests
+    """
+    if len(requests) <= 1 or self.fetch_threads <= 1:
+      return [fn(*args, **kwargs) for args in requests]
+    pool = self.get_fetch_pool()
+    futures = [pool.submit(fn, *args, **kwargs) for args in requests]
+    return [f.result() for f in futures]
+
   def get_composite_image(self, image_cv, z_list, bbox, image_mip,
                                 mask_cv, mask_mip, mask_val,
                                 to_tensor=True, normalizer=None):
@@ -226,20 +397,30 @@ class Aligner:
     # Retrieve image stack
     assert len(z_list) > 0
 
-    combined = self.get_masked_image(image_cv, z_list[0], bbox, image_mip,
-                                     mask_cv, mask_mip, mask_val,
-                                     to_tensor=to_tensor, normalizer=normalizer)
-    for z in z_list[1:]:
-      tmp = self.get_masked_image(image_cv, z, bbox, image_mip,
-                                  mask_cv, mask_mip, mask_val,
-                                  to_tensor=to_tensor, normalizer=normalizer)
+    def get_image(z):
+      return self.get_masked_image(image_cv, z, bbox, image_mip,
+                                   mask_cv, mask_mip, mask_val,
+                                   to_tensor=to_tensor, normalizer=normalizer)
+    combined = get_image(z_list[0])
+    if len(z_list) == 1 or not (combined == 0).any():
+      return combined
+    # fetch each fallback image while the previous one is merged, so that no
+    # more than one image is read in vain once no black pixels remain
+    pool = self.get_fetch_pool()
+    future = pool.submit(get_image, z_list[1])
+    for z in list(z_list[2:]) + [None]:
+      tmp = future.result()
+      if z is not None:
+        future = pool.submit(get_image, z)
       black_mask = combined == 0
       combined[black_mask] = tmp[black_mask]
+      if not (combined == 0).any():
+        break
 
     return combined
 
   def get_data(self, cv, z, bbox, src_mip, dst_mip, to_float=True, 
-                     to_tensor=True, normalizer=None):
+                     to_tensor=True, normalizer=None, cache=None):
     """Retrieve CloudVolume data. Returns 4D ndarray or tensor, BxCxWxH
     
     Args:
@@ -250,6 +431,7 @@ class Aligner:
        to_float: output should be float32
        to_tensor: output will be torch.tensor
        normalizer: callable function to adjust the contrast of the image
+       cache: MaskCache to serve the cutout from, or None to read cv directly
 
     Returns:
        image from CloudVolume in region bbox at dst_mip, with contrast adjusted,
@@ -258,14 +440,31 @@ class Aligner:
     """
     x_range = bbox.x_range(mip=src_mip)
     y_range = bbox.y_range(mip=src_mip)
-    data = cv[src_mip][x_range[0]:x_range[1], y_range[0]:y_range[1], z]
-    data = np.transpose(data, (2,3,0,1))
-    if to_float:
-      data = np.divide(data, float(255.0), dtype=np.float32)
+    if cache is not None:
+      data = cache.get(cv, z, x_range, y_range, src_mip)
+    else:
+      data = cv[src_mip][x_range[0]:x_range[1], y_range[0]:y_range[1], z]
+    if to_tensor | (src_mip != dst_mip):
+      # move the data in its stored dtype, then transpose & scale on the device
+      if self.stager is not None:
+        data = self.stager.upload(data)
+      else:
+        # from_numpy wraps the cutout in its own layout, without a copy
+        if not data.flags.writeable:
+          data = data.copy()
+        data = torch.from_numpy(data)
+      data = data.permute(2,3,0,1)
+      if to_float:
+        data = data.float().div_(255.0)
+    else:
+      data = np.transpose(data, (2,3,0,1))
+      if to_float:
+        data = np.divide(data, float(255.0), dtype=np.float32)
     if (normalizer is not None) and (not is_blank(data)):
       print('Normalizing image')
       start = time()
-      data = torch.from_numpy(data)
+      if isinstance(data, np.ndarray):
+        data = torch.from_numpy(data)
       data = data.to(device=self.device)
       data = normalizer(data).reshape(data.shape)
       end = time()
@@ -333,7 +532,16 @@ class Aligner:
     
     return data
 
+  def invalidate_cached(self, cv, z_range):
+    """Drop the cached mask tiles of cv that a write to sections z_range
+    makes stale
+    """
+    if self.mask_cache is not None:
+      for z in range(*z_range):
+        self.mask_cache.invalidate(cv.path, z)
+
   def save_image(self, float_patch, cv, z, bbox, mip, to_uint8=True):
+    self.invalidate_cached(cv, (z, z+1))
     x_range = bbox.x_range(mip=mip)
     y_range = bbox.y_range(mip=mip)
     patch = np.transpose(float_patch, (2,3,0,1))
@@ -343,6 +551,7 @@ class Aligner:
     cv[mip][x_range[0]:x_range[1], y_range[0]:y_range[1], z] = patch
 
   def save_image_batch(self, cv, z_range, float_patch, bbox, mip, to_uint8=True):
+    self.invalidate_cached(cv, z_range)
     x_range = bbox.x_range(mip=mip)
     y_range = bbox.y_range(mip=mip)
     print("type of float_patch", type(float_patch), "shape", float_patch.shape)
@@ -354,16 +563,30 @@ class Aligner:
     cv[mip][x_range[0]:x_range[1], y_range[0]:y_range[1],
             z_range[0]:z_range[1]] = patch
 
-  def append_image(self, float_patch, cv, z, bbox, mip, to_uint8=True):
+  def append_image(self, float_patch, cv, z, bbox, mip, to_uint8=True,
+                   expected=None):
+    """Add float_patch to the image stored in cv
+
+    With a write buffer, the sum is written once per chunk, when the chunk
+    has received `expected` patches or when flush_writes is called, & bbox
+    need not be chunk aligned.
+    """
+    self.invalidate_cached(cv, (z, z+1))
     x_range = bbox.x_range(mip=mip)
     y_range = bbox.y_range(mip=mip)
     patch = np.transpose(float_patch, (2,3,0,1))
     #print("----------------z is", z, "save image patch at mip", mip, "range", x_range, y_range, "range at mip0", bbox.x_range(mip=0), bbox.y_range(mip=0))
     if to_uint8:
       patch = (np.multiply(patch, 255)).astype(np.uint8)
+    if self.write_buffer is not None:
+      self.write_buffer.add(cv, z, x_range, y_range, mip, patch,
+                            expected=expected)
+      return
     cv[mip][x_range[0]:x_range[1], y_range[0]:y_range[1], z] = cv[mip][x_range[0]:x_range[1], y_range[0]:y_range[1], z] + patch
 
-  def append_image_batch(self, cv, z_range, float_patch, bbox, mip, to_uint8=True):
+  def append_image_batch(self, cv, z_range, float_patch, bbox, mip, to_uint8=True,
+                         expected=None):
+    self.invalidate_cached(cv, z_range)
     x_range = bbox.x_range(mip=mip)
     y_range = bbox.y_range(mip=mip)
     print("type of float_patch", type(float_patch), "shape", float_patch.shape)
@@ -372,11 +595,87 @@ class Aligner:
     if to_uint8:
         patch = (np.multiply(patch, 255)).astype(np.uint8)
     print("patch shape", patch.shape)
+    if self.write_buffer is not None:
+      for i, z in enumerate(range(z_range[0], z_range[1])):
+        self.write_buffer.add(cv, z, x_range, y_range, mip, patch[:,:,i:i+1,:],
+                              expected=expected)
+      return
     cv[mip][x_range[0]:x_range[1], y_range[0]:y_range[1], z_range[0]:z_range[1]] = cv[mip][x_range[0]:x_range[1], y_range[0]:y_range[1], z_range[0]:z_range[1]] + patch
+
+  def flush_writes(self):
+    """Write the chunks held by the write buffer; workers call this before
+    they delete the tasks that appended to them
+    """
+    if self.write_buffer is not None:
+      self.write_buffer.flush()
+
+  def can_copy_chunks(self, src_cv, dst_cv, bbox, mip, is_field=False):
+    """Whether the chunk files of src_cv in bbox can be copied to dst_cv as is
+
+    Both scales must be unsharded & share encoding, data type, channels,
+    chunk size, offset and size, with single section chunks & bbox covering
+    whole chunks. Fields must also share quantization & dst_cv must not have a
+    field pyramid, which save_field would write.
+    """
+    src, dst = src_cv[mip], dst_cv[mip]
+    for k in ['encoding', 'chunk_sizes', 'voxel_offset', 'size']:
+      if src.scale.get(k) != dst.scale.get(k):
+        return False
+    if 'sharding' in src.scale or 'sharding' in dst.scale:
+      return False
+    if src.dtype != dst.dtype or src.num_channels != dst.num_channels:
+      return False
+    if dst.chunk_size[2] != 1:
+      return False
+    if is_field:
+      if 'field_pyramid' in dst.info:
+        return False
+      if src.info.get('field_quantization') != dst.info.get('field_quantization'):
+        return False
+    return self.is_chunk_aligned(dst_cv, bbox, mip)
+
+  def copy_chunks(self, src_cv, dst_cv, src_z, dst_z, bbox, mip):
+    """Copy the encoded chunk files of bbox in section src_z to section dst_z
+
+    Chunks missing from src_cv are deleted from dst_cv, so that both read
+    as the same zero-filled data. Use can_copy_chunks to check compatibility.
+
+    Returns:
+       int for the no. of chunk files copied
+    """
+    self.invalidate_cached(dst_cv, (dst_z, dst_z+1))
+    x_range = bbox.x_range(mip=mip)
+    y_range = bbox.y_range(mip=mip)
+    src_names = src_cv.chunk_names(mip, x_range, y_range, (src_z, src_z+1))
+    dst_names = dst_cv.chunk_names(mip, x_range, y_range, (dst_z, dst_z+1))
+    dst_name = dict(zip(src_names, dst_names))
+    encoding = dst_cv[mip].encoding
+    compress = 'gzip' if encoding in ('raw', 'compressed_segmentation') else None
+    content_type = 'application/octet-stream'
+    if encoding == 'jpeg':
+      content_type = 'image/jpeg'
+    elif encoding in ('compressed_segmentation', 'fpzip', 'kempressed'):
+      content_type = 'image/x.' + encoding
+    with Storage(src_cv.path) as stor:
+      results = stor.get_files(src_names)
+    files, missing = [], []
+    for r in results:
+      if r['error'] is not None:
+        raise r['error']
+      if r['content'] is None:
+        missing.append(dst_name[r['filename']])
+      else:
+        files.append((dst_name[r['filename']], r['content']))
+    with Storage(dst_cv.path) as stor:
+      stor.put_files(files, content_type=content_type, compress=compress)
+      if len(missing) > 0:
+        stor.delete_files(missing)
+    return len(files)
   #######################
   # Field IO + handlers #
   #######################
-  def get_field(self, cv, z, bbox, mip, relative=False, to_tensor=True, as_int16=True):
+  def get_field(self, cv, z, bbox, mip, relative=False, to_tensor=True, as_int16=True,
+                tolerance=None):
     """Retrieve vector field from CloudVolume.
 
     Args
@@ -387,6 +686,8 @@ class Aligner:
       RELATIVE: bool indicating whether to convert MIP0 residuals to relative residuals
         from [-1,1] based on residual location within shape of the BBOX
       TO_TENSOR: bool indicating whether to return FIELD as a torch tensor
+      TOLERANCE: float for the MIP0 px error allowed when reading a coarser level
+        of the field pyramid & upsampling it; None uses self.field_tolerance
 
     Returns
       FIELD: vector field with dimensions of BBOX at MIP, with RELATIVE residuals &
@@ -395,13 +696,29 @@ class Aligner:
     Note that the grid convention for torch.grid_sample is (N,H,W,2), where the
     components in the final dimension are (x,y). We are NOT altering it here.
     """
+    if tolerance is None:
+      tolerance = self.field_tolerance
+    level = mip
+    if tolerance > 0:
+      level = self.get_field_pyramid_level(cv, z, bbox, mip, tolerance)
+    if level > mip:
+      field = self.get_field(cv, z, bbox, level, relative=False, to_tensor=True,
+                             as_int16=as_int16, tolerance=0)
+      field = upsample_field(field, level, mip)
+      if relative:
+        field = self.abs_to_rel_residual(field, bbox, mip)
+      if not to_tensor:
+        field = field.cpu().numpy()
+      return field
+
     x_range = bbox.x_range(mip=mip)
     y_range = bbox.y_range(mip=mip)
     print('get_field from {bbox}, z={z}, MIP{mip} to {path}'.format(bbox=bbox,
                                  z=z, mip=mip, path=cv.path))
     field = cv[mip][x_range[0]:x_range[1], y_range[0]:y_range[1], z]
     field = np.transpose(field, (2,0,1,3))
-    if as_int16:
+    # float32 fields (e.g. fpzip encoded) are stored as MIP0 residuals already
+    if as_int16 and field.dtype == np.int16:
       field = np.float32(field) / 4
     if relative:
       field = self.abs_to_rel_residual(field, bbox, mip)
@@ -411,36 +728,144 @@ class Aligner:
     else:
       return field 
 
-  def save_field(self, field, cv, z, bbox, mip, relative, as_int16=True):
+  def save_field(self, field, cv, z, bbox, mip, relative, as_int16=True, pyramid=True):
     """Save vector field to CloudVolume.
 
     Args
-      field: ndarray vector field with dimensions of bbox at mip with absolute MIP0 
-        residuals, using grid_sample convention of (Z,Y,X,2), where the components in 
-        the final dimension are (x,y).
+      field: ndarray or tensor vector field with dimensions of bbox at mip with 
+        absolute MIP0 residuals, using grid_sample convention of (Z,Y,X,2), where 
+        the components in the final dimension are (x,y). A GPU tensor is 
+        quantized before it is copied to the host.
       cv: MiplessCloudVolume to store vector field as MIP0 residuals in X,Y,Z,2 order
       z: int for section index
       bbox: BoundingBox for X & Y extent of the field to be stored
       mip: int for resolution at which to store the vector field
       relative: bool indicating whether to convert MIP0 residuals to relative residuals
         from [-1,1] based on residual location within shape of the bbox 
-      as_int16: bool indicating whether vectors should be saved as int16
+      as_int16: bool indicating whether vectors should be saved as int16; ignored
+        for volumes with a float data type, which are rounded to the volume's 
+        field_quantization step instead, if it has one
+      pyramid: bool indicating whether to also write the coarser levels of the
+        field pyramid, if the volume has one & mip is its base_mip
     """
+    self.invalidate_cached(cv, (z, z+1))
     if relative: 
       field = field * (field.shape[-2] / 2) * (2**mip)
-    # field = field.data.cpu().numpy() 
+    abs_field = field
     x_range = bbox.x_range(mip=mip)
     y_range = bbox.y_range(mip=mip)
-    field = np.transpose(field, (1,2,0,3))
     print('save_field for {0} at MIP{1} to {2}'.format(bbox.stringify(z),
                                                        mip, cv.path))
-    if as_int16:
-      if(np.max(field) > 8192 or np.min(field) < -8191):
-        print('Value in field is out of range of int16 max: {}, min: {}'.format(
-                                               np.max(field),np.min(field)), flush=True)
-      field = np.int16(field * 4)
+    step = cv[mip].info.get('field_quantization', None)
+    if cv[mip].dtype == np.int16 and as_int16:
+      field, clipped = quantize_field(field, out=self.field_buffer(field.shape))
+      if clipped > 0:
+        print('{} vectors in field are out of range of int16'.format(clipped), 
+              flush=True)
+    else:
+      if torch.is_tensor(field):
+        field = field.data.cpu().numpy()
+      field = np.transpose(field, (1,2,0,3))
+      if cv[mip].dtype != np.int16 and step:
+        field = (np.round(field / step) * step).astype(cv[mip].dtype)
     #print("**********field shape is ", field.shape, type(field[0,0,0,0]))
     cv[mip][x_range[0]:x_range[1], y_range[0]:y_range[1], z] = field
+    if pyramid:
+      self.save_field_pyramid(abs_field, cv, z, bbox, mip, as_int16=as_int16)
+
+  def field_buffer(self, shape):
+    """Reusable int16 buffer in storage order for a (Z,Y,X,2) field
+    """
+    if not hasattr(self.field_buffers, 'buffers'):
+      self.field_buffers.buffers = {}
+    buffers = self.field_buffers.buffers
+    z, y, x, c = shape
+    if (y, x, z, c) not in buffers:
+      buffers[y, x, z, c] = np.empty((y, x, z, c), dtype=np.int16, order='F')
+    return buffers[y, x, z, c]
+
+  def is_chunk_aligned(self, cv, bbox, mip):
+    """Whether bbox covers whole chunks of cv at mip, so it can be written alone
+    """
+    if bbox.m0_x_size % 2**mip != 0 or bbox.m0_y_size % 2**mip != 0:
+      return False
+    ranges = [bbox.x_range(mip=mip), bbox.y_range(mip=mip)]
+    for (s, e), c, o, h in zip(ranges, cv[mip].chunk_size, cv[mip].voxel_offset,
+                               cv[mip].bounds.maxpt):
+      if (s - o) % c != 0 or ((e - o) % c != 0 and e < h):
+        return False
+    return True
+
+  def save_field_pyramid(self, field, cv, z, bbox, mip, as_int16=True):
+    """Write the coarser levels of a field pyramid, with their errors
+
+    The field pyramid of a volume is configured in its info file as
+    field_pyramid: {base_mip, max_mip}. Each level is the 2x2 average of the
+    level below, written while the bbox is chunk aligned. The max MIP0 px 
+    error of upsampling each level back to base_mip is stored as JSON at
+    field_error/<base_mip>_<z>/<chunk>, for get_field_pyramid_level.
+
+    Args:
+      field: ndarray vector field at mip with absolute MIP0 residuals
+      cv: MiplessCloudVolume where the field was written at mip
+    """
+    pyramid = cv[mip].info.get('field_pyramid', None)
+    if pyramid is None or pyramid['base_mip'] != mip:
+      return
+    top = min(pyramid['max_mip'], bbox.max_mip)
+    if torch.is_tensor(field):
+      base = field.float()
+    else:
+      base = torch.from_numpy(np.float32(field))
+    coarse = base
+    errors = {}
+    for level in range(mip+1, top+1):
+      if not self.is_chunk_aligned(cv, bbox, level):
+        print('Field pyramid of {} stops at MIP{}'.format(bbox.stringify(z), 
+                                                          level-1), flush=True)
+        break
+      coarse = avg_pool2d(coarse.permute(0,3,1,2), 2).permute(0,2,3,1)
+      error = torch.max(torch.abs(upsample_field(coarse, level, mip) - base))
+      errors[level] = float(error)
+      self.save_field(coarse, cv, z, bbox, level, relative=False,
+                      as_int16=as_int16, pyramid=False)
+    if len(errors) > 0:
+      with Storage(cv.path) as stor:
+        stor.put_file(join('field_error', '{}_{}'.format(mip, z), 
+                           chunk_key(bbox, mip)), 
+                      json.dumps(errors), content_type='application/json')
+
+  def get_field_pyramid_level(self, cv, z, bbox, mip, tolerance):
+    """Find the coarsest level of a field pyramid that serves bbox within tolerance
+
+    Returns:
+      int for the MIP level to read; mip itself if the volume has no pyramid, 
+      or if any chunk under bbox has no recorded errors
+    """
+    pyramid = cv[mip].info.get('field_pyramid', None)
+    if pyramid is None or mip < pyramid['base_mip']:
+      return mip
+    base_mip = pyramid['base_mip']
+    cx, cy = cv[base_mip].chunk_size[:2]
+    ox, oy = cv[base_mip].voxel_offset[:2]
+    xs, xe = bbox.x_range(mip=base_mip)
+    ys, ye = bbox.y_range(mip=base_mip)
+    keys = []
+    for x in range(ox + ((xs - ox) // cx) * cx, xe, cx):
+      for y in range(oy + ((ys - oy) // cy) * cy, ye, cy):
+        keys.append('{}-{}_{}-{}'.format(x, x+cx, y, y+cy))
+    prefix = join('field_error', '{}_{}'.format(base_mip, z))
+    with Storage(cv.path) as stor:
+      files = stor.get_files([join(prefix, k) for k in keys])
+    if any(f['content'] is None for f in files):
+      return mip
+    errors = [json.loads(f['content'].decode('utf-8')) for f in files]
+    level = mip
+    for l in range(mip+1, min(pyramid['max_mip'], bbox.max_mip)+1):
+      if all(float(e.get(str(l), float('inf'))) <= tolerance for e in errors):
+        level = l
+    print('Serving field at MIP{} from MIP{}'.format(mip, level), flush=True)
+    return level
 
   def rel_to_abs_residual(self, field, mip):    
     """Convert vector field from relative space [-1,1] to absolute MIP0 space
@@ -466,6 +891,66 @@ class Aligner:
     avg_y = self.avg_field(field[0,...,1])
     return torch.Tensor([avg_x, avg_y])
 
+  def prev_field_profile(self, bbox, mip, pad, prev_field_cv=None,
+                         prev_field_z=None, prev_field_inverse=False):
+    """Profile the previous field over bbox padded by pad, the most padding
+    a task may use, for plan_pad & prev_field_adjustment
+
+    Both use this one read, so the planned pad & the shift of the src chunk
+    come from the same profile.
+
+    Returns:
+       dict with the MIP0 displacement (torch.Tensor) rounded to the grid of
+       mip, & the residual displacement at mip that remains after it (the
+       99th percentile over nonzero vectors, computed with --adaptive_pad),
+       or None without a previous field
+    """
+    if prev_field_cv is None:
+      return None
+    padded_bbox = deepcopy(bbox)
+    padded_bbox.max_mip = mip
+    padded_bbox.uncrop(pad, mip=mip)
+    field = self.get_field(prev_field_cv, prev_field_z, padded_bbox, mip,
+                           relative=False, to_tensor=True)
+    if prev_field_inverse:
+      field = -field
+    distance = self.profile_field(field)
+    print('Displacement adjustment: {} px'.format(distance))
+    distance = (distance // (2 ** mip)) * 2 ** mip
+    residual = None
+    if self.adaptive_pad:
+      field = field[0].reshape(-1, 2)
+      field = field[(field != 0).any(dim=1)]
+      residual = 0.
+      if field.shape[0] > 0:
+        residual = torch.norm(field - distance.to(device=field.device), dim=1)
+        residual = float(np.percentile(residual.cpu().numpy(), 99)) / 2 ** mip
+    return {'distance': distance, 'residual': residual}
+
+  def plan_pad(self, pad, profile=None):
+    """Padding that covers the displacement left after prev_field_adjustment
+
+    The residual displacement of the profile plus the model's receptive field
+    is rounded up to a multiple of --pad_multiple. Without --adaptive_pad or
+    a previous field, pad is returned unchanged.
+
+    Args:
+       pad: int for the most padding at mip
+       profile: dict from prev_field_profile for the same pad, or None
+
+    Returns:
+       int for the padding at mip, between --min_pad & pad
+    """
+    if not self.adaptive_pad or profile is None:
+      return pad
+    residual = profile['residual']
+    m = self.pad_multiple
+    planned = int(math.ceil((residual + self.receptive_field) / m)) * m
+    planned = min(pad, max(self.min_pad, planned))
+    print('Residual displacement {:.1f} px; pad {} instead of {}'.format(
+          residual, planned, pad), flush=True)
+    return planned
+
   #############################
   # CloudVolume chunk methods #
   #############################
@@ -474,7 +959,7 @@ class Aligner:
                           src_mask_cv=None, src_mask_mip=0, src_mask_val=0,
                           tgt_mask_cv=None, tgt_mask_mip=0, tgt_mask_val=0,
                           tgt_alt_z=None, prev_field_cv=None, prev_field_z=None,
-                          prev_field_inverse=False):
+                          prev_field_inverse=False, prev_field_profile=None):
     """Run inference with SEAMLeSS model on two images stored as CloudVolume regions.
 
     Args:
@@ -490,6 +975,8 @@ class Aligner:
       prev_field_cv: if specified, a MiplessCloudVolume containing the
                      previously predicted field to be profile and displace
                      the src chunk
+      prev_field_profile: dict from prev_field_profile for the same arguments,
+                     or None to read it here
 
     Returns:
       field with MIP0 residuals with the shape of bbox at MIP mip (np.ndarray)
@@ -499,23 +986,18 @@ class Aligner:
     normalizer = archive.preprocessor
     print('compute_field for {0} to {1}'.format(bbox.stringify(src_z),
                                                 bbox.stringify(tgt_z)))
+    if prev_field_profile is None:
+      prev_field_profile = self.prev_field_profile(bbox, mip, pad, prev_field_cv,
+                                                   prev_field_z,
+                                                   prev_field_inverse)
+    pad = self.plan_pad(pad, prev_field_profile)
     print('pad: {}'.format(pad))
     padded_bbox = deepcopy(bbox)
     padded_bbox.max_mip = mip
     padded_bbox.uncrop(pad, mip=mip)
 
-    if prev_field_cv is not None:
-        field = self.get_field(prev_field_cv, prev_field_z, padded_bbox, mip,
-                           relative=False, to_tensor=True)
-        if prev_field_inverse:
-          field = -field
-        distance = self.profile_field(field)
-        print('Displacement adjustment: {} px'.format(distance))
-        distance = (distance // (2 ** mip)) * 2 ** mip
-        new_bbox = self.adjust_bbox(padded_bbox, distance.flip(0))
-    else:
-        distance = torch.Tensor([0, 0])
-        new_bbox = padded_bbox
+    distance, new_bbox = self.prev_field_adjustment(padded_bbox,
+                                                    prev_field_profile)
 
     tgt_z = [tgt_z]
     if tgt_alt_z is not None:
@@ -536,32 +1018,108 @@ class Aligner:
     print('src_patch.shape {}'.format(src_patch.shape))
     print('tgt_patch.shape {}'.format(tgt_patch.shape))
 
-    # Running the model is the only part that will increase memory consumption
-    # significantly - only incrementing the GPU lock here should be sufficient.
-    if self.gpu_lock is not None:
-      self.gpu_lock.acquire()
-      print("Process {} acquired GPU lock".format(os.getpid()))
+    cuda = self.device.type == 'cuda'
+    if self.channels_last:
+      src_patch = src_patch.contiguous(memory_format=torch.channels_last)
+      tgt_patch = tgt_patch.contiguous(memory_format=torch.channels_last)
 
-    try:
-      print("GPU memory allocated: {}, cached: {}".format(torch.cuda.memory_allocated(), torch.cuda.memory_cached()))
-
-      # model produces field in relative coordinates
-      field = model(src_patch, tgt_patch)
-      print("GPU memory allocated: {}, cached: {}".format(torch.cuda.memory_allocated(), torch.cuda.memory_cached()))
-      field = self.rel_to_abs_residual(field, mip)
-      field = field[:,pad:-pad,pad:-pad,:]
-      field += distance.to(device=self.device)
-      field = field.data.cpu().numpy()
-      # clear unused, cached memory so that other processes can allocate it
-      torch.cuda.empty_cache()
-
-      print("GPU memory allocated: {}, cached: {}".format(torch.cuda.memory_allocated(), torch.cuda.memory_cached()))
-    finally:
+    def run_model():
+      # Running the model is the only part that will increase memory consumption
+      # significantly - only incrementing the GPU lock here should be sufficient.
       if self.gpu_lock is not None:
-        print("Process {} releasing GPU lock".format(os.getpid()))
-        self.gpu_lock.release()
+        self.gpu_lock.acquire()
+        print("Process {} acquired GPU lock".format(os.getpid()))
+      try:
+        if cuda:
+          print("GPU memory allocated: {}, cached: {}".format(torch.cuda.memory_allocated(), torch.cuda.memory_cached()))
+
+        # model produces field in relative coordinates
+        # error of a relative field in px at mip
+        def field_error(reference, reduced):
+          return torch.max(torch.abs(reference - reduced)) * reference.shape[-2] / 2
+        field = self.precision_guard.run(model_path, model, src_patch,
+                                         tgt_patch, field_error,
+                                         call=self.run_field_model)
+        if cuda:
+          print("GPU memory allocated: {}, cached: {}".format(torch.cuda.memory_allocated(), torch.cuda.memory_cached()))
+        field = self.rel_to_abs_residual(field, mip)
+        field = field[:,pad:-pad,pad:-pad,:]
+        field += distance.to(device=self.device)
+        field = field.data.cpu().numpy()
+        if cuda:
+          # clear unused, cached memory so that other processes can allocate it
+          torch.cuda.empty_cache()
+
+          print("GPU memory allocated: {}, cached: {}".format(torch.cuda.memory_allocated(), torch.cuda.memory_cached()))
+      finally:
+        if self.gpu_lock is not None:
+          print("Process {} releasing GPU lock".format(os.getpid()))
+          self.gpu_lock.release()
+      return field
+
+    # in a pipelined worker, the model runs on the compute thread while the
+    # other threads download & upload
+    if self.compute is not None:
+      return self.compute.run(run_model)
+    return run_model()
+
+  def run_field_model(self, model, src_patch, tgt_patch):
+    """Field of a model for a pair of patches, in tiles if they exceed
+    --inference_tile
+    """
+    if not self.inference_tile:
+      return model(src_patch, tgt_patch)
+    return tiled_field(model, src_patch, tgt_patch, self.inference_tile,
+                       self.inference_overlap)
+
+  def prev_field_adjustment(self, padded_bbox, profile=None):
+    """Displace the src chunk by the profile of a previously predicted field
 
-    return field
+    Args:
+       padded_bbox: BoundingBox of the padded chunk
+       profile: dict from prev_field_profile, or None
+
+    Returns:
+       tuple of the MIP0 displacement (torch.Tensor) & the displaced BoundingBox
+    """
+    if profile is not None:
+        distance = profile['distance']
+        new_bbox = self.adjust_bbox(padded_bbox, distance.flip(0))
+    else:
+        distance = torch.Tensor([0, 0])
+        new_bbox = padded_bbox
+    return distance, new_bbox
+
+  def compute_field_regions(self, src_cv, tgt_cv, src_z, tgt_z, bbox, mip, pad, 
+                            src_mask_cv=None, src_mask_mip=0,
+                            tgt_mask_cv=None, tgt_mask_mip=0,
+                            prev_field_cv=None, prev_field_z=None,
+                            prev_field_inverse=False, prev_field_profile=None):
+    """List the regions that compute_field_chunk reads for the same arguments
+
+    Returns:
+       list of (MiplessCloudVolume, z, BoundingBox, mip) tuples
+    """
+    max_padded_bbox = deepcopy(bbox)
+    max_padded_bbox.max_mip = mip
+    max_padded_bbox.uncrop(pad, mip=mip)
+    if prev_field_profile is None:
+      prev_field_profile = self.prev_field_profile(bbox, mip, pad, prev_field_cv,
+                                                   prev_field_z,
+                                                   prev_field_inverse)
+    pad = self.plan_pad(pad, prev_field_profile)
+    padded_bbox = deepcopy(bbox)
+    padded_bbox.max_mip = mip
+    padded_bbox.uncrop(pad, mip=mip)
+    _, new_bbox = self.prev_field_adjustment(padded_bbox, prev_field_profile)
+    regions = [(src_cv, src_z, new_bbox, mip), (tgt_cv, tgt_z, padded_bbox, mip)]
+    if src_mask_cv is not None:
+      regions.append((src_mask_cv, src_z, new_bbox, src_mask_mip))
+    if tgt_mask_cv is not None:
+      regions.append((tgt_mask_cv, tgt_z, padded_bbox, tgt_mask_mip))
+    if prev_field_cv is not None:
+      regions.append((prev_field_cv, prev_field_z, max_padded_bbox, mip))
+    return regions
 
   def predict_image(self, cm, model_path, src_cv, dst_cv, z, mip, bbox,
                     chunk_size):
@@ -620,26 +1178,29 @@ class Aligner:
         default None means no blurring
        
     """
-    fields = []
-    for z_offset, f_cv in pairwise_cvs.items():
-      if serial:
-        F = self.get_field(f_cv, z, bbox, mip, relative=False, to_tensor=True)
-      else:
-        G_cv = vvote_cv
+    if serial:
+      fields = self.fetch_many(self.get_field,
+                               [(f_cv, z, bbox, mip) for f_cv in pairwise_cvs.values()],
+                               relative=False, to_tensor=True)
+    else:
+      G_cv = vvote_cv
+      requests = []
+      for z_offset, f_cv in pairwise_cvs.items():
         if inverse:
           f_z = z+z_offset
           G_z = z+z_offset
-          F = self.get_composed_field(f_cv, G_cv, f_z, G_z, bbox, mip, mip, mip)
+          requests.append((f_cv, G_cv, f_z, G_z, bbox, mip, mip, mip))
         else:
           f_z = z
           G_z = z+z_offset
-          F = self.get_composed_field(G_cv, f_cv, G_z, f_z, bbox, mip, mip, mip)
-      fields.append(F)
+          requests.append((G_cv, f_cv, G_z, f_z, bbox, mip, mip, mip))
+      fields = self.fetch_many(self.get_composed_field, requests)
     # assign weight w if the difference between majority vector similarities are d
     if not softmin_temp:
       w = 0.99
       d = 2**mip
       n = len(fields)
+      from scipy.special import binom
       m = int(binom(n, (n+1)//2)) - 1
       softmin_temp = 2**mip
     return vector_vote(fields, softmin_temp=softmin_temp, blur_sigma=blur_sigma)
@@ -1045,6 +1606,8 @@ class Aligner:
     chunks = self.break_into_chunks(bbox, cm.dst_chunk_sizes[mip],
                                     cm.dst_voxel_offsets[mip], mip=mip, 
                                     max_mip=cm.max_mip)
+    if self.resume:
+      chunks = unfinished_chunks('CopyTask', str(dst_cv), dst_z, chunks, mip)
     if return_iterator:
         return CopyTaskIterator(chunks,0, len(chunks))
     #tq = GreenTaskQueue('deepalign_zhen')
@@ -1088,6 +1651,8 @@ class Aligner:
     chunks = self.break_into_chunks(bbox, cm.dst_chunk_sizes[mip],
                                     cm.dst_voxel_offsets[mip], mip=mip, 
                                     max_mip=cm.max_mip)
+    if self.resume:
+      chunks = unfinished_chunks('ComputeFieldTask', str(field_cv), src_z, chunks, mip)
     class ComputeFieldTaskIterator():
         def __init__(self, cl, start, stop):
           self.chunklist = cl
@@ -1148,6 +1713,8 @@ class Aligner:
     chunks = self.break_into_chunks(bbox, cm.dst_chunk_sizes[src_mip],
                                     cm.dst_voxel_offsets[src_mip], mip=src_mip, 
                                     max_mip=cm.max_mip)
+    if self.resume:
+      chunks = unfinished_chunks('RenderTask', str(dst_cv), dst_z, chunks, src_mip)
     class RenderTaskIterator():
         def __init__(self, cl, start, stop):
           self.chunklist = cl
@@ -1199,6 +1766,8 @@ class Aligner:
     start = time()
     chunks = self.break_into_chunks(bbox, cm.vec_chunk_sizes[mip],
                                     cm.vec_voxel_offsets[mip], mip=mip)
+    if self.resume:
+      chunks = unfinished_chunks('VectorVoteTask', str(vvote_cv), z, chunks, mip)
     class VvoteTaskIterator():
         def __init__(self, cl, start, stop):
           self.chunklist = cl
@@ -1256,6 +1825,9 @@ class Aligner:
     chunks = self.break_into_chunks(bbox, cm.vec_chunk_sizes[dst_mip],
                                     cm.vec_voxel_offsets[dst_mip], 
                                     mip=dst_mip)
+    if self.resume:
+      chunks = unfinished_chunks('CloudComposeTask', str(dst_cv), dst_z, chunks,
+                                 dst_mip)
     class CloudComposeIterator():
         def __init__(self, cl, start, stop):
           self.chunklist = cl
@@ -1308,6 +1880,9 @@ class Aligner:
     chunks = self.break_into_chunks(bbox, cm.vec_chunk_sizes[dst_mip],
                                     cm.vec_voxel_offsets[dst_mip], 
                                     mip=dst_mip)
+    if self.resume:
+      chunks = unfinished_chunks('CloudMultiComposeTask', str(dst_cv), dst_z,
+                                 chunks, dst_mip)
     if return_iterator:
         class CloudMultiComposeIterator():
             def __init__(self, cl, start, stop):
@@ -1337,6 +1912,51 @@ class Aligner:
                                                 dst_mip, factors, pad))
         return batch
 
+  def shard(self, cm, src_cv, dst_cv, z_range, bbox, mip, return_iterator=False):
+    """Pack an unsharded volume into the shards of a sharded volume
+
+    This is an offline repack of a finished volume, not a way for the pipeline
+    to write shards: it costs an extra read & write of every chunk, and the
+    no. of objects written during the run is unchanged. It pays off in the
+    objects kept & served afterwards.
+
+    Each task owns whole shards, so no two tasks write to the same file. The
+    shards are morton-aligned blocks of chunks, which may extend beyond bbox & 
+    z_range; their other chunks are packed from src_cv as well.
+
+    Args:
+       cm: CloudManager that corresponds to the src_cv & dst_cv
+       src_cv: MiplessCloudVolume with unsharded data
+       dst_cv: MiplessCloudVolume created with sharding at mip
+       z_range: range of section indices to pack
+       bbox: BoundingBox of region to pack
+       mip: int for MIP level to pack
+    """
+    from shards import shard_numbers
+    x_range = bbox.x_range(mip=mip)
+    y_range = bbox.y_range(mip=mip)
+    shards = shard_numbers(cm[dst_cv][mip], x_range, y_range,
+                           (z_range[0], z_range[-1]+1))
+    class ShardTaskIterator():
+        def __init__(self, sl, start, stop):
+          self.shardlist = sl
+          self.start = start
+          self.stop = stop
+        def __len__(self):
+          return self.stop - self.start
+        def __getitem__(self, slc):
+          itr = deepcopy(self)
+          itr.start = slc.start
+          itr.stop = slc.stop
+          return itr
+        def __iter__(self):
+          for i in range(self.start, self.stop):
+            yield tasks.ShardTask(src_cv, dst_cv, mip, self.shardlist[i])
+    if return_iterator:
+        return ShardTaskIterator(shards, 0, len(shards))
+    else:
+        return [tasks.ShardTask(src_cv, dst_cv, mip, s) for s in shards]
+
   def cpc(self, cm, src_cv, tgt_cv, dst_cv, src_z, tgt_z, bbox, src_mip, dst_mip, 
                 norm=True, return_iterator=False):
     """Chunked Pearson Correlation between two CloudVolume images
@@ -1547,7 +2167,6 @@ class Aligner:
       fields = [torch.from_numpy(i).to(device=self.device) for i in fields]
       #print("device is ", fields[0].device)
       field = vector_vote(fields, softmin_temp=softmin_temp)
-      field = field.data.cpu().numpy()
       self.save_field(field, write_F_cv, z, bbox, mip, relative=False)
 
   def downsample_range(self, cv, z_range, bbox, source_mip, target_mip):
@@ -1802,6 +2421,7 @@ class Aligner:
     invFs = self.get_neighborhood(z, invF_cv, bbox, mip)
     bump_dims = np.asarray(invFs.shape)
     bump_dims[0] = len(self.tgt_range)
+    from temporal_regularization import create_field_bump
     full_bump = create_field_bump(bump_dims, sigma)
     bump_z = 3 
 
@@ -1905,6 +2525,7 @@ class Aligner:
       padded_bbox.max_mip = mip
       padded_bbox.uncrop(pad, mip=mip)
       field = self.get_field(cv, z, padded_bbox, mip, relative=False, to_tensor=True)
+      from training.loss import lap
       return lap([field], device=self.device).unsqueeze(0)
 
   def compute_fcorr(self, cm, src_cv, dst_pre_cv, dst_post_cv, bbox, src_mip, 
@@ -1932,6 +2553,8 @@ class Aligner:
       # scaling = 8 * pow(std1*std2, 1/2)
       scaling = 240 # Fixed threshold
 
+      import scipy.ndimage
+      from fcorr import get_fft_power2, get_hp_fcorr
       new_image1 = self.rechunck_image(chunk_size, src)
       new_image2 = self.rechunck_image(chunk_size, tgt)
       f1, p1 = get_fft_power2(new_image1)
@@ -1957,21 +2580,27 @@ class Aligner:
       return np.ones([x_range[1]-x_range[0], y_range[1]-y_range[0]])
 
   def mask_conjunction_chunk(self, cv_list, z_list, bbox, mip_list, dst_mip):
+      cache = self.mask_cache if mip_list[0] > dst_mip else None
       mask = self.get_data(cv_list[0], z_list[0], bbox, src_mip=mip_list[0], 
-                           dst_mip=dst_mip, to_float=False, to_tensor=False)
+                           dst_mip=dst_mip, to_float=False, to_tensor=False,
+                           cache=cache)
       for cv, z, mip in zip(cv_list[1:], z_list[1:], mip_list[1:]):
+        cache = self.mask_cache if mip > dst_mip else None
         mask = np.logical_and(mask, self.get_data(cv, z, bbox, src_mip=mip, 
                                                   dst_mip=dst_mip, to_float=False, 
-                                                  to_tensor=False))
+                                                  to_tensor=False, cache=cache))
       return mask
 
   def mask_disjunction_chunk(self, cv_list, z_list, bbox, mip_list, dst_mip):
+      cache = self.mask_cache if mip_list[0] > dst_mip else None
       mask = self.get_data(cv_list[0], z_list[0], bbox, src_mip=mip_list[0], 
-                           dst_mip=dst_mip, to_float=False, to_tensor=False)
+                           dst_mip=dst_mip, to_float=False, to_tensor=False,
+                           cache=cache)
       for cv, z, mip in zip(cv_list[1:], z_list[1:], mip_list[1:]):
+        cache = self.mask_cache if mip > dst_mip else None
         mask = np.logical_or(mask, self.get_data(cv, z, bbox, src_mip=mip, 
                                                   dst_mip=dst_mip, to_float=False, 
-                                                  to_tensor=False))
+                                                  to_tensor=False, cache=cache))
       return mask
 
   def filterthree_op_chunk(self, bbox, mask_cv, z, mip):
@@ -2066,6 +2695,7 @@ class Aligner:
     return all(i == 0 for i in responses)
 
   def wait_for_sqs_empty(self):
+    import boto3
     self.sqs = boto3.client('sqs', region_name='us-east-1')
     self.queue_url  = self.sqs.get_queue_url(QueueName=self.queue_name)["QueueUrl"]
     print("\nSQS Wait")
@@ -21,8 +21,92 @@ def get_argparser():
      help='no. of threads to use in scheduling chunks (locally & distributed)')
   parser.add_argument('--task_batch_size', type=int, default=1,
      help='no. of tasks to group together for a single worker')
+  parser.add_argument('--chunks_per_task', type=int, default=1,
+     help='no. of chunks sent in one queue message; chunk tasks that share '
+          'their other arguments are sent as one ChunkBatchTask. Workers '
+          'lease each message for --lease_seconds times this, so set it on '
+          'workers as well')
   parser.add_argument('--lease_seconds', type=int, default=30,
      help='no. of seconds that polling will lease a task before it becomes visible again')
+  parser.add_argument('--mask_cache_mb', type=int, default=0,
+     help='MiB of coarse mask tiles to keep in memory per worker; 0 disables')
+  parser.add_argument('--result_cache_path', type=str, default=None,
+     help='CloudVolume-style path of the manifest used to skip tasks whose '
+          'model, inputs & parameters are unchanged since a previous run')
+  parser.add_argument('--resume', action='store_true',
+     help='only schedule chunks that have no progress marker from a previous run')
+  parser.add_argument('--record_progress', action='store_true',
+     help='write a progress marker for every finished chunk, so that a later '
+          'run can --resume; implied by --resume')
+  parser.add_argument('--field_tolerance', type=float, default=0,
+     help='MIP0 px error allowed when reading a field from a coarser level of '
+          'its pyramid; 0 always reads the requested MIP')
+  parser.add_argument('--local_mmap', action='store_true',
+     help='memory-map the chunks of raw encoded file:// volumes')
+  parser.add_argument('--shm_cache_mb', type=int, default=0,
+     help='MiB of encoded chunks to share between the worker processes of a '
+          'node; 0 disables')
+  parser.add_argument('--shm_cache_path', type=str, 
+     default='/dev/shm/seamless_chunks',
+     help='directory of the shared chunk cache')
+  parser.add_argument('--write_buffer_mb', type=int, default=0,
+     help='MiB of appended image chunks to sum in memory before writing each '
+          'chunk once; sums are kept across tasks until each chunk is complete, '
+          'so raise it to coalesce more; 0 reads & writes on every append')
+  parser.add_argument('--fetch_threads', type=int, default=8,
+     help='no. of threads a task uses to load several volume regions at once')
+  parser.add_argument('--intra_op_threads', type=int, default=0,
+     help='no. of threads PyTorch uses per process; 0 uses the default, or on '
+          'CPU, the no. of cores divided by --processes')
+  parser.add_argument('--channels_last', action='store_true',
+     help='run models on channels_last tensors, which is faster on CPU')
+  parser.add_argument('--precision', type=str, default='float32',
+     choices=['float32', 'bf16', 'fp16', 'int8'],
+     help='precision for field models, once validated per model: bf16 & fp16 '
+          'autocast, int8 dynamically quantizes Conv2d & Linear layers on CPU')
+  parser.add_argument('--precision_max_error', type=float, default=0.5,
+     help='max px error at the model MIP allowed between reduced precision & '
+          'float32 fields; models above it stay in float32')
+  parser.add_argument('--precision_samples', type=str, default=None,
+     help='torch.save\'d list of held-out (src, tgt) image pairs on which to '
+          'compare precisions; required for a reduced --precision')
+  parser.add_argument('--model_cache_mb', type=int, default=0,
+     help='MiB of model parameters to keep loaded per process, evicting the '
+          'least recently used models; 0 keeps every model')
+  parser.add_argument('--pin_models', type=str, nargs='+', default=None,
+     help='model paths to load at startup & never evict')
+  parser.add_argument('--preload_param_lookup', type=str, default=None,
+     help='param lookup CSV whose models are loaded & warmed up at startup')
+  parser.add_argument('--warmup_size', type=int, default=512,
+     help='width & height of the blank images used to warm up models')
+  parser.add_argument('--lease_batch', type=int, default=1,
+     help='no. of queue messages a worker leases, & deletes, at once; up to 10')
+  parser.add_argument('--task_threads', type=int, default=4,
+     help='no. of leased tasks that run at once, for tasks that don\'t use '
+          'the GPU; device tasks run one at a time')
+  parser.add_argument('--adaptive_pad', action='store_true',
+     help='shrink the padding of chunks with a previous field to the '
+          'displacement it leaves plus --receptive_field, up to --pad')
+  parser.add_argument('--receptive_field', type=int, default=256,
+     help='px at the chunk MIP the model needs around each output pixel')
+  parser.add_argument('--min_pad', type=int, default=256,
+     help='smallest padding --adaptive_pad may choose')
+  parser.add_argument('--pad_multiple', type=int, default=128,
+     help='--adaptive_pad rounds up to a multiple of this, so that padded '
+          'chunks still fit the downsampling of the model')
+  parser.add_argument('--inference_tile', type=int, default=0,
+     help='run the model on overlapping tiles of this many px when a padded '
+          'chunk is larger, blending the fields; 0 runs on the whole chunk')
+  parser.add_argument('--inference_overlap', type=int, default=256,
+     help='min px of overlap between inference tiles, blended linearly')
+  parser.add_argument('--max_chunk_size', type=int, default=4096,
+     help='largest chunk width & height; raise it along with --inference_tile '
+          'to amortize padding over larger chunks')
+  parser.add_argument('--pipeline_threads', type=int, default=0,
+     help='no. of tasks a worker process runs at once, overlapping their I/O '
+          'while a single thread runs their models; 0 runs one task at a time')
+  parser.add_argument('--pipeline_depth', type=int, default=2,
+     help='no. of model calls that may wait for the compute thread')
   parser.add_argument('--dry_run', 
      help='prevent task executes, but allow task print outs',
      action='store_true')
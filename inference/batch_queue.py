@@ -0,0 +1,191 @@
+"""Lease, execute & delete queue messages in batches
+
+SQSBatchQueue & LocalQueue share lease(n, seconds), delete(tasks) &
+insert(tasks), so poll_batches runs the same way against SQS or in memory.
+"""
+import json
+import random
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from time import sleep, time
+
+# most messages an SQS request may receive or delete
+SQS_MAX_BATCH = 10
+# times a batch request is repeated for the entries that failed
+SQS_RETRIES = 3
+
+class SQSBatchQueue():
+  """SQS queue of RegisteredTasks, leased & deleted up to 10 at a time
+
+  Messages use the format of taskqueue.TaskQueue, so tasks inserted by either
+  can be leased by the other.
+  """
+  def __init__(self, queue_name, region_name='us-east-1'):
+    import boto3
+    self.queue_name = queue_name
+    self.sqs = boto3.client('sqs', region_name=region_name)
+    self.url = self.sqs.get_queue_url(QueueName=queue_name)['QueueUrl']
+
+  def lease(self, n, seconds):
+    from taskqueue import totask
+    resp = self.sqs.receive_message(QueueUrl=self.url,
+                                    MaxNumberOfMessages=min(n, SQS_MAX_BATCH),
+                                    VisibilityTimeout=int(seconds),
+                                    WaitTimeSeconds=0)
+    tasks = []
+    for msg in resp.get('Messages', []):
+      body = json.loads(msg['Body'])
+      body['id'] = msg['ReceiptHandle']
+      tasks.append(totask(body))
+    return tasks
+
+  def send_batch(self, fn, entries):
+    """Call a batch method of the SQS client, repeating it for the entries
+    that it reports as Failed
+
+    Returns:
+       list of the Failed entries of the last attempt
+    """
+    failed = []
+    for attempt in range(SQS_RETRIES):
+      resp = fn(QueueUrl=self.url, Entries=entries)
+      failed = resp.get('Failed', [])
+      if not failed:
+        break
+      ids = set(f['Id'] for f in failed)
+      entries = [e for e in entries if e['Id'] in ids]
+      sleep(random.uniform(0, 2 ** attempt))
+    return failed
+
+  def delete(self, tasks):
+    """Delete tasks, logging those SQS fails to delete, which reappear once
+    their lease ends & are executed again
+    """
+    for i in range(0, len(tasks), SQS_MAX_BATCH):
+      entries = [{'Id': str(j), 'ReceiptHandle': t._id}
+                 for j, t in enumerate(tasks[i:i+SQS_MAX_BATCH])]
+      failed = self.send_batch(self.sqs.delete_message_batch, entries)
+      for f in failed:
+        print('Failed to delete {}: {} {}'.format(tasks[i + int(f['Id'])],
+              f.get('Code'), f.get('Message')), flush=True)
+
+  def insert(self, tasks):
+    tasks = list(tasks)
+    for i in range(0, len(tasks), SQS_MAX_BATCH):
+      entries = [{'Id': str(j),
+                  'MessageBody': json.dumps({'payload': t.payload(),
+                                             'queueName': self.queue_name,
+                                             'groupByTag': True,
+                                             'tag': t.__class__.__name__})}
+                 for j, t in enumerate(tasks[i:i+SQS_MAX_BATCH])]
+      failed = self.send_batch(self.sqs.send_message_batch, entries)
+      if failed:
+        raise RuntimeError('Failed to insert {} tasks: {}'.format(len(failed),
+                                                                  failed))
+
+class LocalQueue():
+  """In-memory stand-in for SQSBatchQueue, with visibility timeouts
+
+  Leased tasks are hidden until they're deleted or their lease expires, as
+  on SQS, so failures & retries can be tested without AWS.
+  """
+  def __init__(self, tasks=()):
+    self.lock = Lock()
+    self.visible_at = OrderedDict()
+    self.leases = 0
+    self.deletes = 0
+    self.insert(tasks)
+
+  def __len__(self):
+    return len(self.visible_at)
+
+  def lease(self, n, seconds):
+    now = time()
+    with self.lock:
+      self.leases += 1
+      tasks = [t for t, at in self.visible_at.items() if at <= now][:n]
+      for t in tasks:
+        self.visible_at[t] = now + seconds
+      return tasks
+
+  def delete(self, tasks):
+    with self.lock:
+      self.deletes += 1
+      for t in tasks:
+        self.visible_at.pop(t, None)
+
+  def insert(self, tasks):
+    with self.lock:
+      for t in tasks:
+        self.visible_at[t] = 0
+
+def poll_batches(queue, execute_args, stop_fn=None, lease_seconds=30,
+                 batch_size=SQS_MAX_BATCH, threads_fn=None, max_backoff=120,
+                 flush_fn=None):
+  """Lease batches of tasks, run them concurrently & delete them in batches
+
+  Tasks of a batch are grouped by class & each group runs on as many threads
+  as threads_fn(task) allows, so that light I/O tasks overlap while tasks that
+  hold the GPU run one at a time. The lease covers the whole batch. Tasks
+  that succeed are deleted even if others in their batch fail; failures are
+  logged & polling goes on, while the failed tasks reappear once their lease
+  ends.
+
+  Args:
+     queue: SQSBatchQueue or LocalQueue
+     execute_args: list of arguments of task.execute
+     stop_fn: callable checked after every batch; polling stops once True
+     lease_seconds: int for the time each task may take
+     batch_size: int for the max no. of tasks leased at once
+     threads_fn: callable of a task that returns the no. of its class that
+      may run at once; by default 1
+     flush_fn: optional callable run before the tasks of a batch are deleted,
+      e.g. to write output that the tasks buffered in memory
+
+  Returns:
+     int for the no. of tasks executed
+  """
+  stop_fn = stop_fn or (lambda: False)
+  threads_fn = threads_fn or (lambda task: 1)
+  executed = 0
+  empty = 0
+  while not stop_fn():
+    tasks = queue.lease(batch_size, lease_seconds * batch_size)
+    if not tasks:
+      empty += 1
+      sleep(random.uniform(0, min(2 ** empty, max_backoff)))
+      continue
+    empty = 0
+    groups = OrderedDict()
+    for task in tasks:
+      groups.setdefault(task.__class__.__name__, []).append(task)
+    done, failed = [], 0
+    for group in groups.values():
+      threads = max(1, min(len(group), threads_fn(group[0])))
+      with ThreadPoolExecutor(max_workers=threads) as executor:
+        futures = [(t, executor.submit(t.execute, *execute_args)) for t in group]
+        for task, future in futures:
+          try:
+            future.result()
+            done.append(task)
+          except Exception:
+            print('{} failed:\n{}'.format(task, traceback.format_exc()),
+                  flush=True)
+            failed += 1
+    if flush_fn is not None:
+      try:
+        flush_fn()
+      except Exception:
+        # the output of the batch isn't stored, so none of it is deleted
+        print('Flushing failed:\n{}'.format(traceback.format_exc()), flush=True)
+        failed = len(tasks)
+        done = []
+    if done:
+      queue.delete(done)
+    executed += len(done)
+    if failed:
+      print('{} of {} tasks failed; they will be leased again'.format(
+            failed, len(tasks)), flush=True)
+  return executed
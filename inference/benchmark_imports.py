@@ -0,0 +1,58 @@
+"""Time the cold start of a worker: importing the modules that run tasks
+
+Each run imports the modules in a fresh interpreter, so that nothing is
+cached in sys.modules, and the slowest run is dropped as a filesystem warmup.
+With --top, the modules with the largest cumulative import time (from
+python -X importtime) are listed, to find dependencies worth importing lazily.
+
+Example:
+  python benchmark_imports.py --modules tasks args --runs 5 --top 15
+"""
+import argparse
+import subprocess
+import sys
+from time import time
+
+def time_import(modules):
+  """Seconds to start an interpreter & import modules
+  """
+  start = time()
+  subprocess.run([sys.executable, '-c', 'import {}'.format(', '.join(modules))],
+                 check=True)
+  return time() - start
+
+def slowest_imports(modules, top):
+  """(cumulative seconds, module) of the slowest top-level imports
+  """
+  result = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                           'import {}'.format(', '.join(modules))],
+                          check=True, stderr=subprocess.PIPE,
+                          universal_newlines=True)
+  times = []
+  for line in result.stderr.splitlines():
+    if not line.startswith('import time:') or 'cumulative' in line:
+      continue
+    _, cumulative, name = line[len('import time:'):].split('|')
+    # only the imports made directly by our modules, not their dependencies
+    if name.startswith('   ') and not name.startswith('     '):
+      times.append((int(cumulative) / 1e6, name.strip()))
+  return sorted(times, reverse=True)[:top]
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(
+    description='Time the imports made by a worker before it runs a task')
+  parser.add_argument('--modules', type=str, nargs='+', default=['tasks', 'args'],
+    help='modules imported by the worker')
+  parser.add_argument('--runs', type=int, default=5)
+  parser.add_argument('--top', type=int, default=10,
+    help='no. of the slowest imports to list; 0 lists none')
+  args = parser.parse_args()
+
+  times = sorted(time_import(args.modules) for i in range(args.runs))
+  if len(times) > 1:
+    times = times[:-1]
+  print('import {}: {:.3f} s min, {:.3f} s mean over {} runs'.format(
+        ', '.join(args.modules), times[0], sum(times) / len(times), len(times)))
+  if args.top:
+    for t, name in slowest_imports(args.modules, args.top):
+      print('{:8.3f} s  {}'.format(t, name))
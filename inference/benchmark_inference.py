@@ -0,0 +1,68 @@
+"""Time a ModelArchive model on CPU & GPU with the settings of the Aligner
+
+Example:
+  python benchmark_inference.py --model_path ../models/my_model --size 2048 \
+    --devices cpu cuda --intra_op_threads 8 --channels_last
+"""
+import argparse
+from pathlib import Path
+from time import time
+
+import torch
+
+from utilities.archive import ModelArchive
+
+def time_model(model_path, device, size, runs, channels_last):
+  """Mean seconds per forward pass of the model on a pair of random images
+  """
+  archive = ModelArchive(Path(model_path).stem, device=device,
+                         channels_last=channels_last)
+  model = archive.model
+  src = torch.rand((1, 1, size, size), device=device)
+  tgt = torch.rand((1, 1, size, size), device=device)
+  if channels_last:
+    src = src.contiguous(memory_format=torch.channels_last)
+    tgt = tgt.contiguous(memory_format=torch.channels_last)
+  with torch.no_grad():
+    # warm up allocators & cudnn autotuning
+    model(src, tgt)
+    if device == 'cuda':
+      torch.cuda.synchronize()
+    start = time()
+    for i in range(runs):
+      model(src, tgt)
+    if device == 'cuda':
+      torch.cuda.synchronize()
+  return (time() - start) / runs
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(
+    description='Compare CPU & GPU inference time of a model')
+  parser.add_argument('--model_path', type=str, required=True,
+    help='relative path to the ModelArchive')
+  parser.add_argument('--size', type=int, default=2048,
+    help='width & height of the padded chunk, in pixels')
+  parser.add_argument('--runs', type=int, default=5)
+  parser.add_argument('--devices', type=str, nargs='+', default=['cpu', 'cuda'])
+  parser.add_argument('--intra_op_threads', type=int, default=0,
+    help='no. of threads PyTorch uses on CPU; 0 uses the default')
+  parser.add_argument('--channels_last', action='store_true',
+    help='also time the CPU with channels_last tensors')
+  args = parser.parse_args()
+
+  if args.intra_op_threads:
+    torch.set_num_threads(args.intra_op_threads)
+  results = {}
+  for device in args.devices:
+    if device == 'cuda' and not torch.cuda.is_available():
+      print('Skipping cuda: no GPU available')
+      continue
+    results[device] = time_model(args.model_path, device, args.size, args.runs,
+                                 channels_last=False)
+    if device == 'cpu' and args.channels_last:
+      results['cpu, channels_last'] = time_model(args.model_path, device,
+                                                 args.size, args.runs,
+                                                 channels_last=True)
+  print('{} threads, {}x{} px'.format(torch.get_num_threads(), args.size, args.size))
+  for k, t in results.items():
+    print('{}: {:.3f} s per pair'.format(k, t))
@@ -0,0 +1,270 @@
+import csv
+from copy import deepcopy
+from os.path import join
+
+from boundingbox import BoundingBox
+
+def lookup_models(param_lookup):
+  """Model paths of a param lookup CSV, in order of first appearance
+  """
+  models = []
+  with open(param_lookup) as f:
+    reader = csv.reader(f, delimiter=',')
+    for k, r in enumerate(reader):
+      if k != 0:
+        model_path = join('..', 'models', r[7])
+        if model_path not in models:
+          models.append(model_path)
+  return models
+
+class BlockPlan():
+  """Block alignment & stitching schedule compiled from a param lookup CSV
+
+  BLOCK ALIGNMENT
+  Copy sections with block offsets of 0
+  Align without vector voting sections with block offsets < 0 (starter sections)
+  Align with vector voting sections with block offsets > 0 (block sections)
+  BLOCK STITCHING
+  Stitch blocks using the aligned block sections that have tgt_z in the starter sections
+
+  Blocks alternate between two destinations, since they overlap by tgt_radius,
+  so destinations are recorded as parities (0 for even blocks, 1 for odd).
+
+  Args:
+     param_lookup: str for path to CSV file identifying params to use per z range
+     z_start: int for first section to align
+     z_stop: int for section after the last to align
+     block_size: int for no. of sections per block
+     max_mip: int for the maximum MIP level of the bboxes
+  """
+  def __init__(self, param_lookup, z_start, z_stop, block_size, max_mip):
+    self.z_start = z_start
+    self.z_stop = z_stop
+    self.block_size = block_size
+    self.load_params(param_lookup, max_mip)
+    self.compile_blocks()
+    self.compile_stitching()
+
+  def load_params(self, param_lookup, max_mip):
+    """Compile bbox, model, vvote_offsets for each z index, along with indices to skip
+    """
+    self.bbox_lookup = {}
+    self.model_lookup = {}
+    self.tgt_radius_lookup = {}
+    self.vvote_lookup = {}
+    self.skip_list = []
+    with open(param_lookup) as f:
+      reader = csv.reader(f, delimiter=',')
+      for k, r in enumerate(reader):
+         if k != 0:
+           x_start = int(r[0])
+           y_start = int(r[1])
+           z_start = int(r[2])
+           x_stop  = int(r[3])
+           y_stop  = int(r[4])
+           z_stop  = int(r[5])
+           bbox_mip = int(r[6])
+           model_path = join('..', 'models', r[7])
+           tgt_radius = int(r[8])
+           skip = bool(int(r[9]))
+           bbox = BoundingBox(x_start, x_stop, y_start, y_stop, bbox_mip, max_mip)
+           for z in range(z_start, z_stop):
+             if skip:
+               self.skip_list.append(z)
+             self.bbox_lookup[z] = bbox
+             self.model_lookup[z] = model_path
+             self.tgt_radius_lookup[z] = tgt_radius
+             self.vvote_lookup[z] = [-i for i in range(1, tgt_radius+1)]
+
+    # Filter out skipped sections from vvote_offsets
+    self.min_offset = 0
+    for z, tgt_radius in self.vvote_lookup.items():
+      offset = 0
+      for i, r in enumerate(tgt_radius):
+        while r + offset + z in self.skip_list:
+          offset -= 1
+        tgt_radius[i] = r + offset
+      self.min_offset = min(self.min_offset, r + offset)
+      offset = 0
+      self.vvote_lookup[z] = tgt_radius
+    self.offset_range = [i for i in range(self.min_offset, abs(self.min_offset)+1)]
+
+  def compile_blocks(self):
+    block_size = self.block_size
+    # Adjust block starts so they don't start on a skipped section
+    initial_block_starts = list(range(self.z_start, self.z_stop, block_size))
+    if initial_block_starts[-1] != self.z_stop:
+      initial_block_starts.append(self.z_stop)
+    self.block_starts = []
+    for bs, be in zip(initial_block_starts[:-1], initial_block_starts[1:]):
+      while bs in self.skip_list:
+        bs += 1
+        assert(bs < be)
+      self.block_starts.append(bs)
+    self.block_stops = self.block_starts[1:]
+    if self.block_starts[-1] != self.z_stop:
+      self.block_stops.append(self.z_stop)
+
+    # Create lookup dicts based on offset in the canonical block
+    # This lookup makes it easy for restarting based on block offset, though isn't
+    #  strictly necessary for the copy & starter sections
+    self.block_parity_lookup = {}
+    self.block_start_lookup = {}
+    self.starter_parity_lookup = {}
+    self.copy_offset_to_z_range = {0: deepcopy(self.block_starts)}
+    self.overlap_copy_range = set()
+    self.starter_offset_to_z_range = {i: set() for i in range(self.min_offset, 0)}
+    #TODO: Set the padding based on max(be-bs)
+    self.block_offset_to_z_range = {i: set() for i in range(1, block_size+10)}
+    # Reverse lookup to easily identify tgt_z for each starter z
+    self.starter_z_to_offset = {}
+    for k, (bs, be) in enumerate(zip(self.block_starts, self.block_stops)):
+      even_odd = k % 2
+      for i, z in enumerate(range(bs, be+1)):
+        if i > 0:
+          self.block_start_lookup[z] = bs
+          self.block_parity_lookup[z] = even_odd
+          if z not in self.skip_list:
+            self.block_offset_to_z_range[i].add(z)
+            for tgt_offset in self.vvote_lookup[z]:
+              tgt_z = z + tgt_offset
+              if tgt_z <= bs:
+                self.starter_parity_lookup[tgt_z] = even_odd
+                # ignore first block for stitching operations
+                if k > 0:
+                  self.overlap_copy_range.add(tgt_z)
+              if tgt_z < bs:
+                self.starter_z_to_offset[tgt_z] = bs - tgt_z
+                self.starter_offset_to_z_range[tgt_z - bs].add(tgt_z)
+
+  def compile_stitching(self):
+    """Determine the number of sections needed to stitch (no stitching for block 0)
+    """
+    block_size = self.block_size
+    self.stitch_offset_to_z_range = {i: [] for i in range(1, block_size+1)}
+    self.block_start_to_stitch_offsets = {i: [] for i in self.block_starts[1:]}
+    for bs, be in zip(self.block_starts[1:], self.block_stops[1:]):
+      max_offset = 0
+      for i, z in enumerate(range(bs, be+1)):
+        if i > 0 and z not in self.skip_list:
+          max_offset = max(max_offset, self.tgt_radius_lookup[z])
+          if len(self.block_start_to_stitch_offsets[bs]) < max_offset:
+            self.stitch_offset_to_z_range[i].append(z)
+            self.block_start_to_stitch_offsets[bs].append(bs - z)
+          else:
+            break
+
+  def section_params(self, z):
+    """Parameters that determine the output of every task run for section z
+    """
+    bbox = self.bbox_lookup.get(z, None)
+    if bbox is not None:
+      bbox = bbox.stringify(0)
+    return (bbox, self.model_lookup.get(z, None), self.vvote_lookup.get(z, None),
+            z in self.skip_list)
+
+  def block_index(self, z):
+    """Index of the block whose block sections include z
+    """
+    return self.block_starts.index(self.block_start_lookup[z])
+
+  def block_sections(self, k):
+    bs, be = self.block_starts[k], self.block_stops[k]
+    return [z for z in range(bs+1, be+1) if z not in self.skip_list]
+
+  def starter_sections(self, k):
+    bs = self.block_starts[k]
+    return sorted(z for z, o in self.starter_z_to_offset.items() if z + o == bs)
+
+  def overlap_sections(self, k):
+    """Sections of block k-1 that block k is stitched to
+    """
+    bs = self.block_starts[k]
+    prev_bs = self.block_starts[k-1]
+    return sorted(z for z in self.overlap_copy_range if prev_bs < z <= bs)
+
+  def stitch_sections(self, k):
+    bs = self.block_starts[k]
+    return [bs - o for o in self.block_start_to_stitch_offsets.get(bs, [])]
+
+class IncrementalPlan():
+  """Tasks of a BlockPlan affected by changing its param lookup
+
+  Block sections are aligned serially, so a changed section invalidates the
+  rest of its block. A changed copy or starter section invalidates its whole
+  block. Block k is restitched if its stitch sections, or the sections of
+  block k-1 that it overlaps, were invalidated. Once the block starts differ,
+  every block from the first differing start onwards is invalidated.
+
+  Args:
+     old_plan: BlockPlan of the previous run
+     new_plan: BlockPlan to run now
+  """
+  def __init__(self, old_plan, new_plan):
+    self.plan = new_plan
+    old, new = old_plan, new_plan
+    changed = set()
+    for z in set(old.bbox_lookup) | set(new.bbox_lookup):
+      if old.section_params(z) != new.section_params(z):
+        changed.add(z)
+    self.changed = changed
+
+    n = len(new.block_starts)
+    first_diff = n
+    for k in range(n):
+      if (k >= len(old.block_starts) or
+          old.block_starts[k] != new.block_starts[k] or
+          old.block_stops[k] != new.block_stops[k] or
+          old.starter_sections(k) != new.starter_sections(k)):
+        first_diff = k
+        break
+
+    self.full_blocks = set()
+    self.block_z = set()
+    for k in range(n):
+      sections = new.block_sections(k)
+      starters = new.starter_sections(k) + [new.block_starts[k]]
+      if k >= first_diff or any(z in changed for z in starters):
+        self.full_blocks.add(k)
+        self.block_z.update(sections)
+      else:
+        stale = [z for z in sections if z in changed]
+        if len(stale) > 0:
+          self.block_z.update(z for z in sections if z >= min(stale))
+
+    self.stitch_blocks = set()
+    for k in range(1, n):
+      overlap = new.overlap_sections(k)
+      stitch = new.stitch_sections(k)
+      if (k >= first_diff or
+          overlap != old.overlap_sections(k) or
+          stitch != old.stitch_sections(k) or
+          any(z in self.block_z for z in overlap + stitch)):
+        self.stitch_blocks.add(k)
+
+  def copy_range(self, z_range):
+    return [z for z in z_range
+              if self.plan.block_starts.index(z) in self.full_blocks]
+
+  def starter_range(self, z_range):
+    return [z for z in z_range
+              if self.plan.block_starts.index(z + self.plan.starter_z_to_offset[z])
+                 in self.full_blocks]
+
+  def block_range(self, z_range):
+    return [z for z in z_range if z in self.block_z]
+
+  def overlap_copy_range(self, z_range):
+    """Filter overlap sections to those of blocks that will be restitched
+    """
+    starts = self.plan.block_starts
+    return [z for z in z_range
+              if min(k for k in range(len(starts)) if starts[k] >= z)
+                 in self.stitch_blocks]
+
+  def stitch_range(self, z_range):
+    return [z for z in z_range if self.plan.block_index(z) in self.stitch_blocks]
+
+  def broadcast_range(self, z_range):
+    return [bs for bs in z_range
+              if self.plan.block_starts.index(bs) in self.stitch_blocks]
@@ -0,0 +1,97 @@
+from collections import OrderedDict
+from threading import Lock
+
+class LRUCache():
+  """Least-recently-used cache bounded by the total size of its entries
+
+  Pinned entries are never evicted, though they count towards max_size. The
+  most recently used entry is kept too, even if it alone exceeds max_size, so
+  that a value larger than the budget is still reused until the next put.
+
+  Args:
+     max_size: maximum total size of all entries; once exceeded, the least
+      recently used entries are evicted
+     sizeof: callable that returns the size of a value; by default every entry
+      has size 1, so max_size is the maximum number of entries
+  """
+  def __init__(self, max_size, sizeof=None):
+    self.max_size = max_size
+    self.sizeof = sizeof if sizeof is not None else (lambda v: 1)
+    self.size = 0
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    self.entries = OrderedDict()
+    self.sizes = {}
+    self.pinned = set()
+    self.lock = Lock()
+
+  def __contains__(self, k):
+    return k in self.entries
+
+  def __len__(self):
+    return len(self.entries)
+
+  def keys(self):
+    with self.lock:
+      return list(self.entries)
+
+  def get(self, k, default=None):
+    with self.lock:
+      if k in self.entries:
+        self.entries.move_to_end(k)
+        self.hits += 1
+        return self.entries[k]
+      self.misses += 1
+      return default
+
+  def put(self, k, v):
+    with self.lock:
+      if k in self.entries:
+        self._remove(k)
+      self.entries[k] = v
+      self.sizes[k] = self.sizeof(v)
+      self.size += self.sizes[k]
+      self.evict()
+
+  def pop(self, k, default=None):
+    with self.lock:
+      if k not in self.entries:
+        return default
+      return self._remove(k)
+
+  def pin(self, k):
+    with self.lock:
+      self.pinned.add(k)
+
+  def unpin(self, k):
+    with self.lock:
+      self.pinned.discard(k)
+      self.evict()
+
+  def evict(self):
+    """Drop least recently used entries, other than the most recent, until
+    the cache is within max_size
+    """
+    unpinned = [k for k in list(self.entries)[:-1] if k not in self.pinned]
+    for k in unpinned:
+      if self.size <= self.max_size:
+        break
+      self._remove(k)
+      self.evictions += 1
+
+  def clear(self):
+    with self.lock:
+      self.entries.clear()
+      self.sizes.clear()
+      self.pinned.clear()
+      self.size = 0
+
+  def stats(self):
+    return {'entries': len(self.entries), 'size': self.size,
+            'hits': self.hits, 'misses': self.misses,
+            'evictions': self.evictions}
+
+  def _remove(self, k):
+    self.size -= self.sizes.pop(k)
+    return self.entries.pop(k)
@@ -0,0 +1,148 @@
+import fcntl
+import hashlib
+import os
+from os.path import join
+from tempfile import NamedTemporaryFile
+
+from cloudvolume import Storage, chunks
+
+from etags import chunk_etags
+from local_volume import LocalVolume
+
+class SharedChunkCache():
+  """Encoded chunk files shared by the worker processes of a node
+
+  Entries are files in a directory, normally under /dev/shm, named by the
+  md5 of the chunk URL & the ETag of the stored chunk (see etags.chunk_etags).
+  Each entry is written to a temporary file & renamed
+  into place, so readers in other processes never see partial entries. A hit
+  touches the entry, and once a process has added budget/8 bytes it evicts
+  the least recently used entries down to the budget, under a file lock so
+  that only one process scans at a time.
+
+  A chunk rewritten by any process, node or job gets a new ETag, so its old
+  entry is never read again & is left to eviction.
+
+  Args:
+     path: str for the cache directory
+     max_bytes: int for the byte budget of all entries
+  """
+  def __init__(self, path, max_bytes):
+    self.path = path
+    self.max_bytes = max_bytes
+    self.added = 0
+    self.hits = 0
+    self.misses = 0
+    os.makedirs(path, exist_ok=True)
+
+  def entry(self, url, etag):
+    key = '{}\n{}'.format(url, etag)
+    return join(self.path, hashlib.md5(key.encode('utf-8')).hexdigest())
+
+  def get(self, url, etag):
+    entry = self.entry(url, etag)
+    try:
+      with open(entry, 'rb') as f:
+        content = f.read()
+      os.utime(entry)
+      self.hits += 1
+      return content
+    except FileNotFoundError:
+      self.misses += 1
+      return None
+
+  def put(self, url, etag, content):
+    with NamedTemporaryFile(dir=self.path, prefix='.', delete=False) as f:
+      f.write(content)
+    os.replace(f.name, self.entry(url, etag))
+    self.added += len(content)
+    if self.added > self.max_bytes // 8:
+      self.added = 0
+      self.evict()
+
+  def evict(self):
+    """Remove the least recently used entries until within the budget
+    """
+    with open(join(self.path, '.lock'), 'w') as lock:
+      try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+      except BlockingIOError:
+        return
+      entries = []
+      total = 0
+      for e in os.scandir(self.path):
+        if e.name.startswith('.'):
+          continue
+        try:
+          st = e.stat()
+        except FileNotFoundError:
+          continue
+        entries.append((st.st_mtime, st.st_size, e.path))
+        total += st.st_size
+      entries.sort()
+      for _, size, path in entries:
+        if total <= self.max_bytes:
+          break
+        try:
+          os.remove(path)
+        except FileNotFoundError:
+          pass
+        total -= size
+
+  def stats(self):
+    return {'hits': self.hits, 'misses': self.misses}
+
+class CachedVolume(LocalVolume):
+  """Read remote chunks of a CloudVolume at one MIP through a SharedChunkCache
+
+  The ETags of a cutout's chunks are fetched first, so only chunks that are
+  stored & not cached under their current ETag are downloaded, in one
+  threaded batch, then added to the cache still encoded. Writes go to the
+  CloudVolume.
+
+  Args:
+     cv: unsharded CloudVolume at the MIP to serve
+     cache: SharedChunkCache
+  """
+  def __init__(self, cv, cache):
+    self.cv = cv
+    self.cache = cache
+    self.dtype = cv.dtype
+
+  def chunk_url(self, chunk):
+    return join(self.cv.layer_cloudpath, self.chunk_name(chunk))
+
+  def decode(self, chunk, content):
+    shape = tuple(chunk.size3()) + (self.cv.num_channels,)
+    block_size = None
+    if self.cv.encoding == 'compressed_segmentation':
+      block_size = self.cv.compressed_segmentation_block_size
+    return chunks.decode(content, self.cv.encoding, shape=shape,
+                         dtype=self.dtype, block_size=block_size)
+
+  def read_chunks(self, chunk_list):
+    names = [self.chunk_name(c) for c in chunk_list]
+    etags = chunk_etags(self.cv.layer_cloudpath, names)
+    contents = [None if etags[n] is None else self.cache.get(self.chunk_url(c),
+                                                             etags[n])
+                for c, n in zip(chunk_list, names)]
+    missing = [n for n, d in zip(names, contents)
+               if d is None and etags[n] is not None]
+    if len(missing) > 0:
+      with Storage(self.cv.layer_cloudpath) as stor:
+        results = stor.get_files(missing)
+      downloaded = {}
+      for r in results:
+        if r['error'] is not None:
+          raise r['error']
+        downloaded[r['filename']] = r['content']
+      for i, (c, n) in enumerate(zip(chunk_list, names)):
+        if n in downloaded:
+          contents[i] = downloaded[n]
+          if contents[i] is not None:
+            self.cache.put(self.chunk_url(c), etags[n], contents[i])
+    return [None if d is None else self.decode(c, d)
+            for c, d in zip(chunk_list, contents)]
+
+  def __setitem__(self, slices, img):
+    self.cv[slices] = img
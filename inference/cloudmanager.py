@@ -1,4 +1,5 @@
 from mipless_cloudvolume import MiplessCloudVolume as CV 
+from shards import sharding_spec
 from copy import deepcopy, copy
 from cloudvolume import CloudVolume
 from cloudvolume.lib import Vec
@@ -150,7 +151,9 @@ class CloudManager():
       self.vec_voxel_offsets.append(scales[i]["voxel_offset"])
       self.vec_total_sizes.append(scales[i]["size"])
 
-  def create(self, path, data_type, num_channels, fill_missing, overwrite=False):
+  def create(self, path, data_type, num_channels, fill_missing, overwrite=False,
+             encoding=None, max_error=None, field_pyramid=None, sharding=None,
+             shard_mips=None):
     """Create a MiplessCloudVolume based on params & details of class
 
     Args:
@@ -161,6 +164,18 @@ class CloudManager():
          CloudVolume
        ignore_info: bool indicating whether to overwrite the info file for the
          CloudVolume
+       encoding: str for chunk encoding of every scale, e.g. 'fpzip' or
+         'kempressed' for float32 vector fields; None keeps the template's
+       max_error: float for the largest error allowed when quantizing a float32
+         vector field before it is encoded; Aligner.save_field rounds vectors
+         to multiples of 2*max_error, so that fpzip can drop the noise bits
+       field_pyramid: tuple of (base_mip, max_mip) for a vector field written at
+         base_mip, so that Aligner.save_field also writes levels up to max_mip
+       sharding: tuple of (preshift_bits, minishard_bits) to store each block of
+         2**(preshift_bits + minishard_bits) chunks in one shard file; sharded
+         scales can't be written by chunk, only packed from a finished
+         unsharded volume with Aligner.shard (an offline repack)
+       shard_mips: list of MIP levels to shard; None shards every scale
 
     Returns:
        read & write MiplessCloudVolumes
@@ -168,6 +183,21 @@ class CloudManager():
     info = deepcopy(self.info)
     info['data_type'] = data_type
     info['num_channels'] = num_channels
+    if encoding is not None:
+      if encoding in ('fpzip', 'kempressed') and data_type != 'float32':
+        raise ValueError('{} encoding requires float32 data, not {}'.format(
+                                                          encoding, data_type))
+      for scale in info['scales']:
+        scale['encoding'] = encoding
+    if max_error is not None:
+      info['field_quantization'] = 2 * max_error
+    if field_pyramid is not None:
+      info['field_pyramid'] = {'base_mip': field_pyramid[0], 
+                               'max_mip': field_pyramid[1]}
+    if sharding is not None:
+      for mip, scale in enumerate(info['scales']):
+        if shard_mips is None or mip in shard_mips:
+          scale['sharding'] = sharding_spec(scale, *sharding)
     provenance = deepcopy(self.provenance)
     if not overwrite:
       print('Use existing info file for MiplessCloudVolume at {0}'.format(path))
@@ -12,6 +12,7 @@ from taskqueue import GreenTaskQueue
 from args import (get_aligner, get_argparser, get_bbox, get_provenance,
                   parse_args)
 from cloudmanager import CloudManager
+from tasks import batch_tasks
 
 
 def make_range(block_range, part_num):
@@ -131,7 +132,7 @@ if __name__ == '__main__':
 
   def remote_upload(tasks):
       with GreenTaskQueue(queue_name=args.queue_name) as tq:
-          tq.insert_all(tasks)
+          tq.insert_all(batch_tasks(tasks, a.chunks_per_task))
 
 
   class ComposeTaskIterator(object):
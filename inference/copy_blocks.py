@@ -15,7 +15,7 @@ from args import get_argparser, parse_args, get_aligner, get_bbox, get_provenanc
 from os.path import join
 from cloudmanager import CloudManager
 from itertools import compress
-from tasks import run
+from tasks import run, batch_tasks
 from boundingbox import BoundingBox
 
 def print_run(diff, n_tasks):
@@ -160,7 +160,7 @@ if __name__ == '__main__':
   ###########################
   def remote_upload(tasks):
       with GreenTaskQueue(queue_name=args.queue_name) as tq:
-          tq.insert_all(tasks)  
+          tq.insert_all(batch_tasks(tasks, a.chunks_per_task))
  
   class CopyTaskIteratorImage():
       def __init__(self, brange, even_odd):
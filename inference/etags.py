@@ -0,0 +1,89 @@
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import os
+import posixpath
+from threading import Lock
+
+from cloudvolume import Storage
+from cloudvolume.connectionpools import GCloudBucketPool, S3ConnectionPool
+from cloudvolume.paths import extract
+
+POOLS = {}
+POOLS_LOCK = Lock()
+
+def connection_pool(protocol, bucket):
+  """Connection pool of a bucket, shared by every caller in the process
+  """
+  with POOLS_LOCK:
+    if (protocol, bucket) not in POOLS:
+      if protocol == 'gs':
+        POOLS[protocol, bucket] = GCloudBucketPool(bucket)
+      else:
+        POOLS[protocol, bucket] = S3ConnectionPool(protocol, bucket)
+    return POOLS[protocol, bucket]
+
+def file_etag(path):
+  """Size & mtime of a local chunk file, which may be stored compressed
+  """
+  for ext in ['.gz', '.br', '']:
+    if os.path.exists(path + ext):
+      stat = os.stat(path + ext)
+      return '{}-{}'.format(stat.st_size, stat.st_mtime_ns)
+  return None
+
+def object_etag(protocol, bucket, key):
+  """md5 of a gs object or ETag of an s3 object, from a metadata request
+  """
+  pool = connection_pool(protocol, bucket)
+  conn = pool.get_connection()
+  try:
+    if protocol == 'gs':
+      blob = conn.get_blob(key)
+      return None if blob is None else blob.md5_hash
+    import botocore
+    try:
+      return conn.head_object(Bucket=bucket, Key=key)['ETag']
+    except botocore.exceptions.ClientError as e:
+      if e.response['Error']['Code'] in ('404', 'NoSuchKey'):
+        return None
+      raise
+  finally:
+    pool.release_connection(conn)
+
+def content_etag(path, name):
+  with Storage(path) as stor:
+    content = stor.get_file(name)
+  return None if content is None else hashlib.md5(content).hexdigest()
+
+def chunk_etags(path, names, threads=16):
+  """Fingerprints of stored chunk files, from their metadata only
+
+  Local files are identified by their size & mtime, gs & s3 objects by the
+  md5 or ETag that a metadata request returns, so chunks are not downloaded.
+  Other protocols, or a metadata request that fails, fall back to the md5 of
+  the content. The two kinds of fingerprint never match, so a fallback can
+  only cause a miss.
+
+  Args:
+     path: str for the CloudVolume-style path of a layer, e.g. gs://bucket/img
+     names: list of str for chunk file names relative to path
+
+  Returns:
+     dict of name to str, or None for a missing file
+  """
+  extracted = extract(path)
+
+  def etag(name):
+    if extracted.protocol == 'file':
+      return file_etag(os.path.join(extracted.basepath, extracted.layer, name))
+    if extracted.protocol in ('gs', 's3', 'matrix'):
+      key = posixpath.join(extracted.no_bucket_basepath, extracted.layer, name)
+      try:
+        return object_etag(extracted.protocol, extracted.bucket, key)
+      except Exception as e:
+        print('Metadata request for {} failed, hashing its content: {}'.format(
+              key, e))
+    return content_etag(path, name)
+
+  with ThreadPoolExecutor(max_workers=threads) as executor:
+    return dict(zip(names, executor.map(etag, names)))
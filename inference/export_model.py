@@ -0,0 +1,134 @@
+"""Export a ModelArchive & its preprocessor to TorchScript
+
+The artifacts are written to <archive>/exported, with an export.json that
+records the md5 of the archive files they came from. Aligner.get_model_archive
+loads them instead of the archive while that md5 still matches, and a
+directory that holds only the exported files can be used as a model_path
+without the models/ directory.
+
+Example:
+  python export_model.py --model_path ../models/my_model --size 1024 --device cuda
+"""
+import argparse
+import json
+from pathlib import Path
+
+import torch
+
+from utilities.archive import ModelArchive
+from result_cache import hash_model
+
+EXPORT_INFO = 'export.json'
+
+class ExportedArchive():
+  """TorchScript model & preprocessor, used in place of a ModelArchive
+
+  Args:
+     directory: Path of the exported files
+     device: torch.device to load them onto
+  """
+  def __init__(self, directory, device):
+    self.directory = directory
+    self.info = json.loads((directory / EXPORT_INFO).read_text())
+    self.name = self.info['name']
+    self.model = torch.jit.load(str(directory / 'model.pt'), map_location=device)
+    self.model.eval()
+    self.preprocessor = None
+    if (directory / 'preprocessor.pt').exists():
+      self.preprocessor = torch.jit.load(str(directory / 'preprocessor.pt'),
+                                         map_location=device)
+
+def export_dir(model_path):
+  """Directory that holds, or will hold, the exported files of a model
+  """
+  path = Path(model_path)
+  if (path / EXPORT_INFO).exists():
+    return path
+  _, directory = ModelArchive._resolve_model(path.stem)
+  return directory / 'exported'
+
+def load_exported(model_path, device):
+  """Load the exported model at model_path, or None if there is no valid export
+
+  An export is used if it was made for the same device type and, when the
+  archive is present, from the archive's current files.
+  """
+  try:
+    directory = export_dir(model_path)
+  except Exception:
+    return None
+  if not (directory / EXPORT_INFO).exists():
+    return None
+  info = json.loads((directory / EXPORT_INFO).read_text())
+  if info['device'] != torch.device(device).type:
+    return None
+  if directory.name == 'exported' and info['md5'] != hash_model(model_path):
+    print('Ignoring stale export of {}'.format(model_path), flush=True)
+    return None
+  return ExportedArchive(directory, device)
+
+def to_script(module, example_inputs):
+  """Script a module, or trace it if it cannot be scripted
+  """
+  try:
+    return torch.jit.script(module), 'script'
+  except Exception as e:
+    print('Scripting failed ({}), tracing instead'.format(e), flush=True)
+    return torch.jit.trace(module, example_inputs, check_trace=False), 'trace'
+
+def check_sizes(module, scripted, make_inputs, sizes, tolerance):
+  """Raise if the exported module differs from the eager one at any size
+  """
+  with torch.no_grad():
+    for size in sizes:
+      inputs = make_inputs(size)
+      expected, actual = module(*inputs), scripted(*inputs)
+      error = float(torch.max(torch.abs(expected - actual)))
+      if error > tolerance:
+        raise ValueError('Export differs from the model by {} at {} px; '
+                         'it may depend on its input size'.format(error, size))
+
+def export(model_path, size, device, tolerance=1e-4):
+  archive = ModelArchive(Path(model_path).stem, device=device)
+  directory = export_dir(model_path)
+  directory.mkdir(parents=True, exist_ok=True)
+  sizes = [size, size // 2]
+
+  def image_pair(s):
+    return (torch.rand((1, 1, s, s), device=device),
+            torch.rand((1, 1, s, s), device=device))
+  with torch.no_grad():
+    model, method = to_script(archive.model, image_pair(size))
+  check_sizes(archive.model, model, image_pair, sizes, tolerance)
+  if hasattr(torch.jit, 'freeze') and method == 'script':
+    model = torch.jit.freeze(model)
+  model.save(str(directory / 'model.pt'))
+
+  methods = {'model': method}
+  if archive.preprocessor is not None:
+    def image(s):
+      return (torch.rand((1, 1, s, s), device=device),)
+    with torch.no_grad():
+      preprocessor, method = to_script(archive.preprocessor, image(size))
+    check_sizes(archive.preprocessor, preprocessor, image, sizes, tolerance)
+    preprocessor.save(str(directory / 'preprocessor.pt'))
+    methods['preprocessor'] = method
+
+  info = {'name': archive.name, 'md5': hash_model(model_path),
+          'device': torch.device(device).type, 'methods': methods,
+          'torch': torch.__version__}
+  (directory / EXPORT_INFO).write_text(json.dumps(info, indent=2))
+  print('Exported {} to {}'.format(model_path, directory))
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Export a model to TorchScript')
+  parser.add_argument('--model_path', type=str, required=True,
+    help='relative path to the ModelArchive')
+  parser.add_argument('--size', type=int, default=1024,
+    help='width & height of the example images, in pixels')
+  parser.add_argument('--device', type=str, default='cuda',
+    help='device the export will run on; either cpu or cuda')
+  parser.add_argument('--tolerance', type=float, default=1e-4,
+    help='max difference allowed between the export & the model')
+  args = parser.parse_args()
+  export(args.model_path, args.size, args.device, args.tolerance)
@@ -97,9 +97,8 @@ if __name__ == '__main__':
     with ProcessPoolExecutor(max_workers=a.threads) as executor:
         executor.map(remote_upload, ptask)
   else:
-      for t in ptask:
-        tq = LocalTaskQueue(parallel=1)
-        tq.insert_all(t, args= [a])
+      # run flushes the sums still buffered for the edge sections
+      run(a, (task for t in ptask for task in t))
 
   end = time()
   diff = end - start
@@ -0,0 +1,147 @@
+import gzip
+import os
+from tempfile import NamedTemporaryFile
+
+import numpy as np
+from cloudvolume import chunks, paths
+from cloudvolume.lib import Bbox, Vec
+
+def is_local_raw(cv):
+  """Whether a CloudVolume can be served by LocalVolume
+  """
+  return (paths.extract(cv.layer_cloudpath).protocol == 'file' and
+          cv.encoding == 'raw' and
+          'sharding' not in cv.scale)
+
+class LocalVolume():
+  """Memory-mapped access to a raw encoded file:// CloudVolume at one MIP
+
+  Chunks are stored uncompressed, so that reads can memory-map the chunk
+  files. A read within one stored chunk returns a read-only view of its map;
+  other reads are assembled from the maps of the chunks they overlap.
+  Chunks written by CloudVolume (gzipped by default) are still read, by
+  decompressing them.
+
+  Writes must cover whole chunks, clipped to the volume bounds. Each chunk is
+  written to a temporary file & renamed into place, so concurrent writers
+  of different chunks never see partial chunks. Other writes are passed to
+  the CloudVolume.
+
+  Any other attribute is looked up on the CloudVolume.
+
+  Args:
+     cv: CloudVolume at the MIP to serve, for which is_local_raw holds
+  """
+  def __init__(self, cv):
+    self.cv = cv
+    path = paths.extract(cv.layer_cloudpath)
+    self.root = os.path.join(path.basepath, path.layer)
+    self.dir = os.path.join(self.root, cv.key)
+    self.dtype = np.dtype(cv.dtype)
+
+  def __getattr__(self, k):
+    if k == 'cv':
+      raise AttributeError(k)
+    return getattr(self.cv, k)
+
+  def bbox(self, slices):
+    """Bbox of the x,y,z slices or ints of a cutout
+    """
+    slices = list(slices)[:3]
+    minpt, maxpt = [], []
+    for s in slices:
+      if isinstance(s, slice):
+        minpt.append(s.start)
+        maxpt.append(s.stop)
+      else:
+        minpt.append(s)
+        maxpt.append(s+1)
+    return Bbox(Vec(*minpt), Vec(*maxpt))
+
+  def chunk_bbox(self, gridpt):
+    chunk_size = Vec(*self.cv.chunk_size)
+    minpt = Vec(*self.cv.voxel_offset) + gridpt * chunk_size
+    maxpt = Vec(*np.minimum(minpt + chunk_size, self.cv.bounds.maxpt))
+    return Bbox(minpt, maxpt)
+
+  def chunk_name(self, chunk):
+    """Name of a chunk file, relative to the layer
+    """
+    return '{}/{}-{}_{}-{}_{}-{}'.format(self.cv.key,
+                        chunk.minpt.x, chunk.maxpt.x, chunk.minpt.y,
+                        chunk.maxpt.y, chunk.minpt.z, chunk.maxpt.z)
+
+  def chunk_path(self, chunk):
+    return os.path.join(self.root, self.chunk_name(chunk))
+
+  def chunks(self, bbox):
+    """Bboxes of the chunks that overlap bbox within the volume bounds
+    """
+    bounds = self.cv.bounds
+    bbox = Bbox.intersection(bbox, bounds)
+    if bbox.subvoxel():
+      return []
+    chunk_size = Vec(*self.cv.chunk_size)
+    offset = Vec(*self.cv.voxel_offset)
+    lo = (bbox.minpt - offset) // chunk_size
+    hi = (bbox.maxpt - offset + chunk_size - 1) // chunk_size
+    return [self.chunk_bbox(Vec(x, y, z)) for x in range(lo.x, hi.x)
+                                          for y in range(lo.y, hi.y)
+                                          for z in range(lo.z, hi.z)]
+
+  def read_chunk(self, chunk):
+    """Array of a stored chunk in (x,y,z,c) order, or None if it is missing
+    """
+    path = self.chunk_path(chunk)
+    shape = tuple(chunk.size3()) + (self.cv.num_channels,)
+    if os.path.exists(path + '.gz'):
+      with gzip.open(path + '.gz', 'rb') as f:
+        return chunks.decode(f.read(), 'raw', shape=shape, dtype=self.dtype)
+    if os.path.exists(path):
+      return np.memmap(path, dtype=self.dtype, mode='r', shape=shape, order='F')
+    return None
+
+  def read_chunks(self, chunk_list):
+    return [self.read_chunk(c) for c in chunk_list]
+
+  def __getitem__(self, slices):
+    bbox = self.bbox(slices)
+    shape = tuple(bbox.size3()) + (self.cv.num_channels,)
+    chunk_list = self.chunks(bbox)
+    data_list = self.read_chunks(chunk_list)
+    if len(chunk_list) == 1 and chunk_list[0].contains_bbox(bbox):
+      chunk, data = chunk_list[0], data_list[0]
+      if data is not None:
+        lo = bbox.minpt - chunk.minpt
+        hi = bbox.maxpt - chunk.minpt
+        return data[lo.x:hi.x, lo.y:hi.y, lo.z:hi.z]
+    img = np.zeros(shape, dtype=self.dtype, order='F')
+    for chunk, data in zip(chunk_list, data_list):
+      if data is None:
+        if not self.cv.fill_missing:
+          raise ValueError('Missing chunk {}'.format(self.chunk_name(chunk)))
+        continue
+      overlap = Bbox.intersection(chunk, bbox)
+      src = overlap - chunk.minpt
+      dst = overlap - bbox.minpt
+      img[dst.to_slices()] = data[src.to_slices()]
+    return img
+
+  def __setitem__(self, slices, img):
+    bbox = self.bbox(slices)
+    chunk_list = self.chunks(bbox)
+    if any(not bbox.contains_bbox(c) for c in chunk_list):
+      self.cv[slices] = img
+      return
+    img = np.asarray(img, dtype=self.dtype)
+    if img.ndim == 3:
+      img = img[..., np.newaxis]
+    os.makedirs(self.dir, exist_ok=True)
+    for chunk in chunk_list:
+      src = chunk - bbox.minpt
+      data = img[src.to_slices()]
+      with NamedTemporaryFile(dir=self.dir, delete=False) as f:
+        f.write(data.tobytes('F'))
+      os.replace(f.name, self.chunk_path(chunk))
+      if os.path.exists(self.chunk_path(chunk) + '.gz'):
+        os.remove(self.chunk_path(chunk) + '.gz')
@@ -0,0 +1,81 @@
+from threading import Lock
+
+import numpy as np
+from cache import LRUCache
+
+class MaskCache():
+  """Per-worker cache of mask tiles stored at a coarse MIP
+
+  Masks are typically stored at a coarse MIP & upsampled to the MIP of the image
+  they're applied to. Neighboring chunks, as well as the src & tgt roles of the
+  same chunk, request overlapping windows of the same coarse region. Fetch each
+  tile once, keep it in an LRUCache, and assemble any window from cached tiles.
+
+  Tiles are dropped by invalidate when the Aligner writes to their volume, so
+  masks produced & read back within a run aren't served stale. A tile whose
+  download overlapped an invalidate is returned but not cached, so tasks may
+  share the cache from several threads.
+
+  Args:
+     max_bytes: int for the total size of tiles kept in memory
+     tile_size: int for the x,y size of a tile at the MIP of the mask
+  """
+  def __init__(self, max_bytes, tile_size=512):
+    self.tile_size = tile_size
+    self.tiles = LRUCache(max_bytes, sizeof=lambda t: t.nbytes)
+    self.lock = Lock()
+    self.invalidations = 0
+
+  def get_tile(self, cv, z, mip, tx, ty):
+    """Get the tile at tile index (tx, ty), downloading it if not cached
+    """
+    k = (cv.path, z, mip, tx, ty)
+    tile = self.tiles.get(k)
+    if tile is None:
+      invalidations = self.invalidations
+      xs = tx * self.tile_size
+      ys = ty * self.tile_size
+      tile = np.asarray(cv[mip][xs:xs+self.tile_size, ys:ys+self.tile_size, z])
+      with self.lock:
+        if self.invalidations == invalidations:
+          self.tiles.put(k, tile)
+    return tile
+
+  def get(self, cv, z, x_range, y_range, mip):
+    """Assemble a mask window from cached tiles
+
+    Args:
+       cv: MiplessCloudVolume where the mask is stored
+       z: int for section index
+       x_range, y_range: tuples for the extent of the window at mip
+       mip: int for the MIP level at which the mask is stored
+
+    Returns:
+       ndarray in X,Y,Z,C order, identical to cv[mip][x_range, y_range, z]
+    """
+    ts = self.tile_size
+    xs, xe = x_range
+    ys, ye = y_range
+    out = None
+    for tx in range(xs // ts, (xe - 1) // ts + 1):
+      for ty in range(ys // ts, (ye - 1) // ts + 1):
+        tile = self.get_tile(cv, z, mip, tx, ty)
+        if out is None:
+          out = np.zeros((xe - xs, ye - ys) + tile.shape[2:], dtype=tile.dtype)
+        ixs, ixe = max(xs, tx*ts), min(xe, (tx+1)*ts)
+        iys, iye = max(ys, ty*ts), min(ye, (ty+1)*ts)
+        out[ixs-xs:ixe-xs, iys-ys:iye-ys] = tile[ixs-tx*ts:ixe-tx*ts,
+                                                 iys-ty*ts:iye-ty*ts]
+    return out
+
+  def invalidate(self, path, z=None):
+    """Drop the tiles of the volume at path, of section z or of all sections
+    """
+    with self.lock:
+      self.invalidations += 1
+      for k in self.tiles.keys():
+        if k[0] == path and (z is None or k[1] == z):
+          self.tiles.pop(k)
+
+  def stats(self):
+    return self.tiles.stats()
@@ -1,5 +1,22 @@
 from cloudvolume import CloudVolume, Storage
+from local_volume import LocalVolume, is_local_raw
+from chunk_cache import CachedVolume
+from cache import LRUCache
+from copy import deepcopy
 import json
+from threading import Lock
+
+# Backends for the CloudVolumes of every MiplessCloudVolume, set by the Aligner:
+#  local_mmap: serve raw file:// volumes with LocalVolume (--local_mmap)
+#  chunk_cache: SharedChunkCache to read remote volumes through (--shm_cache_mb)
+VOLUME_OPTIONS = {'local_mmap': False, 'chunk_cache': None}
+
+# MiplessCloudVolumes deserialized by this process, most recently used last
+REGISTRY = LRUCache(64)
+# info & provenance requests made by MiplessCloudVolume.create, and avoided
+METADATA_STATS = {'fetched': 0, 'reused': 0}
+# held to deserialize & create volumes, which tasks may do from several threads
+VOLUME_LOCK = Lock()
 
 def deserialize_miplessCV_old(s, cache={}):
     if s in cache:
@@ -24,17 +41,24 @@ def deserialize_miplessCV_old2(s, cache={}):
       cache[s] = mcv
       return mcv
 
-def deserialize_miplessCV(s, cache={}):
+def deserialize_miplessCV(s, cache=REGISTRY):
     cv_kwargs = {'bounded': False, 'progress': False,
               'autocrop': False, 'non_aligned_writes': False,
               'cdn_cache': False}
-    if s in cache:
-      return cache[s]
-    else:
-      mcv = MiplessCloudVolume(s, mkdir=False,
-                               fill_missing=True, **cv_kwargs)
-      cache[s] = mcv
-      return mcv
+    with VOLUME_LOCK:
+      mcv = cache.get(s)
+      if mcv is None:
+        mcv = MiplessCloudVolume(s, mkdir=False,
+                                 fill_missing=True, **cv_kwargs)
+        cache.put(s, mcv)
+    return mcv
+
+def registry_stats():
+    """Hits of the deserialization registry & metadata requests avoided
+    """
+    stats = REGISTRY.stats()
+    stats.update(METADATA_STATS)
+    return stats
 
 class MiplessCloudVolume():
   """Multi-mip access to CloudVolumes using the same path
@@ -44,6 +68,8 @@ class MiplessCloudVolume():
     self.mkdir = mkdir 
     self.kwargs = kwargs
     self.cvs = {}
+    # info & provenance fetched by the first mip, for the other mips
+    self.metadata = None
     if self.mkdir:
         self.store_info()
 
@@ -67,15 +93,64 @@ class MiplessCloudVolume():
 
   def create(self, mip):
     print('Creating CloudVolume for {0} at MIP{1}'.format(self.path, mip))
-    self.cvs[mip] = CloudVolume(self.path, mip=mip, **self.kwargs)
+    if 'info' in self.kwargs:
+      cv = CloudVolume(self.path, mip=mip, **self.kwargs)
+    elif self.metadata is None:
+      cv = CloudVolume(self.path, mip=mip, **self.kwargs)
+      self.metadata = (cv.info, cv.provenance.serialize())
+      METADATA_STATS['fetched'] += 2
+    else:
+      info, provenance = self.metadata
+      cv = CloudVolume(self.path, mip=mip, info=deepcopy(info), 
+                       provenance=provenance, **self.kwargs)
+      METADATA_STATS['reused'] += 2
+    vol = cv
+    if is_local_raw(cv):
+      if VOLUME_OPTIONS['local_mmap']:
+        vol = LocalVolume(cv)
+    elif (VOLUME_OPTIONS['chunk_cache'] is not None and 
+          not self.path.startswith('file://') and 'sharding' not in cv.scale):
+      vol = CachedVolume(cv, VOLUME_OPTIONS['chunk_cache'])
+    # set once, so that threads reading cvs without the lock see the final volume
+    self.cvs[mip] = vol
     #if self.mkdir:
     #  self.cvs[mip].commit_info()
     #  self.cvs[mip].commit_provenance()
 
   def __getitem__(self, mip):
     if mip not in self.cvs:
-      self.create(mip)
+      with VOLUME_LOCK:
+        if mip not in self.cvs:
+          self.create(mip)
     return self.cvs[mip]
+
+  def chunk_names(self, mip, x_range, y_range, z_range):
+    """List the names of the stored chunks that intersect a region
+
+    Args:
+       mip: int for MIP level of the region
+       x_range, y_range, z_range: tuples for the extent of the region at mip
+
+    Returns:
+       list of chunk file names, relative to self.path, for the chunks that
+       lie within the bounds of the volume
+    """
+    cv = self[mip]
+    lo = cv.bounds.minpt
+    hi = cv.bounds.maxpt
+    names = []
+    ranges = []
+    for (start, stop), c, o, l, h in zip([x_range, y_range, z_range],
+                                         cv.chunk_size, cv.voxel_offset, lo, hi):
+      start = max(start, l)
+      stop = min(stop, h)
+      start = o + ((start - o) // c) * c
+      ranges.append([(s, min(s + c, h)) for s in range(start, stop, c)])
+    for xs, xe in ranges[0]:
+      for ys, ye in ranges[1]:
+        for zs, ze in ranges[2]:
+          names.append('{}/{}-{}_{}-{}_{}-{}'.format(cv.key, xs, xe, ys, ye, zs, ze))
+    return names
  
   def __repr__(self):
     return self.path
@@ -0,0 +1,72 @@
+from concurrent.futures import Future
+from queue import Queue
+from threading import Thread, current_thread
+from time import time
+
+class ComputeThread():
+  """Single thread that runs the model calls of concurrent tasks in turn
+
+  Tasks run in I/O threads, which download & preprocess their inputs, then
+  hand the model call to this thread & wait for it, then postprocess &
+  upload the result while the model runs for other tasks. Tasks whose device
+  work isn't a single model call run here whole (see tasks.execute). The
+  queue is bounded, so I/O threads block instead of holding more inputs in
+  memory than the model can consume.
+
+  Args:
+     maxsize: int for the no. of model calls that may wait for the thread
+     lock: optional semaphore held around each call, e.g. the gpu_lock that
+      is shared with other worker processes
+  """
+  def __init__(self, maxsize=2, lock=None):
+    self.queue = Queue(maxsize)
+    self.lock = lock
+    self.calls = 0
+    self.busy = 0.
+    self.start = time()
+    self.thread = Thread(target=self._loop, daemon=True)
+    self.thread.start()
+
+  def _loop(self):
+    while True:
+      fn, future = self.queue.get()
+      if not future.set_running_or_notify_cancel():
+        continue
+      start = time()
+      try:
+        if self.lock is not None:
+          with self.lock:
+            result = fn()
+        else:
+          result = fn()
+      except BaseException as e:
+        future.set_exception(e)
+      else:
+        future.set_result(result)
+      self.busy += time() - start
+      self.calls += 1
+
+  def submit(self, fn):
+    """Queue fn, blocking while the queue is full
+
+    Returns:
+       concurrent.futures.Future of the result of fn
+    """
+    future = Future()
+    self.queue.put((fn, future))
+    return future
+
+  def run(self, fn):
+    """Call fn on the compute thread & return its result
+
+    A call from the compute thread itself, e.g. a model call of a task that
+    runs there whole, is made directly.
+    """
+    if current_thread() is self.thread:
+      return fn()
+    return self.submit(fn).result()
+
+  def stats(self):
+    elapsed = time() - self.start
+    return {'calls': self.calls, 'busy': self.busy, 'waiting': self.queue.qsize(),
+            'utilization': self.busy / elapsed if elapsed else 0.}
@@ -0,0 +1,154 @@
+from contextlib import contextmanager
+import copy
+
+import torch
+import torch.nn as nn
+
+PRECISIONS = {'float32': None, 'bf16': torch.bfloat16, 'fp16': torch.float16,
+              'int8': torch.qint8}
+
+@contextmanager
+def autocast(precision, device):
+  """Run the ops of the enclosed block at a reduced precision on device
+  """
+  dtype = PRECISIONS[precision]
+  if dtype is None or dtype == torch.qint8:
+    yield
+  elif hasattr(torch, 'autocast'):
+    with torch.autocast(device_type=device.type, dtype=dtype):
+      yield
+  elif device.type == 'cuda' and dtype == torch.float16:
+    with torch.cuda.amp.autocast():
+      yield
+  else:
+    raise ValueError('{} on {} needs a newer version of torch'.format(precision,
+                                                                      device))
+
+def quantize(model):
+  """Copy of model with int8 weights in its Conv2d & Linear layers
+
+  Activations are quantized per call (dynamic quantization), so no
+  calibration is needed. torch only maps Linear layers by default, so the
+  conv mapping is passed explicitly.
+  """
+  try:
+    from torch.ao.quantization import quantize_dynamic, default_dynamic_qconfig
+    import torch.ao.nn.quantized.dynamic as nnqd
+  except ImportError:
+    raise ValueError('int8 needs torch.ao.nn.quantized.dynamic.Conv2d, from a '
+                     'newer version of torch')
+  if not isinstance(model, nn.Module) or isinstance(model, torch.jit.ScriptModule):
+    raise ValueError('int8 needs an eager nn.Module, not {}'.format(
+                     type(model).__name__))
+  return quantize_dynamic(copy.deepcopy(model),
+                          qconfig_spec={nn.Conv2d: default_dynamic_qconfig,
+                                        nn.Linear: default_dynamic_qconfig},
+                          mapping={nn.Conv2d: nnqd.Conv2d,
+                                   nn.Linear: nnqd.Linear})
+
+def load_samples(path):
+  """Held-out (src, tgt) image pairs saved with torch.save, for validation
+  """
+  if not path:
+    return []
+  return [(src, tgt) for src, tgt in torch.load(path, map_location='cpu')]
+
+def call_model(model, src, tgt):
+  return model(src, tgt)
+
+class PrecisionGuard():
+  """Run models at a reduced precision once they match float32 on samples
+
+  Before its first use, each model runs on every sample at both precisions.
+  If the error of any sample exceeds max_error, the model keeps running in
+  float32; otherwise every call runs at precision. The samples are held out
+  from the chunks being processed, so the validation doesn't depend on where
+  a run starts.
+
+  bf16 & fp16 run the model under autocast. int8 runs a dynamically quantized
+  copy of the model (see quantize), which torch only supports on CPU.
+
+  Args:
+     precision: str key of PRECISIONS
+     device: torch.device the models run on
+     max_error: float for the largest error allowed, in the units of error_fn
+     samples: list of (src, tgt) input pairs, from load_samples
+  """
+  def __init__(self, precision, device, max_error, samples=()):
+    self.precision = precision
+    self.device = device
+    self.max_error = max_error
+    self.samples = samples
+    self.models = {}
+    self.quantized = {}
+    if PRECISIONS[precision] is not None and len(samples) == 0:
+      raise ValueError('{} needs held-out samples to validate models '
+                       'on'.format(precision))
+    if precision == 'int8' and device.type != 'cpu':
+      raise ValueError('int8 dynamic quantization only runs on CPU')
+
+  def reduced(self, model_path, model):
+    """The model to run at precision, for model_path
+    """
+    if self.precision != 'int8':
+      return model
+    if model_path not in self.quantized:
+      self.quantized[model_path] = quantize(model)
+    return self.quantized[model_path]
+
+  def run_reduced(self, model_path, model, src, tgt, call):
+    with autocast(self.precision, self.device):
+      return call(self.reduced(model_path, model), src, tgt).float()
+
+  def validate(self, model_path, model, error_fn, call):
+    """Compare the precisions of a model on the samples, & keep the result
+    """
+    state = {'error': 0., 'enabled': True}
+    try:
+      self.reduced(model_path, model)
+    except ValueError as e:
+      print('{} unavailable for {}: {}'.format(self.precision, model_path, e),
+            flush=True)
+      state['enabled'] = False
+      self.models[model_path] = state
+      return state
+    for src, tgt in self.samples:
+      src, tgt = src.to(device=self.device), tgt.to(device=self.device)
+      reference = call(model, src, tgt)
+      reduced = self.run_reduced(model_path, model, src, tgt, call)
+      state['error'] = max(state['error'], float(error_fn(reference, reduced)))
+    if state['error'] > self.max_error:
+      state['enabled'] = False
+      print('{} differs from float32 by {:.3f} for {}; staying in float32'.format(
+            self.precision, state['error'], model_path), flush=True)
+    else:
+      print('{} enabled for {}; max error {:.3f}'.format(
+            self.precision, model_path, state['error']), flush=True)
+    return state
+
+  def run(self, model_path, model, src, tgt, error_fn, call=call_model):
+    """Run a model at the precision validated for model_path
+
+    Args:
+       model_path: str that identifies the model
+       model: callable of (src, tgt)
+       src, tgt: inputs of the model
+       error_fn: callable of the float32 & reduced outputs that returns the
+         error between them
+       call: callable of (model, src, tgt) that runs the model & returns its
+         output, e.g. in tiles
+
+    Returns:
+       float32 output of the model
+    """
+    if PRECISIONS[self.precision] is None:
+      return call(model, src, tgt)
+    state = self.models.get(model_path, None)
+    if state is None:
+      state = self.validate(model_path, model, error_fn, call)
+    if not state['enabled']:
+      return call(model, src, tgt)
+    return self.run_reduced(model_path, model, src, tgt, call)
+
+  def stats(self):
+    return self.models
@@ -0,0 +1,91 @@
+import base64
+import json
+from os.path import join
+
+import numpy as np
+from cloudvolume import Storage
+
+def progress_prefix(stage, z, mip):
+  return join('progress', stage, '{}_{}'.format(mip, z))
+
+def chunk_key(bbox, mip):
+  x_range = bbox.x_range(mip=mip)
+  y_range = bbox.y_range(mip=mip)
+  return '{}-{}_{}-{}'.format(int(x_range[0]), int(x_range[1]),
+                              int(y_range[0]), int(y_range[1]))
+
+def parse_key(key):
+  x, y = key.split('_')
+  xs, xe = map(int, x.split('-'))
+  ys, ye = map(int, y.split('-'))
+  return xs, xe, ys, ye
+
+def encode_bitmap(keys):
+  """Pack a set of chunk keys on a common grid into a bitmap
+
+  Returns:
+     dict with the grid origin, chunk size & shape, and the base64 encoded bits
+  """
+  chunks = [parse_key(k) for k in keys]
+  x0 = min(c[0] for c in chunks)
+  y0 = min(c[2] for c in chunks)
+  cx = chunks[0][1] - chunks[0][0]
+  cy = chunks[0][3] - chunks[0][2]
+  nx = (max(c[0] for c in chunks) - x0) // cx + 1
+  ny = (max(c[2] for c in chunks) - y0) // cy + 1
+  bits = np.zeros((nx, ny), dtype=bool)
+  for xs, _, ys, _ in chunks:
+    bits[(xs - x0) // cx, (ys - y0) // cy] = True
+  return {'origin': [x0, y0], 'chunk_size': [cx, cy], 'shape': [nx, ny],
+          'bits': base64.b64encode(np.packbits(bits).tobytes()).decode('ascii')}
+
+def decode_bitmap(bitmap):
+  x0, y0 = bitmap['origin']
+  cx, cy = bitmap['chunk_size']
+  nx, ny = bitmap['shape']
+  bits = np.frombuffer(base64.b64decode(bitmap['bits']), dtype=np.uint8)
+  bits = np.unpackbits(bits)[:nx*ny].reshape(nx, ny)
+  keys = set()
+  for i, j in zip(*np.nonzero(bits)):
+    xs = x0 + int(i)*cx
+    ys = y0 + int(j)*cy
+    keys.add('{}-{}_{}-{}'.format(xs, xs + cx, ys, ys + cy))
+  return keys
+
+def record_chunk(stage, path, z, bbox, mip):
+  """Mark that a task of stage wrote the chunk bbox of section z to path
+
+  Each marker is a separate, empty file, so that concurrent workers never
+  modify the same file. finished_chunks compacts them into a bitmap.
+  """
+  with Storage(path) as stor:
+    stor.put_file(join(progress_prefix(stage, z, mip), chunk_key(bbox, mip)), b'')
+
+def finished_chunks(stage, path, z, mip):
+  """Get the keys of chunks of section z in path that stage has finished
+
+  Markers written since the last call are merged into the bitmap stored at
+  progress/<stage>/<mip>_<z>.bitmap, then deleted.
+  """
+  prefix = progress_prefix(stage, z, mip)
+  with Storage(path) as stor:
+    keys = set()
+    bitmap = stor.get_file(prefix + '.bitmap')
+    if bitmap is not None:
+      keys = decode_bitmap(json.loads(bitmap.decode('utf-8')))
+    markers = list(stor.list_files(prefix=prefix + '/'))
+    if len(markers) > 0:
+      keys |= set(m.split('/')[-1] for m in markers)
+      stor.put_file(prefix + '.bitmap', json.dumps(encode_bitmap(keys)),
+                    content_type='application/json')
+      stor.delete_files(markers)
+  return keys
+
+def unfinished_chunks(stage, path, z, chunks, mip):
+  """Filter chunks to those that stage has not finished for section z in path
+  """
+  done = finished_chunks(stage, path, z, mip)
+  remaining = [c for c in chunks if chunk_key(c, mip) not in done]
+  print('{} of {} chunks for {} z={} in {} already finished'.format(
+        len(chunks) - len(remaining), len(chunks), stage, z, path), flush=True)
+  return remaining
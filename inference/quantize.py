@@ -0,0 +1,48 @@
+import numpy as np
+import torch
+
+# MIP0 px residuals are stored as int16 in units of 1/4 px
+FIELD_SCALE = 4
+INT16_MIN = -2**15
+INT16_MAX = 2**15 - 1
+
+def quantize_field(field, scale=FIELD_SCALE, out=None, rows=256):
+  """Clip, scale & cast a vector field to int16 in CloudVolume storage order
+
+  A torch field is quantized on its device, so that only the int16 field is
+  copied to the host. An ndarray field is quantized in slabs of rows, so
+  that the float temporaries stay small, directly into out.
+
+  Args:
+     field: ndarray or tensor in (Z,Y,X,2) order with MIP0 px residuals
+     scale: float for the no. of int16 steps per MIP0 px
+     out: int16 ndarray of shape (Y,X,Z,2) to write into, or None to allocate
+     rows: int for the no. of rows per slab of an ndarray field
+
+  Returns:
+     int16 ndarray in (Y,X,Z,2) order, and the no. of vectors that were clipped
+  """
+  lo, hi = INT16_MIN / scale, INT16_MAX / scale
+  if torch.is_tensor(field):
+    field = field.detach()
+    clipped = int(((field < lo) | (field > hi)).any(dim=-1).sum())
+    q = field.mul(scale).clamp_(INT16_MIN, INT16_MAX).to(torch.int16)
+    q = q.permute(1,2,0,3)
+    if out is None:
+      return q.cpu().numpy(), clipped
+    torch.from_numpy(out).copy_(q)
+    return out, clipped
+  z, y, x, c = field.shape
+  if out is None:
+    out = np.empty((y, x, z, c), dtype=np.int16, order='F')
+  clipped = 0
+  buf = np.empty((z, min(rows, y), x, c), dtype=np.float32)
+  for s in range(0, y, rows):
+    e = min(s + rows, y)
+    slab = buf[:, :e-s]
+    np.multiply(field[:, s:e], scale, out=slab)
+    clipped += int(np.count_nonzero(((slab < INT16_MIN) |
+                                     (slab > INT16_MAX)).any(axis=-1)))
+    np.clip(slab, INT16_MIN, INT16_MAX, out=slab)
+    np.copyto(out[s:e], np.transpose(slab, (1,2,0,3)), casting='unsafe')
+  return out, clipped
@@ -0,0 +1,140 @@
+import hashlib
+import json
+from pathlib import Path
+
+from cloudvolume import Storage
+from etags import chunk_etags
+from utilities.archive import ModelArchive
+
+MODEL_HASHES = {}
+
+def hash_model(model_path):
+  """md5 of the files of a ModelArchive that determine its output
+  """
+  if model_path not in MODEL_HASHES:
+    export_info = Path(model_path) / 'export.json'
+    if export_info.exists():
+      # a standalone TorchScript export records the md5 of its archive
+      MODEL_HASHES[model_path] = json.loads(export_info.read_text())['md5']
+      return MODEL_HASHES[model_path]
+    _, directory = ModelArchive._resolve_model(Path(model_path).stem)
+    md5 = hashlib.md5()
+    for name in ['architecture.py', 'preprocessor.py', 'weights.pt']:
+      path = directory / name
+      if path.exists():
+        md5.update(path.read_bytes())
+    MODEL_HASHES[model_path] = md5.hexdigest()
+  return MODEL_HASHES[model_path]
+
+def region_chunk_names(cv, z, bbox, mip):
+  x_range = [int(x) for x in bbox.x_range(mip=mip)]
+  y_range = [int(y) for y in bbox.y_range(mip=mip)]
+  return cv.chunk_names(mip, x_range, y_range, (z, z+1))
+
+def xy_key(name):
+  """Chunk name without its key & z range, e.g. '0-1024_0-1024'
+  """
+  return name.split('/')[-1].rsplit('_', 1)[0]
+
+class ResultCache():
+  """Content-addressed manifest of task outputs
+
+  A task's fingerprint hashes its type, the models it runs, the ETags of the
+  stored chunks it reads (see chunk_etags), and its remaining parameters. The
+  manifest maps each fingerprint to the chunks a finished task wrote & their
+  ETags. A task whose fingerprint is in the manifest is skipped if its output
+  is still unchanged, or satisfied by copying the recorded chunks to its
+  destination if they are unchanged where they were written.
+
+  Args:
+     path: str for the CloudVolume-style path where manifests are stored,
+      e.g. gs://bucket/result_cache or file:///tmp/result_cache
+  """
+  def __init__(self, path):
+    self.path = path
+
+  def fingerprint(self, task_name, regions, models=[], params=[]):
+    """Compute the fingerprint of a task
+
+    Args:
+       task_name: str for the type of the task
+       regions: list of (MiplessCloudVolume, z, BoundingBox, mip) that the task
+        reads
+       models: list of str for model paths the task runs
+       params: JSON-serializable list of parameters that affect the output
+    """
+    inputs = []
+    for cv, z, bbox, mip in regions:
+      etags = chunk_etags(cv.path, region_chunk_names(cv, z, bbox, mip))
+      for name in sorted(etags):
+        inputs.append([cv.path, name, etags[name]])
+    contents = {'task': task_name,
+                'models': [hash_model(m) for m in models],
+                'inputs': inputs,
+                'params': params}
+    s = json.dumps(contents, sort_keys=True, default=str)
+    return hashlib.sha256(s.encode('utf-8')).hexdigest()
+
+  def record(self, fingerprint, cv, z, bbox, mip):
+    """Record the chunks written for a finished task
+    """
+    info = cv[mip].info
+    files = region_chunk_names(cv, z, bbox, mip)
+    etags = chunk_etags(cv.path, files)
+    manifest = {'path': cv.path,
+                'z': z,
+                'mip': mip,
+                'data_type': info['data_type'],
+                'num_channels': info['num_channels'],
+                'encoding': cv[mip].encoding,
+                'files': files,
+                'etags': [etags[f] for f in files]}
+    with Storage(self.path) as stor:
+      stor.put_file(fingerprint, json.dumps(manifest),
+                    content_type='application/json')
+
+  def satisfy(self, fingerprint, cv, z, bbox, mip):
+    """Try to satisfy a task from the manifest
+
+    Returns:
+       True if the output of the task is already in place, either because it
+       is unchanged since it was recorded or because the recorded chunks were
+       copied there
+    """
+    with Storage(self.path) as stor:
+      manifest = stor.get_file(fingerprint)
+    if manifest is None:
+      return False
+    manifest = json.loads(manifest.decode('utf-8'))
+    # chunks overwritten since they were recorded no longer hold the result
+    recorded = manifest.get('etags', None)
+    etags = chunk_etags(manifest['path'], manifest['files'])
+    if (recorded is None or any(e is None for e in recorded)
+        or [etags[f] for f in manifest['files']] != recorded):
+      print('Recorded result in {} has changed since'.format(manifest['path']))
+      return False
+    dst_files = region_chunk_names(cv, z, bbox, mip)
+    if manifest['path'] == cv.path and manifest['files'] == dst_files:
+      return True
+
+    # the recorded chunks must be laid out & encoded like the destination
+    info = cv[mip].info
+    if (manifest['mip'] != mip
+        or manifest['data_type'] != info['data_type']
+        or manifest['num_channels'] != info['num_channels']
+        or manifest['encoding'] != cv[mip].encoding
+        or [xy_key(f) for f in manifest['files']] != [xy_key(f) for f in dst_files]):
+      return False
+    with Storage(manifest['path']) as stor:
+      files = stor.get_files(manifest['files'])
+    if any(f['content'] is None for f in files):
+      return False
+    contents = {f['filename']: f['content'] for f in files}
+    compress = 'gzip' if cv[mip].encoding in ('raw', 'compressed_segmentation') \
+                      else None
+    with Storage(cv.path) as stor:
+      stor.put_files([(dst, contents[src])
+                      for src, dst in zip(manifest['files'], dst_files)],
+                      compress=compress)
+    print('Copied {} chunks from {}'.format(len(dst_files), manifest['path']))
+    return True
@@ -0,0 +1,63 @@
+import gevent.monkey
+gevent.monkey.patch_all()
+
+from taskqueue import GreenTaskQueue, LocalTaskQueue, MockTaskQueue
+
+from time import time
+from args import get_argparser, parse_args, get_aligner, get_bbox, get_provenance
+from cloudmanager import CloudManager
+
+if __name__ == '__main__':
+  parser = get_argparser()
+  parser.add_argument('--src_path', type=str,
+    help='CloudVolume path of a finished, unsharded volume to pack. This is '
+         'an offline repack: every chunk is read & written once more, and '
+         'the pipeline still writes one object per chunk while it runs')
+  parser.add_argument('--dst_path', type=str,
+    help='CloudVolume path of the sharded volume to create')
+  parser.add_argument('--data_type', type=str, default='uint8')
+  parser.add_argument('--num_channels', type=int, default=1)
+  parser.add_argument('--mip', type=int)
+  parser.add_argument('--bbox_start', nargs=3, type=int,
+    help='bbox origin, 3-element int list')
+  parser.add_argument('--bbox_stop', nargs=3, type=int,
+    help='bbox origin+shape, 3-element int list')
+  parser.add_argument('--bbox_mip', type=int, default=0,
+    help='MIP level at which bbox_start & bbox_stop are specified')
+  parser.add_argument('--max_mip', type=int, default=9)
+  parser.add_argument('--preshift_bits', type=int, default=9,
+    help='each minishard holds 2^preshift_bits chunks')
+  parser.add_argument('--minishard_bits', type=int, default=6,
+    help='each shard holds 2^minishard_bits minishards')
+  args = parse_args(parser)
+  a = get_aligner(args)
+  bbox = get_bbox(args)
+  provenance = get_provenance(args)
+  mip = args.mip
+
+  # The src info already holds the padded layout of the pipeline outputs
+  cm = CloudManager(args.src_path, args.max_mip, 0, provenance, create_info=False)
+  src = cm.create(args.src_path, data_type=args.data_type, 
+                  num_channels=args.num_channels, fill_missing=True, 
+                  overwrite=False)
+  dst = cm.create(args.dst_path, data_type=args.data_type,
+                  num_channels=args.num_channels, fill_missing=True, 
+                  overwrite=True, sharding=(args.preshift_bits, args.minishard_bits),
+                  shard_mips=[mip])
+
+  z_range = range(args.bbox_start[2], args.bbox_stop[2])
+  start = time()
+  ptask = a.shard(cm, src.path, dst.path, z_range, bbox, mip)
+  print('Packing {} shards'.format(len(ptask)))
+  if args.dry_run:
+    tq = MockTaskQueue(parallel=1)
+    tq.insert_all(ptask, args=[a])
+  elif a.distributed:
+    with GreenTaskQueue(queue_name=args.queue_name) as tq:
+      tq.insert_all(ptask)
+    a.wait_for_sqs_empty()
+  else:
+    tq = LocalTaskQueue(parallel=1)
+    tq.insert_all(ptask, args=[a])
+  end = time()
+  print('Packing shards use time: {}'.format(end - start))
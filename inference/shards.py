@@ -0,0 +1,132 @@
+from math import ceil, log2
+from os.path import join
+
+import numpy as np
+from cloudvolume import Storage
+from cloudvolume import chunks
+from cloudvolume.exceptions import EmptyVolumeException
+from cloudvolume.lib import Bbox, Vec
+from cloudvolume.datasource.precomputed.sharding import ShardingSpecification, \
+                                                       synthesize_shard_files
+from cloudvolume.datasource.precomputed.image.common import compressed_morton_code
+
+def grid_size(scale):
+  """Number of chunks along x,y,z of a scale in an info file
+  """
+  return [int(ceil(s / c)) for s, c in zip(scale['size'], scale['chunk_sizes'][0])]
+
+def morton_bits(grid):
+  """Per bit of a compressed morton code, the dimension it encodes
+  """
+  num_bits = int(max([ceil(log2(size)) for size in grid]))
+  bits = []
+  for i in range(num_bits):
+    for dim in range(3):
+      if 2**i <= grid[dim]:
+        bits.append((dim, i))
+  return bits
+
+def morton_to_gridpoint(code, grid):
+  """Inverse of cloudvolume's compressed_morton_code
+  """
+  gridpt = [0, 0, 0]
+  for j, (dim, i) in enumerate(morton_bits(grid)):
+    gridpt[dim] |= ((code >> j) & 1) << i
+  return Vec(*gridpt)
+
+def sharding_spec(scale, preshift_bits, minishard_bits):
+  """Sharding specification in which every shard is a morton-aligned block of
+  2**(preshift_bits + minishard_bits) chunks
+
+  The shard bits cover the rest of the morton code, so that no two blocks
+  share a shard file & a task can write each shard on its own.
+  """
+  total_bits = len(morton_bits(grid_size(scale)))
+  shard_bits = max(0, total_bits - preshift_bits - minishard_bits)
+  data_encoding = 'gzip' if scale['encoding'] == 'raw' else 'raw'
+  return {'@type': 'neuroglancer_uint64_sharded_v1',
+          'preshift_bits': preshift_bits,
+          'hash': 'identity',
+          'minishard_bits': minishard_bits,
+          'shard_bits': shard_bits,
+          'minishard_index_encoding': 'gzip',
+          'data_encoding': data_encoding}
+
+def chunk_bbox(cv, gridpt):
+  bounds = cv.bounds
+  chunk_size = Vec(*cv.chunk_size)
+  minpt = bounds.minpt + gridpt * chunk_size
+  return Bbox(minpt, Vec(*np.minimum(minpt + chunk_size, bounds.maxpt)))
+
+def shard_numbers(cv, x_range, y_range, z_range):
+  """List the shards of a sharded CloudVolume that hold any chunk in a region
+  """
+  spec = ShardingSpecification.from_dict(cv.scale['sharding'])
+  grid = grid_size(cv.scale)
+  bounds = cv.bounds
+  chunk_size = cv.chunk_size
+  ranges = []
+  for (s, e), c, o in zip([x_range, y_range, z_range], chunk_size, bounds.minpt):
+    ranges.append(range(max(0, (s - o) // c), int(ceil((e - o) / c))))
+  shards = set()
+  for x in ranges[0]:
+    for y in ranges[1]:
+      for z in ranges[2]:
+        code = compressed_morton_code((x, y, z), grid)
+        shards.add(spec.compute_shard_location(code).shard_number)
+  return sorted(shards)
+
+def pack_shard(src_cv, dst_cv, shard_number):
+  """Read every chunk of a shard from an unsharded volume & write the shard file
+
+  The chunks are fetched with one batched Storage.get_files call when src_cv
+  uses the chunk grid of dst_cv, or else cut out one at a time.
+
+  Args:
+     src_cv: CloudVolume at the MIP of the shard, with the data to pack
+     dst_cv: CloudVolume at the same MIP, with a sharded scale
+
+  Returns:
+     int for the no. of non-empty chunks written to the shard
+  """
+  spec = ShardingSpecification.from_dict(dst_cv.scale['sharding'])
+  grid = grid_size(dst_cv.scale)
+  block_bits = int(spec.preshift_bits + spec.minishard_bits)
+  total_bits = len(morton_bits(grid))
+  first = int(shard_number, 16) << block_bits
+  last = min(first + 2**block_bits, 2**total_bits)
+  bboxes = {}
+  for code in range(first, last):
+    gridpt = morton_to_gridpoint(code, grid)
+    if any(g >= s for g, s in zip(gridpt, grid)):
+      continue
+    bboxes[code] = chunk_bbox(dst_cv, gridpt)
+  same_grid = (tuple(src_cv.chunk_size) == tuple(dst_cv.chunk_size) and
+               src_cv.bounds == dst_cv.bounds)
+  if same_grid:
+    names = {code: join(src_cv.key, bbox.to_filename())
+             for code, bbox in bboxes.items()}
+    with Storage(src_cv.layer_cloudpath) as stor:
+      files = {f['filename']: f for f in stor.get_files(list(names.values()))}
+  data = {}
+  for code, bbox in bboxes.items():
+    if same_grid:
+      f = files[names[code]]
+      if f['error'] is not None:
+        raise f['error']
+      if not f['content'] and not src_cv.fill_missing:
+        raise EmptyVolumeException(bbox)
+      shape = list(bbox.size3()) + [src_cv.num_channels]
+      img = chunks.decode(f['content'], src_cv.encoding, shape=shape,
+                          dtype=src_cv.dtype)
+    else:
+      img = np.asarray(src_cv[bbox.to_slices()])
+    if not np.any(img):
+      continue
+    data[code] = chunks.encode(img, dst_cv.encoding)
+  if len(data) > 0:
+    files = synthesize_shard_files(spec, data)
+    with Storage(dst_cv.layer_cloudpath) as stor:
+      stor.put_files([(join(dst_cv.key, f), content) for f, content in files.items()],
+                     content_type='application/octet-stream')
+  return len(data)
@@ -0,0 +1,72 @@
+import copy
+from pathlib import Path
+
+import torch
+
+from utilities.archive import ModelArchive
+from export_model import load_exported
+
+# Models loaded by the parent of forked workers, by model path
+SHARED_ARCHIVES = {}
+
+class SharedArchive():
+  """Model & preprocessor of an archive, loaded on CPU with shared weights
+  """
+  def __init__(self, archive, channels_last=False):
+    self.model = archive.model
+    self.preprocessor = archive.preprocessor
+    if channels_last and isinstance(self.model, torch.nn.Module):
+      self.model.to(memory_format=torch.channels_last)
+    for module in [self.model, self.preprocessor]:
+      if isinstance(module, torch.nn.Module):
+        module.eval()
+        module.requires_grad_(False)
+      if hasattr(module, 'share_memory'):
+        module.share_memory()
+
+  def to(self, device):
+    """Copy of the archive with its modules on device, owned by the caller
+
+    The tensors are copied straight to the device, so the shared host copy
+    is neither duplicated nor moved, & the device copy is freed as soon as
+    the caller drops it.
+    """
+    archive = copy.copy(self)
+    for name in ['model', 'preprocessor']:
+      module = getattr(self, name)
+      if isinstance(module, torch.nn.Module):
+        memo = {}
+        for p in module.parameters():
+          memo[id(p)] = torch.nn.Parameter(p.to(device),
+                                           requires_grad=p.requires_grad)
+        for b in module.buffers():
+          memo[id(b)] = b.to(device)
+        setattr(archive, name, copy.deepcopy(module, memo).to(device))
+    return archive
+
+def share_models(model_paths, channels_last=False):
+  """Load models into shared memory before forking worker processes
+
+  Children forked afterwards find them with shared_archive instead of
+  reading & importing the archives again.
+  """
+  for model_path in model_paths:
+    if model_path in SHARED_ARCHIVES:
+      continue
+    print('Sharing model {}'.format(model_path), flush=True)
+    archive = load_exported(model_path, 'cpu')
+    if archive is None:
+      archive = ModelArchive(Path(model_path).stem, device='cpu')
+    SHARED_ARCHIVES[model_path] = SharedArchive(archive, channels_last)
+
+def shared_archive(model_path, device):
+  """Archive of a model shared by the parent process, on device, or None
+
+  On CPU the shared archive itself is returned. On another device it is a
+  copy (see SharedArchive.to), so that evicting it from a model cache frees
+  its device memory, & the shared host copy stays in place for later loads.
+  """
+  archive = SHARED_ARCHIVES.get(model_path, None)
+  if archive is None or device.type == 'cpu':
+    return archive
+  return archive.to(device)
@@ -0,0 +1,57 @@
+from threading import Lock
+
+import numpy as np
+import torch
+
+class PinnedStager():
+  """Copy host arrays to a CUDA device through reused pinned buffers
+
+  Arrays keep their dtype (e.g. uint8 images) across PCIe, and the copy to
+  the device is non_blocking. A buffer is only handed out again once the
+  event recorded after its transfer has completed, so concurrent loaders each
+  get their own buffer. Buffers are kept per no. of bytes, up to max_buffers
+  per size.
+
+  Args:
+     device: torch.device to upload to
+     max_buffers: int for the no. of idle buffers kept per size
+  """
+  def __init__(self, device, max_buffers=4):
+    self.device = device
+    self.max_buffers = max_buffers
+    self.free = {}
+    self.lock = Lock()
+    self.allocations = 0
+    self.reuses = 0
+
+  def acquire(self, nbytes):
+    with self.lock:
+      buffers = self.free.get(nbytes, [])
+      for i, (buf, event) in enumerate(buffers):
+        if event is None or event.query():
+          self.reuses += 1
+          return buffers.pop(i)[0]
+      self.allocations += 1
+    return torch.empty(nbytes, dtype=torch.uint8).pin_memory()
+
+  def release(self, buf, event):
+    with self.lock:
+      buffers = self.free.setdefault(buf.numel(), [])
+      if len(buffers) < self.max_buffers:
+        buffers.append((buf, event))
+
+  def upload(self, array):
+    """Copy an ndarray of any layout to a contiguous tensor on the device
+    """
+    array = np.asarray(array)
+    buf = self.acquire(array.nbytes)
+    staged = buf.numpy().view(array.dtype).reshape(array.shape)
+    np.copyto(staged, array)
+    tensor = torch.from_numpy(staged).to(device=self.device, non_blocking=True)
+    event = torch.cuda.Event()
+    event.record()
+    self.release(buf, event)
+    return tensor
+
+  def stats(self):
+    return {'allocations': self.allocations, 'reuses': self.reuses}
@@ -1,4 +1,3 @@
-import boto3
 from time import time
 import torch
 from torch.nn.functional import conv2d
@@ -13,8 +12,9 @@ from mipless_cloudvolume import deserialize_miplessCV as DCV
 from cloudvolume import Storage
 from cloudvolume.lib import scatter 
 from boundingbox import BoundingBox, deserialize_bbox
+from progress import record_chunk, chunk_key, parse_key, encode_bitmap, \
+                     decode_bitmap
 from fcorr import fcorr_conjunction
-from scipy import ndimage
 
 from taskqueue import RegisteredTask, TaskQueue, LocalTaskQueue, GreenTaskQueue
 from concurrent.futures import ProcessPoolExecutor
@@ -39,6 +39,7 @@ def green_upload(ptask, aligner):
 
 def run(aligner, tasks): 
   if aligner.distributed:
+    tasks = batch_tasks(tasks, aligner.chunks_per_task)
     tasks = scatter(tasks, aligner.threads)
     fn = partial(remote_upload, aligner.queue_name)
     with ProcessPoolExecutor(max_workers=aligner.threads) as executor:
@@ -47,6 +48,119 @@ def run(aligner, tasks):
     with LocalTaskQueue(queue_name=aligner.queue_name, parallel=1) as tq:
       for task in tasks:
         tq.insert(task, args=[ aligner ])
+    aligner.flush_writes()
+
+# tasks that run a model or warp on the device, which a worker runs one at a
+# time, on its compute thread if it has one; tasks of other classes may run
+# task_threads at a time
+DEVICE_TASKS = {'ComputeFieldTask', 'PredictImageTask', 'RenderTask', 
+                'VectorVoteTask', 'CloudComposeTask', 'CloudMultiComposeTask',
+                'BatchRenderTask', 'RenderCVTask', 'RenderLowMipTask', 
+                'ResAndComposeTask', 'UpsampleRenderRechunkTask', 'CPCTask',
+                'ComputeFcorrTask', 'FcorrMaskTask', 'InvertFieldTask', 
+                'RegularizeTask', 'ComputeSmoothness'}
+
+def execute(task, aligner):
+  """Execute a task, with its device work on aligner.compute if there is one
+
+  ComputeFieldTask hands only its model call to the compute thread, so that
+  its downloads & uploads overlap the model calls of other tasks. The other
+  device tasks run on the compute thread whole, so that a pipelined worker
+  runs all of its device work on one thread.
+  """
+  name = task.task if isinstance(task, ChunkBatchTask) else task.__class__.__name__
+  if (aligner.compute is None or name not in DEVICE_TASKS 
+      or name == 'ComputeFieldTask'):
+    return task.execute(aligner)
+  return aligner.compute.run(partial(task.execute, aligner))
+
+def task_threads(task, default):
+  """No. of tasks of the class of task that a worker may run at once
+  """
+  name = task.task if isinstance(task, ChunkBatchTask) else task.__class__.__name__
+  return 1 if name in DEVICE_TASKS else default
+
+# names of the chunk BoundingBox argument that batch_tasks looks for
+BBOX_ARGS = ['patch_bbox', 'bbox']
+
+def batch_tasks(tasks, chunks_per_task):
+  """Group single-chunk tasks into ChunkBatchTasks of up to chunks_per_task
+
+  Tasks are grouped when they're of the same class & all their arguments but
+  the chunk match, and their chunks lie on the same grid. Tasks without a
+  chunk argument are returned as they are.
+
+  Returns:
+     list of tasks
+  """
+  if chunks_per_task <= 1:
+    return list(tasks)
+  batched = []
+  groups = {}
+  for task in tasks:
+    bbox_arg = next((k for k in BBOX_ARGS if k in task._arg_names), None)
+    if bbox_arg is None or isinstance(task, ChunkBatchTask):
+      batched.append(task)
+      continue
+    params = task.payload()
+    name = params.pop('class')
+    bbox = deserialize_bbox(params.pop(bbox_arg))
+    xs, xe, ys, ye = parse_key(chunk_key(bbox, 0))
+    cx, cy = xe - xs, ye - ys
+    group = (name, bbox_arg, bbox.max_mip, cx, cy, xs % cx, ys % cy,
+             json.dumps(params, sort_keys=True))
+    keys = groups.setdefault(group, [])
+    keys.append(chunk_key(bbox, 0))
+    if len(keys) == chunks_per_task:
+      batched.append(ChunkBatchTask(name, params, bbox_arg, bbox.max_mip,
+                                    encode_bitmap(keys)))
+      del groups[group]
+  for (name, bbox_arg, max_mip, *_, params), keys in groups.items():
+    batched.append(ChunkBatchTask(name, json.loads(params), bbox_arg, max_mip,
+                                  encode_bitmap(keys)))
+  return batched
+
+class ChunkBatchTask(RegisteredTask):
+  """Run a task on many chunks from a single message
+
+  The arguments shared by the chunks are sent once, & the chunks as a
+  bitmap of MIP0 grid cells (see progress.encode_bitmap). Each chunk runs
+  as its own task. Chunks that fail are sent again as a new batch, up to
+  MAX_ATTEMPTS times, so that the chunks that succeeded aren't repeated.
+  """
+  MAX_ATTEMPTS = 3
+
+  def __init__(self, task, params, bbox_arg, max_mip, chunks, attempt=0):
+    super().__init__(task, params, bbox_arg, max_mip, chunks, attempt)
+
+  def execute(self, aligner):
+    cls = globals()[self.task]
+    keys = sorted(decode_bitmap(self.chunks))
+    print("\nChunk batch of {} {}s\n".format(len(keys), self.task), flush=True)
+    start = time()
+    failed = []
+    for key in keys:
+      xs, xe, ys, ye = parse_key(key)
+      bbox = BoundingBox(xs, xe, ys, ye, mip=0, max_mip=self.max_mip)
+      params = dict(self.params)
+      params[self.bbox_arg] = bbox.serialize()
+      try:
+        cls(**params).execute(aligner)
+      except Exception as e:
+        print('{} failed for chunk {}: {}'.format(self.task, key, e), flush=True)
+        failed.append(key)
+    if failed:
+      # a local run has no queue to retry from, so its failures are raised
+      if not aligner.distributed or self.attempt + 1 >= self.MAX_ATTEMPTS:
+        raise RuntimeError('{} failed for {} of {} chunks after {} attempts: '
+                           '{}'.format(self.task, len(failed), len(keys),
+                                       self.attempt + 1, failed))
+      aligner.task_queue.insert(ChunkBatchTask(self.task, self.params,
+                                               self.bbox_arg, self.max_mip,
+                                               encode_bitmap(failed),
+                                               self.attempt + 1))
+      print('Requeued {} failed chunks'.format(len(failed)), flush=True)
+    print(':{:.3f} s for {} chunks'.format(time() - start, len(keys)))
 
 class PredictImageTask(RegisteredTask):
   def __init__(self, model_path, src_cv, dst_cv, z, mip, bbox):
@@ -104,7 +218,11 @@ class CopyTask(RegisteredTask):
                             src_z, dst_z, mip), flush=True)
     start = time()
     if not aligner.dry_run:
-      if is_field:
+      if (mask_cv is None and not to_uint8 and
+          aligner.can_copy_chunks(src_cv, dst_cv, patch_bbox, mip, is_field)):
+        n = aligner.copy_chunks(src_cv, dst_cv, src_z, dst_z, patch_bbox, mip)
+        print('Copied {} chunk files'.format(n))
+      elif is_field:
         field =  aligner.get_field(src_cv, src_z, patch_bbox, mip, relative=False,
                                 to_tensor=False)
         aligner.save_field(field, dst_cv, dst_z, patch_bbox, mip, relative=False)
@@ -118,6 +236,8 @@ class CopyTask(RegisteredTask):
         image = aligner.get_data(src_cv, src_z, patch_bbox, mip, mip, to_float=False,
                                  to_tensor=False, normalizer=None)
         aligner.save_image(image, dst_cv, dst_z, patch_bbox, mip, to_uint8=False)
+      if aligner.record_progress:
+        record_chunk('CopyTask', dst_cv.path, dst_z, patch_bbox, mip)
       end = time()
       diff = end - start
       print(':{:.3f} s'.format(diff))
@@ -172,13 +292,36 @@ class ComputeFieldTask(RegisteredTask):
                            src_z, tgt_z, mip), flush=True)
     start = time()
     if not aligner.dry_run:
-      field = aligner.compute_field_chunk(model_path, src_cv, tgt_cv, src_z, tgt_z, 
+      fingerprint = None
+      # read the previous field once, for both the fingerprint & the model
+      profile = aligner.prev_field_profile(patch_bbox, mip, pad, prev_field_cv,
+                                           prev_field_z, prev_field_inverse)
+      if aligner.result_cache is not None:
+        regions = aligner.compute_field_regions(src_cv, tgt_cv, src_z, tgt_z,
                                           patch_bbox, mip, pad, 
-                                          src_mask_cv, src_mask_mip, src_mask_val,
-                                          tgt_mask_cv, tgt_mask_mip, tgt_mask_val,
-                                          None, prev_field_cv, prev_field_z, 
-                                          prev_field_inverse)
-      aligner.save_field(field, field_cv, src_z, patch_bbox, mip, relative=False)
+                                          src_mask_cv, src_mask_mip,
+                                          tgt_mask_cv, tgt_mask_mip,
+                                          prev_field_cv, prev_field_z, 
+                                          prev_field_inverse, profile)
+        fingerprint = aligner.result_cache.fingerprint('ComputeFieldTask', regions,
+                                          models=[model_path],
+                                          params=[mip, pad, src_mask_val, tgt_mask_val,
+                                                  prev_field_inverse])
+      if fingerprint and aligner.result_cache.satisfy(fingerprint, field_cv, src_z,
+                                                      patch_bbox, mip):
+        print('ComputeFieldTask: satisfied by result cache')
+      else:
+        field = aligner.compute_field_chunk(model_path, src_cv, tgt_cv, src_z, tgt_z, 
+                                            patch_bbox, mip, pad, 
+                                            src_mask_cv, src_mask_mip, src_mask_val,
+                                            tgt_mask_cv, tgt_mask_mip, tgt_mask_val,
+                                            None, prev_field_cv, prev_field_z, 
+                                            prev_field_inverse, profile)
+        aligner.save_field(field, field_cv, src_z, patch_bbox, mip, relative=False)
+        if fingerprint:
+          aligner.result_cache.record(fingerprint, field_cv, src_z, patch_bbox, mip)
+      if aligner.record_progress:
+        record_chunk('ComputeFieldTask', field_cv.path, src_z, patch_bbox, mip)
       end = time()
       diff = end - start
       print('ComputeFieldTask: {:.3f} s'.format(diff))
@@ -225,6 +368,8 @@ class RenderTask(RegisteredTask):
                                      use_cpu=self.use_cpu)
       image = image.cpu().numpy()
       aligner.save_image(image, dst_cv, dst_z, patch_bbox, src_mip)
+      if aligner.record_progress:
+        record_chunk('RenderTask', dst_cv.path, dst_z, patch_bbox, src_mip)
       end = time()
       diff = end - start
       print('RenderTask: {:.3f} s'.format(diff))
@@ -259,11 +404,25 @@ class VectorVoteTask(RegisteredTask):
                                    blur_sigma), flush=True)
     start = time()
     if not aligner.dry_run:
-      field = aligner.vector_vote_chunk(pairwise_cvs, vvote_cv, z, patch_bbox, mip, 
-                                        inverse=inverse, serial=serial, 
-                                        softmin_temp=softmin_temp, blur_sigma=blur_sigma)
-      field = field.data.cpu().numpy()
-      aligner.save_field(field, vvote_cv, z, patch_bbox, mip, relative=False)
+      fingerprint = None
+      # non-serial vector voting reads composed fields at displaced locations
+      if aligner.result_cache is not None and serial:
+        regions = [(f_cv, z, patch_bbox, mip) for f_cv in pairwise_cvs.values()]
+        fingerprint = aligner.result_cache.fingerprint('VectorVoteTask', regions,
+                                          params=[sorted(pairwise_cvs.keys()), mip,
+                                                  inverse, softmin_temp, blur_sigma])
+      if fingerprint and aligner.result_cache.satisfy(fingerprint, vvote_cv, z,
+                                                      patch_bbox, mip):
+        print('VectorVoteTask: satisfied by result cache')
+      else:
+        field = aligner.vector_vote_chunk(pairwise_cvs, vvote_cv, z, patch_bbox, mip, 
+                                          inverse=inverse, serial=serial, 
+                                          softmin_temp=softmin_temp, blur_sigma=blur_sigma)
+        aligner.save_field(field, vvote_cv, z, patch_bbox, mip, relative=False)
+        if fingerprint:
+          aligner.result_cache.record(fingerprint, vvote_cv, z, patch_bbox, mip)
+      if aligner.record_progress:
+        record_chunk('VectorVoteTask', vvote_cv.path, z, patch_bbox, mip)
       end = time()
       diff = end - start
       print('VectorVoteTask: {:.3f} s'.format(diff))
@@ -305,8 +464,9 @@ class CloudComposeTask(RegisteredTask):
       h = aligner.cloudsample_compose(f_cv, g_cv, f_z, g_z, patch_bbox, f_mip,
                                      g_mip, dst_mip, factor=factor,
                                      affine=affine, pad=pad)
-      h = h.data.cpu().numpy()
       aligner.save_field(h, dst_cv, dst_z, patch_bbox, dst_mip, relative=False)
+      if aligner.record_progress:
+        record_chunk('CloudComposeTask', dst_cv.path, dst_z, patch_bbox, dst_mip)
       end = time()
       diff = end - start
       print('ComposeTask: {:.3f} s'.format(diff))
@@ -342,14 +502,40 @@ class CloudMultiComposeTask(RegisteredTask):
             h = aligner.cloudsample_multi_compose(cv_list, z_list, patch_bbox,
                                                   mip_list, dst_mip, factors,
                                                   pad)
-            h = h.data.cpu().numpy()
             aligner.save_field(h, dst_cv, dst_z, patch_bbox, dst_mip,
                                relative=False)
+            if aligner.record_progress:
+              record_chunk('CloudMultiComposeTask', dst_cv.path, dst_z,
+                           patch_bbox, dst_mip)
             end = time()
             diff = end - start
             print('MultiComposeTask: {:.3f} s'.format(diff))
 
 
+class ShardTask(RegisteredTask):
+  def __init__(self, src_cv, dst_cv, mip, shard_number):
+    super().__init__(src_cv, dst_cv, mip, shard_number)
+
+  def execute(self, aligner):
+    src_cv = DCV(self.src_cv)
+    dst_cv = DCV(self.dst_cv)
+    mip = self.mip
+    shard_number = self.shard_number
+
+    print("\nShard\n"
+          "src {}\n"
+          "dst {}\n"
+          "shard {}\n"
+          "MIP{}\n".format(src_cv, dst_cv, shard_number, mip), flush=True)
+    start = time()
+    if not aligner.dry_run:
+      from shards import pack_shard
+      n = pack_shard(src_cv[mip], dst_cv[mip], shard_number)
+      end = time()
+      diff = end - start
+      print('ShardTask: {} chunks, {:.3f} s'.format(n, diff))
+
+
 class CPCTask(RegisteredTask):
   def __init__(self, src_cv, tgt_cv, dst_cv, src_z, tgt_z, patch_bbox, 
                     src_mip, dst_mip, norm):
@@ -590,9 +776,10 @@ class FilterThreeOpTask(RegisteredTask):
     print("\n Mask conjunction \n" )
     start = time()
     res = aligner.filterthree_op_chunk(patch_bbox, mask_cv, z, mip)
-    aligner.append_image(res, dst_cv, dst_z, patch_bbox, mip, to_uint8=True)
-    aligner.append_image(res, dst_cv, dst_z+1, patch_bbox, mip, to_uint8=True)
-    aligner.append_image(res, dst_cv, dst_z+2, patch_bbox, mip, to_uint8=True)
+    # each section receives the result of the tasks of 3 consecutive z
+    for k in range(3):
+      aligner.append_image(res, dst_cv, dst_z+k, patch_bbox, mip, to_uint8=True,
+                           expected=3)
     end = time()
     diff = end - start
     print('Task: {:.3f} s'.format(diff))
@@ -637,6 +824,7 @@ class FcorrMaskTask(RegisteredTask):
     aligner.save_image(cjn.numpy(), dst_pre, dst_z, patch_bbox, mip, to_uint8=False)
     mask = (cjn > threshold).numpy()
     if dilate_radius > 0: 
+      from scipy import ndimage
       s = np.ones((dilate_radius, dilate_radius), dtype=bool)
       mask = ndimage.binary_dilation(mask[0,0,...], structure=s).astype(mask.dtype)
       mask = mask[np.newaxis, np.newaxis, ...]
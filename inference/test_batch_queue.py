@@ -0,0 +1,92 @@
+import unittest
+from threading import Lock
+from batch_queue import LocalQueue, SQSBatchQueue, poll_batches
+
+class RecordTask():
+  def __init__(self, name, fail=False):
+    self.name = name
+    self.fail = fail
+
+  def execute(self, log):
+    if self.fail:
+      raise ValueError(self.name)
+    with log['lock']:
+      log['names'].append(self.name)
+
+def run(queue, log, **kwargs):
+  return poll_batches(queue, [log], stop_fn=lambda: len(queue) == 0, **kwargs)
+
+class FakeSQS():
+  """SQS client whose batch deletes fail once for the entries in flaky"""
+  def __init__(self, flaky):
+    self.flaky = set(flaky)
+    self.calls = []
+
+  def delete_message_batch(self, QueueUrl, Entries):
+    self.calls.append([e['ReceiptHandle'] for e in Entries])
+    failed = [{'Id': e['Id'], 'Code': 'InternalError'} for e in Entries
+              if e['ReceiptHandle'] in self.flaky]
+    self.flaky -= set(e['ReceiptHandle'] for e in Entries)
+    return {'Failed': failed} if failed else {}
+
+class TestSQSBatchQueue(unittest.TestCase):
+
+  def test_delete_retries_failed(self):
+    queue = SQSBatchQueue.__new__(SQSBatchQueue)
+    queue.url = 'queue'
+    queue.sqs = FakeSQS(flaky=['h3'])
+    tasks = [RecordTask(i) for i in range(12)]
+    for i, t in enumerate(tasks):
+      t._id = 'h{}'.format(i)
+    queue.delete(tasks)
+    self.assertEqual(queue.sqs.calls,
+                     [['h{}'.format(i) for i in range(10)], ['h3'],
+                      ['h10', 'h11']])
+
+class TestPollBatches(unittest.TestCase):
+
+  def setUp(self):
+    self.log = {'lock': Lock(), 'names': []}
+
+  def test_batches(self):
+    queue = LocalQueue([RecordTask(i) for i in range(25)])
+    executed = run(queue, self.log, batch_size=10, threads_fn=lambda t: 4)
+    self.assertEqual(executed, 25)
+    self.assertEqual(sorted(self.log['names']), list(range(25)))
+    self.assertEqual(queue.leases, 3)
+    self.assertEqual(queue.deletes, 3)
+
+  def test_failure_keeps_task(self):
+    failing = RecordTask('bad', fail=True)
+    queue = LocalQueue([RecordTask('a'), failing, RecordTask('b'),
+                        RecordTask('c')])
+    executed = poll_batches(queue, [self.log], batch_size=2,
+                            stop_fn=lambda: queue.leases == 2)
+    self.assertEqual(executed, 3)
+    self.assertEqual(sorted(self.log['names']), ['a', 'b', 'c'])
+    self.assertEqual(list(queue.visible_at), [failing])
+
+  def test_failed_flush_keeps_tasks(self):
+    queue = LocalQueue([RecordTask('a')])
+    def flush():
+      raise IOError('upload')
+    executed = poll_batches(queue, [self.log], flush_fn=flush,
+                            stop_fn=lambda: queue.leases == 1)
+    self.assertEqual(executed, 0)
+    self.assertEqual(len(queue), 1)
+
+  def test_flush_before_delete(self):
+    queue = LocalQueue([RecordTask(i) for i in range(3)])
+    flushed = []
+    run(queue, self.log, flush_fn=lambda: flushed.append(queue.deletes))
+    self.assertEqual(flushed, [0])
+    self.assertEqual(queue.deletes, 1)
+
+  def test_lease_hides_tasks(self):
+    queue = LocalQueue([RecordTask(i) for i in range(3)])
+    self.assertEqual(len(queue.lease(2, 60)), 2)
+    self.assertEqual(len(queue.lease(10, 60)), 1)
+    self.assertEqual(queue.lease(10, 60), [])
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,50 @@
+import os
+import tempfile
+import unittest
+from block_plan import BlockPlan, IncrementalPlan
+
+HEADER = 'x_start,y_start,z_start,x_stop,y_stop,z_stop,mip,model,tgt_radius,skip\n'
+
+def write_lookup(rows):
+  f = tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False)
+  f.write(HEADER)
+  for z_start, z_stop, model in rows:
+    f.write('0,0,{},1024,1024,{},0,{},3,0\n'.format(z_start, z_stop, model))
+  f.close()
+  return f.name
+
+class TestIncrementalPlan(unittest.TestCase):
+
+  def plan(self, rows):
+    path = write_lookup(rows)
+    self.addCleanup(os.remove, path)
+    return BlockPlan(path, 0, 30, 10, max_mip=9)
+
+  def test_unchanged(self):
+    old = self.plan([(0, 31, 'a')])
+    new = self.plan([(0, 31, 'a')])
+    inc = IncrementalPlan(old, new)
+    self.assertEqual(inc.block_z, set())
+    self.assertEqual(inc.stitch_blocks, set())
+
+  def test_block_section(self):
+    old = self.plan([(0, 31, 'a')])
+    new = self.plan([(0, 15, 'a'), (15, 17, 'b'), (17, 31, 'a')])
+    inc = IncrementalPlan(old, new)
+    self.assertEqual(inc.changed, {15, 16})
+    self.assertEqual(inc.full_blocks, set())
+    self.assertEqual(inc.block_z, set(range(15, 21)))
+    # block 2 is stitched to sections 18-20 of block 1
+    self.assertEqual(inc.stitch_blocks, {2})
+
+  def test_starter_section(self):
+    old = self.plan([(0, 31, 'a')])
+    new = self.plan([(0, 18, 'a'), (18, 19, 'b'), (19, 31, 'a')])
+    inc = IncrementalPlan(old, new)
+    self.assertEqual(inc.full_blocks, {2})
+    self.assertEqual(inc.block_z, set(range(18, 31)))
+    self.assertEqual(inc.starter_range([8, 9, 18, 19]), [18, 19])
+    self.assertEqual(inc.copy_range([0, 10, 20]), [20])
+
+if __name__ == '__main__':
+  unittest.main()
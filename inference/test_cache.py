@@ -0,0 +1,35 @@
+import unittest
+from cache import LRUCache
+
+class TestLRUCache(unittest.TestCase):
+
+  def test_evicts_least_recent(self):
+    cache = LRUCache(2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)
+    self.assertEqual(cache.keys(), ['a', 'c'])
+    self.assertEqual(cache.stats()['evictions'], 1)
+
+  def test_pinned(self):
+    cache = LRUCache(1)
+    cache.put('a', 1)
+    cache.pin('a')
+    cache.put('b', 2)
+    cache.put('c', 3)
+    self.assertEqual(cache.keys(), ['a', 'c'])
+    cache.unpin('a')
+    self.assertEqual(cache.keys(), ['c'])
+
+  def test_keeps_oversized_entry(self):
+    cache = LRUCache(10, sizeof=len)
+    cache.put('small', 'x' * 4)
+    cache.put('model', 'x' * 50)
+    self.assertEqual(cache.keys(), ['model'])
+    self.assertEqual(cache.get('model'), 'x' * 50)
+    cache.put('next', 'x' * 4)
+    self.assertEqual(cache.keys(), ['next'])
+
+if __name__ == '__main__':
+  unittest.main()
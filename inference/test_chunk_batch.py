@@ -0,0 +1,73 @@
+import unittest
+from taskqueue import RegisteredTask
+import tasks
+from boundingbox import BoundingBox, deserialize_bbox
+from progress import chunk_key, decode_bitmap
+from tasks import ChunkBatchTask, batch_tasks
+
+class FlakyTask(RegisteredTask):
+  """Chunk task that fails for the chunks in aligner.bad"""
+  def __init__(self, bbox, z):
+    super().__init__(bbox, z)
+
+  def execute(self, aligner):
+    key = chunk_key(deserialize_bbox(self.bbox), 0)
+    if key in aligner.bad:
+      raise ValueError(key)
+    aligner.ran.append(key)
+
+# ChunkBatchTask looks up task classes by name in tasks
+tasks.FlakyTask = FlakyTask
+
+class FakeQueue():
+  def __init__(self):
+    self.inserted = []
+
+  def insert(self, task):
+    self.inserted.append(task)
+
+class FakeAligner():
+  def __init__(self, distributed, bad=()):
+    self.distributed = distributed
+    self.task_queue = FakeQueue()
+    self.bad = set(bad)
+    self.ran = []
+
+def chunk_tasks(n, z=0):
+  return [FlakyTask(BoundingBox(x, x+1024, 0, 1024, mip=0, max_mip=9).serialize(), z)
+          for x in range(0, n*1024, 1024)]
+
+class TestChunkBatchTask(unittest.TestCase):
+
+  def test_batch_tasks(self):
+    batched = batch_tasks(chunk_tasks(6) + chunk_tasks(1, z=1), 4)
+    self.assertEqual([len(decode_bitmap(t.chunks)) for t in batched], [4, 2, 1])
+    self.assertEqual([t.params['z'] for t in batched], [0, 0, 1])
+    self.assertEqual(len(batch_tasks(chunk_tasks(6), 1)), 6)
+
+  def test_runs_every_chunk(self):
+    aligner = FakeAligner(distributed=False)
+    batch_tasks(chunk_tasks(3), 3)[0].execute(aligner)
+    self.assertEqual(len(aligner.ran), 3)
+
+  def test_local_failure_raises(self):
+    aligner = FakeAligner(distributed=False, bad=['1024-2048_0-1024'])
+    with self.assertRaises(RuntimeError):
+      batch_tasks(chunk_tasks(3), 3)[0].execute(aligner)
+    self.assertEqual(len(aligner.ran), 2)
+
+  def test_requeue_then_raise(self):
+    aligner = FakeAligner(distributed=True, bad=['1024-2048_0-1024'])
+    task = batch_tasks(chunk_tasks(3), 3)[0]
+    for attempt in range(1, ChunkBatchTask.MAX_ATTEMPTS):
+      task.execute(aligner)
+      task = aligner.task_queue.inserted[-1]
+      self.assertEqual(task.attempt, attempt)
+      self.assertEqual(decode_bitmap(task.chunks), {'1024-2048_0-1024'})
+    with self.assertRaises(RuntimeError):
+      task.execute(aligner)
+    self.assertEqual(len(aligner.task_queue.inserted),
+                     ChunkBatchTask.MAX_ATTEMPTS - 1)
+
+if __name__ == '__main__':
+  unittest.main()
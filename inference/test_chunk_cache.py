@@ -0,0 +1,39 @@
+import os
+import shutil
+import tempfile
+import unittest
+from chunk_cache import SharedChunkCache
+
+class TestSharedChunkCache(unittest.TestCase):
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.dir)
+    self.cache = SharedChunkCache(self.dir, max_bytes=1000)
+
+  def test_shared_between_instances(self):
+    self.assertIsNone(self.cache.get('gs://b/img/0-64_0-64_0-1', 'a'))
+    self.cache.put('gs://b/img/0-64_0-64_0-1', 'a', b'chunk')
+    other = SharedChunkCache(self.dir, max_bytes=1000)
+    self.assertEqual(other.get('gs://b/img/0-64_0-64_0-1', 'a'), b'chunk')
+    self.assertEqual(self.cache.stats(), {'hits': 0, 'misses': 1})
+    self.assertEqual(other.stats(), {'hits': 1, 'misses': 0})
+
+  def test_rewritten_chunk_misses(self):
+    self.cache.put('gs://b/img/0-64_0-64_0-1', 'a', b'chunk')
+    self.assertIsNone(self.cache.get('gs://b/img/0-64_0-64_0-1', 'b'))
+    self.cache.put('gs://b/img/0-64_0-64_0-1', 'b', b'rewritten')
+    self.assertEqual(self.cache.get('gs://b/img/0-64_0-64_0-1', 'b'),
+                     b'rewritten')
+
+  def test_evicts_least_recently_used(self):
+    urls = ['gs://b/img/{}'.format(i) for i in range(12)]
+    for i, url in enumerate(urls):
+      self.cache.put(url, 'a', bytes(100))
+      os.utime(self.cache.entry(url, 'a'), (i, i))
+    self.cache.evict()
+    kept = [url for url in urls if os.path.exists(self.cache.entry(url, 'a'))]
+    self.assertEqual(kept, urls[2:])
+
+if __name__ == '__main__':
+  unittest.main()
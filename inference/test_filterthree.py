@@ -0,0 +1,44 @@
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from cloudvolume import CloudVolume
+from aligner import Aligner
+from boundingbox import BoundingBox
+from mipless_cloudvolume import MiplessCloudVolume
+from tasks import FilterThreeOpTask, run
+
+class TestFilterThreeOp(unittest.TestCase):
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.dir)
+    self.aligner = Aligner(device='cpu', write_buffer_mb=16)
+    self.bbox = BoundingBox(0, 128, 0, 64, mip=0, max_mip=4)
+
+  def volume(self, name):
+    info = CloudVolume.create_new_info(num_channels=1, layer_type='image',
+                                       data_type='uint8', encoding='raw',
+                                       resolution=[4, 4, 40],
+                                       voxel_offset=[0, 0, 0],
+                                       chunk_size=[64, 64, 1],
+                                       volume_size=[128, 64, 6])
+    return MiplessCloudVolume('file://{}/{}'.format(self.dir, name),
+                              mkdir=True, info=info, fill_missing=True)
+
+  def test_edge_sections_written(self):
+    mask = self.volume('mask')
+    dst = self.volume('dst')
+    mask[0][0:128, 0:64, 0:5] = np.ones((128, 64, 5, 1), dtype=np.uint8)
+    # sections 0, 1, 3 & 4 receive fewer than the 3 expected results, so
+    # they are only written when the buffer is flushed
+    tasks = [FilterThreeOpTask(self.bbox, mask.path, dst.path, z, z, 0)
+             for z in range(3)]
+    run(self.aligner, tasks)
+    written = dst[0][0:128, 0:64, 0:6]
+    self.assertTrue((written[..., 0:5, :] == 255).all())
+    self.assertTrue((written[..., 5, :] == 0).all())
+    self.assertEqual(self.aligner.write_buffer.stats()['chunks'], 0)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,53 @@
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from cloudvolume import CloudVolume
+from local_volume import LocalVolume, is_local_raw
+
+class TestLocalVolume(unittest.TestCase):
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.dir)
+    info = CloudVolume.create_new_info(num_channels=1, layer_type='image',
+                                       data_type='uint8', encoding='raw',
+                                       resolution=[4, 4, 40],
+                                       voxel_offset=[0, 0, 0],
+                                       chunk_size=[64, 64, 1],
+                                       volume_size=[128, 128, 2])
+    self.cv = CloudVolume('file://{}/img'.format(self.dir), info=info,
+                          fill_missing=True)
+    self.cv.commit_info()
+    self.vol = LocalVolume(self.cv)
+    self.data = np.random.randint(0, 256, (128, 128, 1, 1), dtype=np.uint8)
+
+  def test_is_local_raw(self):
+    self.assertTrue(is_local_raw(self.cv))
+
+  def test_reads_gzipped_chunks(self):
+    self.cv[0:128, 0:128, 0:1] = self.data
+    np.testing.assert_array_equal(self.vol[10:100, 20:90, 0:1],
+                                  self.data[10:100, 20:90])
+
+  def test_write_then_map(self):
+    self.vol[0:128, 0:128, 1:2] = self.data
+    view = self.vol[64:100, 0:64, 1:2]
+    self.assertIsInstance(view, np.memmap)
+    self.assertFalse(view.flags.writeable)
+    np.testing.assert_array_equal(view, self.data[64:100, 0:64])
+    np.testing.assert_array_equal(self.vol[30:90, 30:90, 1:2],
+                                  self.data[30:90, 30:90])
+    np.testing.assert_array_equal(self.cv[0:128, 0:128, 1:2], self.data)
+
+  def test_missing_chunks(self):
+    self.vol[0:64, 0:64, 0:1] = self.data[:64, :64]
+    img = self.vol[32:96, 32:96, 0:1]
+    np.testing.assert_array_equal(img[:32, :32], self.data[32:64, 32:64])
+    self.assertFalse(img[32:].any())
+    self.cv.fill_missing = False
+    with self.assertRaises(ValueError):
+      self.vol[32:96, 32:96, 0:1]
+
+if __name__ == '__main__':
+  unittest.main()
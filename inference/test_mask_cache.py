@@ -0,0 +1,50 @@
+import unittest
+import numpy as np
+from mask_cache import MaskCache
+
+class FakeVolume():
+  """Volume at a single MIP that counts its reads"""
+  def __init__(self, path, data):
+    self.path = path
+    self.data = data
+    self.reads = 0
+
+  def __getitem__(self, key):
+    # cv[mip] returns the volume itself
+    if not isinstance(key, tuple):
+      return self
+    self.reads += 1
+    x, y, z = key
+    return self.data[x, y, z:z+1]
+
+class TestMaskCache(unittest.TestCase):
+
+  def setUp(self):
+    data = np.arange(1024*1024*2, dtype=np.uint8).reshape(1024, 1024, 2, 1)
+    self.cv = FakeVolume('gs://bucket/mask', data)
+    self.cache = MaskCache(2**30, tile_size=512)
+
+  def test_window_matches_volume(self):
+    out = self.cache.get(self.cv, 1, (500, 700), (10, 20), 0)
+    np.testing.assert_array_equal(out, self.cv.data[500:700, 10:20, 1:2])
+
+  def test_hit(self):
+    self.cache.get(self.cv, 0, (0, 100), (0, 100), 0)
+    reads = self.cv.reads
+    self.cache.get(self.cv, 0, (200, 300), (200, 300), 0)
+    self.assertEqual(self.cv.reads, reads)
+
+  def test_invalidate(self):
+    self.cache.get(self.cv, 0, (0, 100), (0, 100), 0)
+    self.cache.get(self.cv, 1, (0, 100), (0, 100), 0)
+    self.cv.data[:, :, 0] = 7
+    self.cache.invalidate(self.cv.path, 0)
+    reads = self.cv.reads
+    out = self.cache.get(self.cv, 0, (0, 100), (0, 100), 0)
+    self.assertEqual(self.cv.reads, reads + 1)
+    self.assertTrue((out == 7).all())
+    self.cache.get(self.cv, 1, (0, 100), (0, 100), 0)
+    self.assertEqual(self.cv.reads, reads + 1)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, current_thread
+from pipeline import ComputeThread
+
+class TestComputeThread(unittest.TestCase):
+
+  def test_runs_on_one_thread(self):
+    compute = ComputeThread(maxsize=2)
+    threads = set()
+    def call(i):
+      threads.add(current_thread().name)
+      return i * i
+    with ThreadPoolExecutor(max_workers=8) as executor:
+      results = list(executor.map(lambda i: compute.run(lambda: call(i)),
+                                  range(20)))
+    self.assertEqual(results, [i * i for i in range(20)])
+    self.assertEqual(threads, {compute.thread.name})
+    self.assertEqual(compute.stats()['calls'], 20)
+
+  def test_exception_reaches_caller(self):
+    compute = ComputeThread()
+    def fail():
+      raise ValueError('model')
+    with self.assertRaises(ValueError):
+      compute.run(fail)
+    self.assertEqual(compute.run(lambda: 1), 1)
+
+  def test_reentrant(self):
+    compute = ComputeThread(maxsize=1)
+    def outer():
+      return compute.run(lambda: current_thread().name)
+    self.assertEqual(compute.run(outer), compute.thread.name)
+
+  def test_lock_held(self):
+    lock = Lock()
+    compute = ComputeThread(lock=lock)
+    self.assertTrue(compute.run(lock.locked))
+    self.assertFalse(lock.locked())
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+import torch
+import torch.nn as nn
+from precision import PrecisionGuard
+
+class PairModel(nn.Module):
+  """Conv over a src & tgt pair that records the dtypes it ran at"""
+  def __init__(self):
+    super().__init__()
+    self.conv = nn.Conv2d(2, 2, 3, padding=1)
+    self.dtypes = []
+
+  def forward(self, src, tgt):
+    y = self.conv(torch.cat([src, tgt], dim=1))
+    self.dtypes.append(y.dtype)
+    return y
+
+def max_error(reference, reduced):
+  return (reference - reduced).abs().max()
+
+def samples(n=2):
+  return [(torch.rand(1, 1, 16, 16), torch.rand(1, 1, 16, 16))
+          for _ in range(n)]
+
+class TestPrecisionGuard(unittest.TestCase):
+
+  def setUp(self):
+    self.device = torch.device('cpu')
+    self.src, self.tgt = samples(1)[0]
+
+  def test_validated_on_samples(self):
+    guard = PrecisionGuard('bf16', self.device, max_error=1., samples=samples())
+    model = PairModel()
+    out = guard.run('m', model, self.src, self.tgt, max_error)
+    # each sample runs at both precisions, then the chunk runs at bf16 only
+    self.assertEqual(model.dtypes, [torch.float32, torch.bfloat16] * 2 +
+                                   [torch.bfloat16])
+    self.assertEqual(out.dtype, torch.float32)
+    guard.run('m', model, self.src, self.tgt, max_error)
+    self.assertEqual(len(model.dtypes), 6)
+    self.assertTrue(guard.stats()['m']['enabled'])
+
+  def test_disabled_on_error(self):
+    guard = PrecisionGuard('bf16', self.device, max_error=0., samples=samples())
+    model = PairModel()
+    out = guard.run('m', model, self.src, self.tgt, lambda a, b: 1.)
+    self.assertFalse(guard.stats()['m']['enabled'])
+    self.assertEqual(model.dtypes[-1], torch.float32)
+    self.assertTrue(torch.equal(out, model.forward(self.src, self.tgt)))
+
+  def test_int8(self):
+    guard = PrecisionGuard('int8', self.device, max_error=1., samples=samples())
+    model = PairModel()
+    out = guard.run('m', model, self.src, self.tgt, max_error)
+    self.assertTrue(guard.stats()['m']['enabled'])
+    self.assertEqual(out.dtype, torch.float32)
+    # the float32 model only ran for the samples
+    self.assertEqual(model.dtypes, [torch.float32] * 2)
+    self.assertLess(float(max_error(out, model(self.src, self.tgt))), 1.)
+
+  def test_needs_samples(self):
+    with self.assertRaises(ValueError):
+      PrecisionGuard('fp16', self.device, max_error=0.5)
+
+  def test_float32(self):
+    guard = PrecisionGuard('float32', self.device, max_error=0.)
+    model = PairModel()
+    guard.run('m', model, self.src, self.tgt, max_error)
+    self.assertEqual(model.dtypes, [torch.float32])
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,52 @@
+import shutil
+import tempfile
+import unittest
+from progress import encode_bitmap, decode_bitmap, record_chunk, \
+                     finished_chunks, unfinished_chunks
+
+class FakeBox():
+  def __init__(self, x_range, y_range):
+    self.ranges = (x_range, y_range)
+
+  def x_range(self, mip):
+    return self.ranges[0]
+
+  def y_range(self, mip):
+    return self.ranges[1]
+
+def grid(n, size=1024):
+  return [FakeBox((x, x+size), (y, y+size))
+          for x in range(0, n*size, size) for y in range(0, n*size, size)]
+
+class TestProgress(unittest.TestCase):
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.dir)
+    self.path = 'file://{}/dst'.format(self.dir)
+
+  def test_bitmap_round_trip(self):
+    keys = {'2048-3072_0-1024', '0-1024_5120-6144', '1024-2048_1024-2048'}
+    self.assertEqual(decode_bitmap(encode_bitmap(keys)), keys)
+
+  def test_unfinished_chunks(self):
+    chunks = grid(3)
+    for bbox in chunks[:4]:
+      record_chunk('RenderTask', self.path, 5, bbox, 0)
+    self.assertEqual(unfinished_chunks('RenderTask', self.path, 5, chunks, 0),
+                     chunks[4:])
+    self.assertEqual(unfinished_chunks('RenderTask', self.path, 6, chunks, 0),
+                     chunks)
+    self.assertEqual(unfinished_chunks('CopyTask', self.path, 5, chunks, 0),
+                     chunks)
+
+  def test_markers_compacted(self):
+    chunks = grid(2)
+    record_chunk('RenderTask', self.path, 0, chunks[0], 0)
+    finished_chunks('RenderTask', self.path, 0, 0)
+    record_chunk('RenderTask', self.path, 0, chunks[1], 0)
+    self.assertEqual(unfinished_chunks('RenderTask', self.path, 0, chunks, 0),
+                     chunks[2:])
+
+if __name__ == '__main__':
+  unittest.main()
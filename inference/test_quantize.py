@@ -0,0 +1,129 @@
+import io
+import shutil
+import tempfile
+import threading
+import unittest
+from contextlib import redirect_stdout
+import numpy as np
+import torch
+from cloudvolume import CloudVolume
+from aligner import Aligner
+from boundingbox import BoundingBox
+from mipless_cloudvolume import MiplessCloudVolume
+from quantize import quantize_field, INT16_MAX
+
+def random_field(shape=(1, 64, 64, 2), scale=100):
+  return (np.random.randn(*shape) * scale).astype(np.float32)
+
+class TestQuantizeField(unittest.TestCase):
+
+  def test_quarter_px_steps(self):
+    field = np.array([1.3, -1.3, 0.26, 0.24, 2.75, -0.1],
+                     dtype=np.float32).reshape(1, 1, 3, 2)
+    q, clipped = quantize_field(field)
+    self.assertEqual(q.dtype, np.int16)
+    self.assertEqual(q.shape, (1, 3, 1, 2))
+    # truncated toward zero, as np.int16(field * 4) did
+    np.testing.assert_array_equal(q.ravel(), [5, -5, 1, 0, 11, 0])
+    self.assertEqual(clipped, 0)
+
+  def test_clipped(self):
+    field = np.zeros((1, 4, 4, 2), dtype=np.float32)
+    field[0, 0, 0] = [10000, 0]
+    field[0, 1, 2] = [-10000, -10000]
+    field[0, 3, 3] = [0, INT16_MAX / 4]
+    q, clipped = quantize_field(field)
+    self.assertEqual(clipped, 2)
+    self.assertEqual(tuple(q[0, 0, 0]), (INT16_MAX, 0))
+    self.assertEqual(tuple(q[1, 2, 0]), (-2**15, -2**15))
+    self.assertEqual(tuple(q[3, 3, 0]), (0, INT16_MAX))
+
+  def test_slabs_and_out(self):
+    field = random_field((2, 100, 30, 2), scale=3000)
+    q, clipped = quantize_field(field, rows=7)
+    out = np.empty((100, 30, 2, 2), dtype=np.int16, order='F')
+    q2, clipped2 = quantize_field(field, out=out)
+    self.assertIs(q2, out)
+    np.testing.assert_array_equal(q, q2)
+    self.assertEqual(clipped, clipped2)
+    expected = np.clip(field * 4, -2**15, INT16_MAX).astype(np.int16)
+    np.testing.assert_array_equal(q, np.transpose(expected, (1, 2, 0, 3)))
+
+  def test_tensor_matches_ndarray(self):
+    field = random_field(scale=5000)
+    q, clipped = quantize_field(field)
+    qt, clippedt = quantize_field(torch.from_numpy(field))
+    np.testing.assert_array_equal(q, qt)
+    self.assertEqual(clipped, clippedt)
+    self.assertGreater(clipped, 0)
+    out = np.empty((64, 64, 1, 2), dtype=np.int16, order='F')
+    qo, _ = quantize_field(torch.from_numpy(field), out=out)
+    self.assertIs(qo, out)
+    np.testing.assert_array_equal(q, qo)
+
+class TestSaveField(unittest.TestCase):
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.dir)
+    # save_field & get_field only need the caches, buffers & tolerance of an
+    # Aligner
+    self.aligner = Aligner.__new__(Aligner)
+    self.aligner.mask_cache = None
+    self.aligner.field_tolerance = 0
+    self.aligner.field_buffers = threading.local()
+    self.bbox = BoundingBox(0, 64, 0, 64, mip=0, max_mip=4)
+
+  def volume(self, name, data_type, encoding, quantization=None):
+    info = CloudVolume.create_new_info(num_channels=2, layer_type='image',
+                                       data_type=data_type, encoding=encoding,
+                                       resolution=[4, 4, 40],
+                                       voxel_offset=[0, 0, 0],
+                                       chunk_size=[64, 64, 1],
+                                       volume_size=[64, 64, 2])
+    if quantization:
+      info['field_quantization'] = quantization
+    return MiplessCloudVolume('file://{}/{}'.format(self.dir, name), mkdir=True,
+                              info=info, fill_missing=True)
+
+  def round_trip(self, cv, field):
+    out = io.StringIO()
+    with redirect_stdout(out):
+      self.aligner.save_field(field, cv, 1, self.bbox, 0, relative=False,
+                              pyramid=False)
+      saved = self.aligner.get_field(cv, 1, self.bbox, 0, to_tensor=False)
+    return saved, out.getvalue()
+
+  def test_int16(self):
+    field = random_field()
+    field[0, 0, 0] = [9000, -9000]
+    saved, log = self.round_trip(self.volume('int16', 'int16', 'raw'), field)
+    expected = np.clip(np.trunc(field * 4), -2**15, INT16_MAX) / 4
+    np.testing.assert_array_equal(saved, expected)
+    self.assertIn('1 vectors in field are out of range of int16', log)
+
+  def test_int16_tensor(self):
+    field = random_field()
+    saved, _ = self.round_trip(self.volume('int16', 'int16', 'raw'),
+                               torch.from_numpy(field))
+    np.testing.assert_array_equal(saved, np.trunc(field * 4) / 4)
+
+  def test_fpzip(self):
+    field = random_field(scale=30000)
+    saved, log = self.round_trip(self.volume('fpzip', 'float32', 'fpzip'), field)
+    np.testing.assert_array_equal(saved, field)
+    self.assertNotIn('out of range', log)
+
+  def test_fpzip_quantized(self):
+    field = random_field()
+    saved, _ = self.round_trip(self.volume('q', 'float32', 'fpzip', 0.25), field)
+    np.testing.assert_array_equal(saved, np.round(field * 4) / 4)
+
+  def test_kempressed(self):
+    field = random_field(scale=30000)
+    cv = self.volume('kempressed', 'float32', 'kempressed')
+    saved, _ = self.round_trip(cv, field)
+    np.testing.assert_allclose(saved, field, rtol=1e-5, atol=1e-3)
+
+if __name__ == '__main__':
+  unittest.main()
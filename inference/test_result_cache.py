@@ -0,0 +1,86 @@
+import shutil
+import tempfile
+import unittest
+from cloudvolume import Storage
+from result_cache import ResultCache
+
+class FakeBox():
+  def __init__(self, x_range, y_range):
+    self.ranges = (x_range, y_range)
+
+  def x_range(self, mip):
+    return self.ranges[0]
+
+  def y_range(self, mip):
+    return self.ranges[1]
+
+class FakeVolume():
+  """Volume with one chunk per 64px, stored as files under path"""
+  encoding = 'raw'
+  info = {'data_type': 'int16', 'num_channels': 2}
+
+  def __init__(self, path):
+    self.path = path
+
+  def __getitem__(self, mip):
+    return self
+
+  def chunk_names(self, mip, x_range, y_range, z_range):
+    return ['{}/{}-{}_{}-{}_{}-{}'.format(mip, x, x+64, y, y+64, *z_range)
+            for x in range(x_range[0], x_range[1], 64)
+            for y in range(y_range[0], y_range[1], 64)]
+
+  def write(self, bbox, z, content):
+    with Storage(self.path) as stor:
+      for name in self.chunk_names(0, bbox.x_range(0), bbox.y_range(0), (z, z+1)):
+        stor.put_file(name, content)
+
+class TestResultCache(unittest.TestCase):
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.dir)
+    self.src = FakeVolume('file://{}/src'.format(self.dir))
+    self.dst = FakeVolume('file://{}/dst'.format(self.dir))
+    self.cache = ResultCache('file://{}/manifest'.format(self.dir))
+    self.bbox = FakeBox((0, 128), (0, 64))
+    self.src.write(self.bbox, 0, b'input')
+
+  def fingerprint(self):
+    return self.cache.fingerprint('Task', [(self.src, 0, self.bbox, 0)],
+                                  params=[1])
+
+  def test_miss(self):
+    self.assertFalse(self.cache.satisfy(self.fingerprint(), self.dst, 0,
+                                        self.bbox, 0))
+
+  def test_hit(self):
+    f = self.fingerprint()
+    self.dst.write(self.bbox, 0, b'output')
+    self.cache.record(f, self.dst, 0, self.bbox, 0)
+    self.assertEqual(self.fingerprint(), f)
+    self.assertTrue(self.cache.satisfy(f, self.dst, 0, self.bbox, 0))
+
+  def test_changed_input(self):
+    f = self.fingerprint()
+    self.src.write(self.bbox, 0, b'new input')
+    self.assertNotEqual(self.fingerprint(), f)
+
+  def test_stale_output(self):
+    f = self.fingerprint()
+    self.dst.write(self.bbox, 0, b'output')
+    self.cache.record(f, self.dst, 0, self.bbox, 0)
+    self.dst.write(self.bbox, 0, b'overwritten by another run')
+    self.assertFalse(self.cache.satisfy(f, self.dst, 0, self.bbox, 0))
+
+  def test_copy_to_new_section(self):
+    f = self.fingerprint()
+    self.dst.write(self.bbox, 0, b'output')
+    self.cache.record(f, self.dst, 0, self.bbox, 0)
+    self.assertTrue(self.cache.satisfy(f, self.dst, 1, self.bbox, 0))
+    with Storage(self.dst.path) as stor:
+      names = self.dst.chunk_names(0, (0, 128), (0, 64), (1, 2))
+      self.assertEqual([stor.get_file(n) for n in names], [b'output'] * 2)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+import torch
+from cache import LRUCache
+from shared_models import SharedArchive, SHARED_ARCHIVES, shared_archive
+
+class FakeArchive():
+  def __init__(self):
+    self.model = torch.nn.Sequential(torch.nn.Conv2d(2, 2, 3),
+                                     torch.nn.Dropout())
+    self.preprocessor = None
+
+class TestSharedArchive(unittest.TestCase):
+
+  def setUp(self):
+    self.addCleanup(SHARED_ARCHIVES.clear)
+
+  def test_shared_for_inference(self):
+    archive = SharedArchive(FakeArchive())
+    self.assertFalse(archive.model.training)
+    for p in archive.model.parameters():
+      self.assertTrue(p.is_shared())
+      self.assertFalse(p.requires_grad)
+
+  def test_lookup(self):
+    self.assertIsNone(shared_archive('m', torch.device('cpu')))
+    SHARED_ARCHIVES['m'] = SharedArchive(FakeArchive())
+    archive = shared_archive('m', torch.device('cpu'))
+    self.assertIs(archive, SHARED_ARCHIVES['m'])
+    x = torch.rand((1, 2, 8, 8))
+    self.assertTrue(torch.equal(archive.model(x), archive.model(x)))
+
+  @unittest.skipUnless(torch.cuda.is_available(), 'needs a CUDA device')
+  def test_device_copy_freed_on_eviction(self):
+    SHARED_ARCHIVES['m'] = SharedArchive(FakeArchive())
+    cache = LRUCache(1)
+    before = torch.cuda.memory_allocated()
+    cache.put('m', shared_archive('m', torch.device('cuda')))
+    self.assertGreater(torch.cuda.memory_allocated(), before)
+    for p in SHARED_ARCHIVES['m'].model.parameters():
+      self.assertEqual(p.device.type, 'cpu')
+      self.assertTrue(p.is_shared())
+    cache.put('n', None)
+    self.assertNotIn('m', cache)
+    self.assertEqual(torch.cuda.memory_allocated(), before)
+
+if __name__ == '__main__':
+  unittest.main()
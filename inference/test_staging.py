@@ -0,0 +1,32 @@
+import unittest
+import numpy as np
+import torch
+from staging import PinnedStager
+
+@unittest.skipUnless(torch.cuda.is_available(), 'needs a CUDA device')
+class TestPinnedStager(unittest.TestCase):
+
+  def setUp(self):
+    self.stager = PinnedStager(torch.device('cuda'))
+
+  def test_upload_keeps_dtype(self):
+    img = np.random.randint(0, 256, (1, 1, 300, 200), dtype=np.uint8)
+    tensor = self.stager.upload(img)
+    self.assertEqual(tensor.dtype, torch.uint8)
+    self.assertTrue(tensor.is_cuda)
+    np.testing.assert_array_equal(tensor.cpu().numpy(), img)
+
+  def test_non_contiguous(self):
+    img = np.random.randint(0, 256, (200, 300), dtype=np.uint8).T
+    np.testing.assert_array_equal(self.stager.upload(img).cpu().numpy(), img)
+
+  def test_reuses_buffers(self):
+    for i in range(3):
+      img = np.full((64, 64), i, dtype=np.uint8)
+      tensor = self.stager.upload(img)
+      torch.cuda.synchronize()
+      self.assertTrue((tensor == i).all())
+    self.assertEqual(self.stager.stats(), {'allocations': 1, 'reuses': 2})
+
+if __name__ == '__main__':
+  unittest.main()
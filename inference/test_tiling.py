@@ -0,0 +1,37 @@
+import unittest
+import torch
+from tiling import tile_starts, tiled_field
+
+def shift_model(dx, dy):
+  """Model that predicts a constant shift of (dx, dy) px"""
+  def model(src, tgt):
+    h, w = src.shape[-2:]
+    field = torch.zeros((src.shape[0], h, w, 2))
+    field[..., 0] = dx / (w / 2)
+    field[..., 1] = dy / (h / 2)
+    return field
+  return model
+
+class TestTiledField(unittest.TestCase):
+
+  def test_tile_starts(self):
+    self.assertEqual(tile_starts(512, 512, 64), [0])
+    self.assertEqual(tile_starts(1000, 512, 64), [0, 448, 488])
+
+  def test_matches_whole_image(self):
+    model = shift_model(3., -5.)
+    src = torch.rand((1, 1, 1000, 768))
+    tgt = torch.rand((1, 1, 1000, 768))
+    expected = model(src, tgt)
+    field = tiled_field(model, src, tgt, 256, 64)
+    self.assertEqual(field.shape, expected.shape)
+    self.assertTrue(torch.allclose(field, expected, atol=1e-6))
+
+  def test_small_image(self):
+    model = shift_model(1., 1.)
+    src = torch.rand((1, 1, 128, 128))
+    field = tiled_field(model, src, src, 256, 64)
+    self.assertTrue(torch.equal(field, model(src, src)))
+
+if __name__ == '__main__':
+  unittest.main()
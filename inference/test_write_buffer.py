@@ -0,0 +1,83 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from cloudvolume.lib import Bbox
+from write_buffer import WriteBuffer
+
+class FakeVolume():
+  """Volume at a single MIP, with 64x64x1 chunks, that counts reads & writes"""
+  chunk_size = (64, 64, 1)
+  voxel_offset = (0, 0, 0)
+
+  def __init__(self, shape, dtype=np.float32):
+    self.data = np.zeros(shape + (1,), dtype=dtype)
+    self.dtype = self.data.dtype
+    self.bounds = Bbox((0, 0, 0), shape)
+    self.reads = 0
+    self.writes = 0
+
+  def __getitem__(self, key):
+    # cv[mip] returns the volume itself
+    if not isinstance(key, tuple):
+      return self
+    self.reads += 1
+    return self.data[key]
+
+  def __setitem__(self, key, value):
+    self.writes += 1
+    self.data[key] = value
+
+class TestWriteBuffer(unittest.TestCase):
+
+  def test_overlapping_writes_blended(self):
+    cv = FakeVolume((64, 64, 1))
+    buf = WriteBuffer(2**20, accumulate=False, normalize=True, expected=1)
+    a = np.full((40, 64, 1, 1), 2, dtype=np.float32)
+    b = np.full((40, 64, 1, 1), 6, dtype=np.float32)
+    buf.add(cv, 0, (0, 40), (0, 64), 0, a)
+    self.assertEqual(cv.writes, 0)
+    buf.add(cv, 0, (24, 64), (0, 64), 0, b)
+    self.assertEqual((cv.reads, cv.writes), (0, 1))
+    self.assertTrue((cv.data[:24] == 2).all())
+    self.assertTrue((cv.data[24:40] == 4).all())
+    self.assertTrue((cv.data[40:] == 6).all())
+
+  def test_expected_per_add(self):
+    cv = FakeVolume((128, 64, 3), dtype=np.uint8)
+    cv.data[...] = 1
+    buf = WriteBuffer(2**20)
+    patch = np.full((128, 64, 1, 1), 100, dtype=np.float32)
+    for i in range(2):
+      buf.add(cv, 1, (0, 128), (0, 64), 0, patch, expected=3)
+    self.assertEqual(cv.writes, 0)
+    buf.add(cv, 1, (0, 128), (0, 64), 0, patch, expected=3)
+    self.assertEqual(cv.writes, 2)
+    self.assertTrue((cv.data[..., 1, :] == 255).all())
+    self.assertTrue((cv.data[..., 0, :] == 1).all())
+
+  def test_memory_pressure(self):
+    cv = FakeVolume((128, 64, 1))
+    buf = WriteBuffer(2*64*64*4)
+    buf.add(cv, 0, (0, 128), (0, 64), 0, np.ones((128, 64, 1, 1)))
+    self.assertEqual(buf.stats()['chunks'], 1)
+    self.assertEqual(cv.writes, 1)
+    buf.flush()
+    self.assertEqual(cv.writes, 2)
+    self.assertTrue((cv.data == 1).all())
+
+  def test_threads(self):
+    cv = FakeVolume((128, 128, 1))
+    buf = WriteBuffer(2**30)
+    def add(i):
+      buf.add(cv, 0, (i, i + 64), (0, 128), 0, np.ones((64, 128, 1, 1)))
+    with ThreadPoolExecutor(max_workers=8) as executor:
+      list(executor.map(add, range(0, 64, 4)))
+    buf.flush()
+    self.assertEqual(cv.writes, 4)
+    counts = np.zeros(128)
+    for i in range(0, 64, 4):
+      counts[i:i+64] += 1
+    np.testing.assert_array_equal(cv.data[:, 0, 0, 0], counts)
+
+if __name__ == '__main__':
+  unittest.main()
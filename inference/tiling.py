@@ -0,0 +1,67 @@
+import torch
+
+def tile_starts(size, tile, overlap):
+  """Starts of tiles of width tile that cover [0, size) & overlap by at least
+  overlap, with the last tile flush with the end
+  """
+  if size <= tile:
+    return [0]
+  step = tile - overlap
+  starts = list(range(0, size - tile, step))
+  starts.append(size - tile)
+  return starts
+
+def blend_weights(start, tile, size, overlap, device):
+  """1D weights of a tile, ramping up & down across the overlaps with its
+  neighbors, & flat at the edges of the region
+  """
+  w = torch.ones(tile, device=device)
+  if overlap == 0:
+    return w
+  ramp = (torch.arange(overlap, device=device, dtype=torch.float) + 0.5) / overlap
+  if start > 0:
+    w[:overlap] = ramp
+  if start + tile < size:
+    w[-overlap:] = torch.min(w[-overlap:], ramp.flip(0))
+  return w
+
+def tiled_field(model, src, tgt, tile, overlap):
+  """Run a field model on overlapping tiles of a large pair of images
+
+  Tiles are blended with weights that fall off linearly across each overlap,
+  so the seams fall where neighboring tiles agree, away from the tile edges
+  where the model lacks context. Peak memory scales with tile² instead of
+  the size of the images.
+
+  Args:
+     model: callable of src & tgt (N,C,H,W) tensors that returns a field
+      (N,H,W,2) in relative coordinates of its input
+     src, tgt: (N,C,H,W) tensors
+     tile: int for the width & height of the tiles, which must suit the
+      downsampling of the model
+     overlap: int for the min overlap of neighboring tiles, less than tile
+
+  Returns:
+     field (N,H,W,2) in relative coordinates of the whole images
+  """
+  height, width = src.shape[-2:]
+  if height <= tile and width <= tile:
+    return model(src, tgt)
+  tile_y, tile_x = min(tile, height), min(tile, width)
+  field, total = None, None
+  for y in tile_starts(height, tile_y, overlap):
+    wy = blend_weights(y, tile_y, height, overlap, src.device)
+    for x in tile_starts(width, tile_x, overlap):
+      wx = blend_weights(x, tile_x, width, overlap, src.device)
+      f = model(src[..., y:y+tile_y, x:x+tile_x], tgt[..., y:y+tile_y, x:x+tile_x])
+      # relative to the tile -> relative to the whole images
+      scale = torch.tensor([tile_x / width, tile_y / height], device=f.device,
+                           dtype=f.dtype)
+      w = (wy[:, None] * wx[None, :])[None, :, :, None].to(f.dtype)
+      if field is None:
+        field = torch.zeros((f.shape[0], height, width, 2), device=f.device,
+                            dtype=f.dtype)
+        total = torch.zeros((1, height, width, 1), device=f.device, dtype=f.dtype)
+      field[:, y:y+tile_y, x:x+tile_x] += f * scale * w
+      total[:, y:y+tile_y, x:x+tile_x] += w
+  return field / total
@@ -1,13 +1,19 @@
 import atexit
+from functools import partial
 import os
+import random
 import signal
 import sys
 from multiprocessing import Event, Process, Semaphore
+from threading import Thread
 from time import sleep, time
 
-from taskqueue import TaskQueue
+from taskqueue import TaskQueue, QueueEmpty
 
 from args import get_aligner, get_argparser, parse_args
+from batch_queue import SQSBatchQueue, poll_batches
+import tasks
+from block_plan import lookup_models
 
 processes = {}
 
@@ -25,9 +31,80 @@ def run_aligner(args, stop_fn=None):
     return False
 
   aligner = get_aligner(args)
+  if args.pipeline_threads:
+    run_pipelined(aligner, args, stop_fn_with_parent_health_check)
+    return
+  # buffered writes must be flushed before their tasks are deleted, which
+  # TaskQueue.poll has no hook for
+  if args.lease_batch > 1 or aligner.write_buffer is not None:
+    queue = SQSBatchQueue(aligner.queue_name)
+    poll_batches(queue, [aligner], stop_fn=stop_fn_with_parent_health_check,
+                 lease_seconds=message_lease_seconds(args),
+                 batch_size=args.lease_batch,
+                 threads_fn=partial(tasks.task_threads, default=args.task_threads),
+                 flush_fn=aligner.flush_writes)
+    return
   with TaskQueue(queue_name=aligner.queue_name, queue_server='sqs', n_threads=0) as tq:
     tq.poll(execute_args=[aligner], stop_fn=stop_fn_with_parent_health_check, 
-            lease_seconds=args.lease_seconds)
+            lease_seconds=message_lease_seconds(args))
+
+def message_lease_seconds(args):
+  """Lease of a queue message, which may hold up to chunks_per_task chunks
+  """
+  return args.lease_seconds * args.chunks_per_task
+
+def poll_tasks(tq, aligner, stop_fn, lease_seconds, max_backoff=120):
+  """Lease & execute tasks until stop_fn returns True, like TaskQueue.poll
+
+  TaskQueue.poll installs a SIGINT handler, which only the main thread may
+  do, so threads poll with this loop instead. Output that a task buffered in
+  memory is written before the task is deleted. Task errors are raised.
+  """
+  empty = 0
+  while not stop_fn():
+    try:
+      task = tq.lease(seconds=int(lease_seconds))
+    except QueueEmpty:
+      empty += 1
+      sleep(random.uniform(0, min(2 ** empty, max_backoff)))
+      continue
+    empty = 0
+    tasks.execute(task, aligner)
+    aligner.flush_writes()
+    tq.delete(task)
+
+def run_pipelined(aligner, args, stop_fn):
+  """Poll & execute tasks from several threads that share one aligner
+
+  Each thread downloads, preprocesses, postprocesses & uploads for its own
+  task, while the device work of all of them runs on aligner.compute (see
+  tasks.execute), so the device stays busy with a single process.
+  """
+  errors = []
+  def stop_all():
+    return bool(errors) or stop_fn()
+
+  def poll():
+    try:
+      with TaskQueue(queue_name=aligner.queue_name, queue_server='sqs', 
+                     n_threads=0) as tq:
+        poll_tasks(tq, aligner, stop_all, message_lease_seconds(args))
+    except BaseException as e:
+      # stop the other threads, so that the parent restarts this process as it
+      # would if a single task had failed
+      errors.append(e)
+
+  print("Running {} tasks at a time in {}".format(args.pipeline_threads, 
+                                                  os.getpid()))
+  threads = [Thread(target=poll, daemon=True) 
+             for i in range(args.pipeline_threads)]
+  for t in threads:
+    t.start()
+  for t in threads:
+    t.join()
+  print(aligner.compute.stats())
+  if errors:
+    raise errors[0]
 
 def create_process(process_id, args):
   stop = Event()
@@ -93,6 +170,16 @@ if __name__ == '__main__':
     print("GPU will be shared by up to {} processes".format(gpu_process_count))
 
     aligner_args.gpu_lock = Semaphore(gpu_process_count)
+
+    # Load the models once, before forking, so that all workers (and the
+    # ones restarted below) share their weights instead of loading copies
+    shared = list(aligner_args.pin_models or [])
+    if aligner_args.preload_param_lookup:
+      shared += lookup_models(aligner_args.preload_param_lookup)
+    if shared:
+      from shared_models import share_models
+      share_models(shared, aligner_args.channels_last)
+
     for process_id in range(process_count):
       create_process(process_id, aligner_args)
 
@@ -0,0 +1,148 @@
+from collections import OrderedDict
+from threading import RLock
+
+import numpy as np
+from cloudvolume.lib import Bbox, Vec
+
+class WriteBuffer():
+  """Accumulate writes per destination chunk & write each chunk once
+
+  Patches of a section are split on the chunk grid of their CloudVolume &
+  combined per voxel with the chunk's earlier contributions, by weighted sum
+  or by max. A chunk is written when flushed: explicitly, once every voxel has
+  received `expected` weight, or when the buffer exceeds max_bytes (oldest
+  chunks first). Flushing reads the stored chunk only if it must be combined
+  with the contributions or they don't cover it, then writes the whole chunk,
+  so callers never need chunk aligned patches.
+
+  Contributions only reach storage when their chunk is flushed, so callers
+  must flush before they report their work as done. The buffer may be shared
+  by threads.
+
+  Args:
+     max_bytes: int for the memory budget of buffered chunks
+     mode: 'sum' to add contributions, or 'max' to keep their maximum
+     accumulate: bool to combine contributions with the stored data, as in
+       Aligner.append_image; otherwise they replace it where they cover it
+     normalize: bool to divide summed contributions by their total weight
+     expected: float for the weight at which a voxel is complete, or None to
+       only flush explicitly or on memory pressure
+  """
+  def __init__(self, max_bytes, mode='sum', accumulate=True, normalize=False,
+               expected=None):
+    assert(mode in ['sum', 'max'])
+    self.max_bytes = max_bytes
+    self.mode = mode
+    self.accumulate = accumulate
+    self.normalize = normalize
+    self.expected = expected
+    self.chunks = OrderedDict()
+    self.size = 0
+    self.writes = 0
+    self.contributions = 0
+    self.lock = RLock()
+
+  def chunk_bboxes(self, cv, bbox):
+    """Bboxes of the chunks of cv that overlap the x,y extent of bbox
+    """
+    bbox = Bbox.intersection(bbox, cv.bounds)
+    if bbox.subvoxel():
+      return []
+    chunk_size = Vec(*cv.chunk_size)
+    offset = Vec(*cv.voxel_offset)
+    lo = (bbox.minpt - offset) // chunk_size
+    hi = (bbox.maxpt - offset + chunk_size - 1) // chunk_size
+    chunks = []
+    for x in range(lo.x, hi.x):
+      for y in range(lo.y, hi.y):
+        minpt = offset + Vec(x, y, 0) * chunk_size
+        maxpt = Vec(*np.minimum(minpt + chunk_size, cv.bounds.maxpt))
+        chunks.append(Bbox((minpt.x, minpt.y, bbox.minpt.z),
+                           (maxpt.x, maxpt.y, bbox.maxpt.z)))
+    return chunks
+
+  def add(self, cv, z, x_range, y_range, mip, patch, weight=1, expected=None):
+    """Buffer a patch for a region of section z
+
+    Args:
+       cv: MiplessCloudVolume to write to
+       z: int for section index
+       x_range, y_range: tuples for the extent of patch at mip
+       mip: int for MIP level of patch
+       patch: ndarray in (x,y,1,c) order, as written to a CloudVolume
+       weight: float or ndarray broadcastable to patch, for the weight of
+         each voxel in a sum
+       expected: float for the weight at which the voxels of the chunks of
+         patch are complete, in place of the buffer's expected
+    """
+    vol = cv[mip]
+    bbox = Bbox((x_range[0], y_range[0], z), (x_range[1], y_range[1], z+1))
+    patch = np.asarray(patch)
+    weight = np.broadcast_to(np.asarray(weight, dtype=np.float32), patch.shape)
+    with self.lock:
+      self.contributions += 1
+      for chunk in self.chunk_bboxes(vol, bbox):
+        key = (str(cv), mip, z, tuple(chunk.minpt))
+        if key not in self.chunks:
+          shape = tuple(chunk.size3()) + (patch.shape[3],)
+          fill = 0 if self.mode == 'sum' else -np.inf
+          self.chunks[key] = {'cv': cv, 'mip': mip, 'bbox': chunk,
+                              'value': np.full(shape, fill, dtype=np.float32),
+                              'weight': np.zeros(shape, dtype=np.float32),
+                              'expected': self.expected}
+          self.size += 2*self.chunks[key]['value'].nbytes
+        entry = self.chunks[key]
+        if expected is not None:
+          entry['expected'] = expected
+        overlap = Bbox.intersection(chunk, bbox)
+        src = (overlap - bbox.minpt).to_slices()
+        dst = (overlap - chunk.minpt).to_slices()
+        if self.mode == 'sum':
+          entry['value'][dst] += weight[src] * patch[src]
+        else:
+          entry['value'][dst] = np.maximum(entry['value'][dst], patch[src])
+        entry['weight'][dst] += weight[src]
+        if (entry['expected'] is not None and
+            np.all(entry['weight'] >= entry['expected'])):
+          self.flush_chunk(key)
+      while self.size > self.max_bytes and len(self.chunks) > 0:
+        self.flush_chunk(next(iter(self.chunks)))
+
+  def flush_chunk(self, key):
+    with self.lock:
+      entry = self.chunks.pop(key)
+      self.size -= 2*entry['value'].nbytes
+      vol = entry['cv'][entry['mip']]
+      slices = entry['bbox'].to_slices()
+      value, weight = entry['value'], entry['weight']
+      covered = weight > 0
+      if self.normalize and self.mode == 'sum':
+        value = np.divide(value, weight, out=np.zeros_like(value), where=covered)
+      if self.accumulate or not np.all(covered):
+        out = np.array(vol[slices])
+      else:
+        out = np.zeros(value.shape, dtype=vol.dtype)
+      if self.accumulate:
+        if self.mode == 'sum':
+          combined = out + value
+        else:
+          combined = np.maximum(out, value)
+      else:
+        combined = value
+      if np.issubdtype(out.dtype, np.integer):
+        info = np.iinfo(out.dtype)
+        combined = np.clip(combined, info.min, info.max)
+      out[covered] = combined[covered].astype(out.dtype)
+      vol[slices] = out
+      self.writes += 1
+
+  def flush(self):
+    """Write every buffered chunk
+    """
+    with self.lock:
+      while len(self.chunks) > 0:
+        self.flush_chunk(next(iter(self.chunks)))
+
+  def stats(self):
+    return {'chunks': len(self.chunks), 'size': self.size,
+            'contributions': self.contributions, 'writes': self.writes}
@@ -9,13 +9,8 @@ import datetime
 from pathlib import Path
 import filecmp
 import importlib
-import pandas as pd
 
-from utilities.helpers import cp, dotdict
-
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt  # noqa: 402
+from utilities.helpers import cp, dotdict, pyplot
 
 
 class ModelArchive(object):
@@ -60,9 +55,14 @@ class ModelArchive(object):
         >>> new_model.save()  # save the updated state of the new model to disk
     """
 
-    def __init__(self, name, readonly=True, *args, **kwargs):
+    def __init__(self, name, readonly=True, *args, device='cuda',
+                 channels_last=False, **kwargs):
         name, directory = self._resolve_model(name)
         self._name = name
+        # device on which to run the model, and whether to store its 4D
+        # weights in channels_last memory format (faster on CPU)
+        self.device = torch.device(device)
+        self.channels_last = channels_last
         self.directory = directory
         self.readonly = readonly
         self.intermediate_models = self.directory / 'intermediate_models/'
@@ -389,11 +389,13 @@ class ModelArchive(object):
         if self.readonly:
             for p in self._model.parameters():
                 p.requires_grad = False
-            self._model.eval().cuda()
+            self._model.eval().to(self.device)
+            if self.channels_last:
+                self._model.to(memory_format=torch.channels_last)
         else:
             for p in self._model.parameters():
                 p.requires_grad = True
-            self._model.train().cuda()
+            self._model.train().to(self.device)
             self._model = torch.nn.DataParallel(self._model)
         return self._model
 
@@ -651,6 +653,7 @@ class ModelArchive(object):
         """
         Save a plot of the learning curves
         """
+        import pandas as pd
         data = pd.read_csv(self.paths['loss'], sep='\\s*,\\s*',
                            encoding='ascii', engine='python',
                            comment='#')[list(columns)]
@@ -667,7 +670,7 @@ class ModelArchive(object):
         data = data.rolling(window=average_over).mean()
         data.plot(title='Training loss for {}'.format(self._name))
         with self.paths['plot'].open('wb') as f:
-            plt.savefig(f)
+            pyplot().savefig(f)
 
 
 def git_root():
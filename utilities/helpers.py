@@ -4,7 +4,6 @@ import shutil
 import warnings
 import math
 from pathlib import Path
-from moviepy.editor import ImageSequenceClip
 import numpy as np
 import collections
 import numbers
@@ -17,16 +16,20 @@ from torch.nn.functional import interpolate
 from torch.nn import AvgPool2d, LPPool2d
 from torch.nn.functional import softmax
 from itertools import combinations
-from skimage.transform import rescale
-from skimage.morphology import disk as skdisk
-from skimage.filters.rank import maximum as skmaximum 
 from functools import reduce
 from copy import deepcopy
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt  # noqa: 402
-plt.switch_backend('agg')
-import matplotlib.cm as cm  # noqa: 402
+
+
+def pyplot():
+    """
+    matplotlib.pyplot with the Agg backend, imported on first use so that
+    inference workers that never plot don't pay for it at startup
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt  # noqa: 402
+    plt.switch_backend('agg')
+    return plt
 
 
 def compose_functions(fseq):
@@ -115,6 +118,7 @@ def dv(vfield, name=None, downsample=0.5):
     off_angles = angles + np.pi/4
     off_angles[off_angles > np.pi] -= np.pi
 
+    from matplotlib import cm
     scolors = get_colors(angles, f=lambda x: np.sin(x) ** 1.4, c=cm.viridis)
     ccolors = get_colors(off_angles, f=lambda x: np.sin(x) ** 1.4, c=cm.magma)
 
@@ -127,7 +131,7 @@ def dv(vfield, name=None, downsample=0.5):
     img = np_upsample(scolors, downsample) if downsample is not None else scolors
 
     if name is not None:
-        plt.imsave(name + '.png', img)
+        pyplot().imsave(name + '.png', img)
     else:
         return img
 
@@ -137,6 +141,7 @@ def np_upsample(img, factor):
         return img
 
     if img.ndim == 2:
+        from skimage.transform import rescale
         return rescale(img, factor)
     elif img.ndim == 3:
         b = np.empty((int(img.shape[0] * factor),
@@ -191,6 +196,7 @@ def dvl(V_pred, name, mag=100):
     V_pred = V_pred * mag
     if isinstance(V_pred, torch.Tensor):
         V_pred = V_pred.cpu().numpy()
+    plt = pyplot()
     plt.figure(figsize=(6, 6))
     X, Y = np.meshgrid(np.arange(-1, 1, 2.0/V_pred.shape[-2]),
                        np.arange(-1, 1, 2.0/V_pred.shape[-2]))
@@ -245,7 +251,7 @@ def save_chunk(chunk, name, norm=True):
         chunk[:10, :10] = 1
         chunk[-50:, -50:] = 1
         chunk[-10:, -10:] = 0
-    plt.imsave(name + '.png', 1 - chunk, cmap='Greys')
+    pyplot().imsave(name + '.png', 1 - chunk, cmap='Greys')
 
 
 def gif(filename, array, fps=2, scale=1.0, norm=False):
@@ -283,6 +289,7 @@ def gif(filename, array, fps=2, scale=1.0, norm=False):
         array[:, -10:, -10:] = 0
 
     # make the moviepy clip
+    from moviepy.editor import ImageSequenceClip
     clip = ImageSequenceClip(list(array), fps=fps).resize(scale)
     clip.write_gif(filename, fps=fps, verbose=False)
     return clip
@@ -485,7 +492,8 @@ def identity_grid(size, cache=False, device=None):
     else:
         batch_dim = 1
     if device is None:
-        device = torch.cuda.current_device()
+        device = (torch.cuda.current_device() if torch.cuda.is_available()
+                  else 'cpu')
     if size in identity_grid._identities:
         Id = identity_grid._identities[size].copy()
     else:
@@ -700,6 +708,8 @@ def retry_enumerate(iterable, start=0, max_time=3600):
 
 
 def dilate_mask(mask, radius=5):
+  from skimage.morphology import disk as skdisk
+  from skimage.filters.rank import maximum as skmaximum
   return skmaximum(np.squeeze(mask).astype(np.uint8), skdisk(radius)).reshape(mask.shape).astype(np.bool)
 
 